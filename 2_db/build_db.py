@@ -1,60 +1,70 @@
 # 2_db/build_db.py
 # Build the DuckDB database from raw data in 1_data/
-# Run: python 2_db/build_db.py  (from project root)
-#  or: make db
+# Run: python 2_db/build_db.py          (from project root, incremental)
+#      python 2_db/build_db.py --full   (rebuild everything from scratch)
+#      python 2_db/build_db.py -j 8     (stage at most 8 raw imports at once)
+#      python 2_db/build_db.py --memory-limit 8GB   (cap DuckDB memory)
+#      python 2_db/build_db.py --profile   (time every statement, see status.py --timings)
+#      python 2_db/build_db.py --export    (also write Hive-partitioned Parquet to 2_db/parquet/)
+#  or: make db  /  make db FULL=1  /  make db J=8  /  make db MEM=8GB  /  make db PROFILE=1
+#      python 2_db/build_db.py --rollback  (restore the DB replaced by the last build)
+#      make db EXPORT=1  /  make db ROLLBACK=1
+#      make db SAMPLE=1%   (build 2_db/project_sample.duckdb from a 1% sample)
+#
+# Every table is declared with the raw files and upstream tables it reads,
+# in any order. On an incremental run, only tables whose inputs (file
+# contents, SQL, or upstream tables) changed since the last build are rebuilt.
+# Tables without upstream tables are imported in parallel; the rest run as
+# soon as the tables they read are ready. The build writes to a copy of the
+# database, checks it and renames it into place, so readers of project.duckdb
+# are never interrupted and a failed build changes nothing.
 
-import duckdb
-import pandas as pd
+import sys
 from pathlib import Path
 
-DB_PATH = Path(__file__).parent / "project.duckdb"
-DATA_DIR = Path(__file__).parent.parent / "1_data"
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from pipeline.build import Build, DATA_DIR
 
-# Remove old DB if it exists (clean rebuild)
-DB_PATH.unlink(missing_ok=True)
+build = Build()
 
-con = duckdb.connect(str(DB_PATH))
+# ── Import raw data ─────────────────────────────────────────────
+# Example: import a file documented in 1_data/sources.yaml. DuckDB reads it
+# natively (CSV, Parquet, JSON, XLSX) using the entry's `format` and
+# `encoding`, streaming to disk without loading it into memory.
+# build.source("my_table", "my_data.csv")
+# build.source("sales", "mystery_data.xlsx", sheet="Q4")   # extra reader options
+#
+# For formats DuckDB cannot read, load with pandas instead
+# (`sources` are paths relative to 1_data/). Import pandas inside the
+# function, so builds that do not rebuild this table skip the import:
+# def read_spss(con):
+#     import pandas as pd
+#     return pd.read_spss(DATA_DIR / "my_data.sav")
+#
+# build.table("my_table", sources=["my_data.sav"], fn=read_spss)
+#
+# Sample mode (make db SAMPLE=1%) keeps a deterministic sample of each raw
+# table. Keep small lookup tables whole, sample related tables on a shared
+# key so joins stay complete, or stratify so every group keeps rows:
+# build.source("countries", "countries.csv", sample=False)
+# build.source("orders", "orders.csv", sample_key="customer_id")
+# build.source("survey", "survey.csv", sample_by=["region"])
 
-try:
-    # ── Import raw data ─────────────────────────────────────────────
-    # Example: import a CSV
-    # df = pd.read_csv(DATA_DIR / "my_data.csv")
-    # con.sql("CREATE TABLE my_table AS SELECT * FROM df")
+# ── Transformations ─────────────────────────────────────────────
+# Example: clean, normalize, compute derived columns.
+# Upstream tables named in the SQL (here `my_table`) are detected automatically.
+# build.table("clean_data", sql="""
+#     SELECT
+#         TRIM(name) AS name,
+#         LOWER(category) AS category,
+#         value::DOUBLE AS value
+#     FROM my_table
+#     WHERE value IS NOT NULL
+# """)
+#
+# partition_by= sets the Hive partition columns of the table's Parquet export
+# (make db EXPORT=1), e.g. 2_db/parquet/sales/year=2024/data_0.parquet:
+# build.table("sales_clean", sql="SELECT ... FROM sales", partition_by=["year"])
 
-    # ── Transformations ─────────────────────────────────────────────
-    # Example: clean, normalize, compute derived columns
-    # con.sql("""
-    #     CREATE TABLE clean_data AS
-    #     SELECT
-    #         TRIM(name) AS name,
-    #         LOWER(category) AS category,
-    #         value::DOUBLE AS value
-    #     FROM my_table
-    #     WHERE value IS NOT NULL
-    # """)
-
-    # ── Generate schema.md ──────────────────────────────────────────
-    schema_lines = ["# Database Schema\n"]
-    schema_lines.append("_Auto-generated by `build_db.py`. Do not edit manually._\n")
-    schema_lines.append("_Run `make db` to rebuild the database and regenerate this file._\n")
-
-    tables = con.sql("SHOW TABLES").df()
-    for table_name in tables["name"]:
-        cols = con.sql(f"DESCRIBE {table_name}").df()
-        n_rows = con.sql(f"SELECT COUNT(*) AS n FROM {table_name}").df()["n"][0]
-        schema_lines.append(f"\n## `{table_name}` ({n_rows:,} rows)\n")
-        schema_lines.append("| Column | Type | Nullable |")
-        schema_lines.append("|--------|------|----------|")
-        for _, row in cols.iterrows():
-            nullable = "YES" if row.get("null", "YES") == "YES" else "NO"
-            schema_lines.append(f"| `{row['column_name']}` | {row['column_type']} | {nullable} |")
-        schema_lines.append("")
-
-    schema_path = Path(__file__).parent / "schema.md"
-    schema_path.write_text("\n".join(schema_lines))
-
-finally:
-    con.close()
-
-print(f"✓ Database built: {DB_PATH}")
-print(f"✓ Schema written: {schema_path}")
+# ── Build (and regenerate schema.md) ────────────────────────────
+build.run()
@@ -0,0 +1,351 @@
+# 3_analyses/run_analyses.py
+# Run every analysis (3_analyses/*/run.py) across a pool of worker processes.
+# Run: python 3_analyses/run_analyses.py [-j N] [--force] [--only NAME] [--isolated] [--profile]
+#      (from project root)
+#  or: make analyses  /  make analyses J=8 FORCE=1 ONLY=my_analysis
+#
+# Each worker imports pandas, DuckDB and matplotlib once and keeps a read-only
+# connection to project.duckdb open; scripts then run in-process. Analyses
+# written with pipeline/analysis_kit.py query through that connection, and a
+# script's own duckdb.connect(..., read_only=True) reuses the open database,
+# instead of paying Python startup, imports and DB open for every analysis.
+#
+# An analysis that reads another analysis's output declares it in its run.py:
+#   # depends_on: other_analysis, another_one
+# and only starts once those have succeeded.
+#
+# Analyses are skipped when nothing that produced their results.json changed:
+# the hash of run.py, of its query, the build fingerprints of the tables they
+# read (from the manifest in project.duckdb), the results of the analyses they
+# depend on, the shared views they read, and results.json itself (see
+# pipeline/analyses.py). The cache lives in .pipeline_state/analyses.json; the
+# reason for every re-run is printed.
+#
+# Shared views (3_analyses/_views/*.sql) are materialized by the first
+# analysis that reads them and reused by the others (see pipeline/views.py).
+# The stored copies of views no longer declared are deleted at startup.
+#
+# In sample mode (make analyses SAMPLE=1%) analyses read project_sample.duckdb
+# and run.py runs in the _sample/ subfolder of its analysis, so results.json,
+# its sidecar and the figures land there, marked as sampled, and the
+# full-data outputs are left as they were.
+#
+# With --profile (make analyses PROFILE=1), the time each analysis takes and
+# its memory are appended to .pipeline_state/timings.jsonl (see
+# pipeline/profiling.py): how much it raised the worker's peak RSS
+# (rss_growth_mb, 0 when it stayed under the peak of an earlier analysis of
+# the same worker) and that worker-lifetime peak (worker_peak_rss_mb). Analyses written with pipeline/analysis_kit.py add
+# the time spent in their query, figures and writes, and slow queries keep
+# their DuckDB profile.
+
+import argparse
+import io
+import os
+import runpy
+import subprocess
+import sys
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import redirect_stderr, redirect_stdout
+from pathlib import Path
+
+ANALYSES_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(ANALYSES_DIR.parent))
+from pipeline import analysis_kit, profiling  # noqa: E402
+from pipeline.analyses import CACHE_FILE, cache_record, discover, stale_reason  # noqa: E402
+from pipeline.lineage import db_fingerprints  # noqa: E402
+from pipeline.results import mark_sampled  # noqa: E402
+from pipeline.state import DB_PATH, SAMPLE, output_dir, read_state, write_state  # noqa: E402
+from pipeline.views import prune as prune_views  # noqa: E402
+
+_worker_con = None  # per-process read-only connection, kept open for reuse
+
+
+def _init_worker(isolated):
+    """Warm a worker: import the heavy libraries once, open the DB read-only."""
+    global _worker_con
+    if isolated:
+        return
+    import pandas  # noqa: F401
+
+    analysis_kit.pyplot()
+    # Workers already run in parallel: draw figures serially rather than fork
+    # this process while its DuckDB connection's threads are running
+    os.environ[analysis_kit.FIGURE_JOBS_ENV] = "1"
+    if DB_PATH.exists():
+        # Shared with Analysis.run(); plain scripts' duckdb.connect(...,
+        # read_only=True) reuses the database instance it keeps open
+        _worker_con = analysis_kit.connection(DB_PATH)
+
+
+def _in_folder(module, folder):
+    """Whether `module` was loaded from a file inside `folder`."""
+    file = getattr(module, "__file__", None)
+    return bool(file) and Path(file).resolve().is_relative_to(folder)
+
+
+def _run_in_process(folder):
+    """Execute run.py inside this worker. Returns (exit code, stdout, stderr).
+
+    Modules local to the analysis folder (helpers.py, utils/, ...) are
+    imported afresh and evicted afterwards, so an analysis never receives a
+    same-named module of another folder from an earlier run in this worker.
+    The script runs in output_dir(folder), where it writes its outputs.
+    """
+    out, err = io.StringIO(), io.StringIO()
+    cwd, path = os.getcwd(), list(sys.path)
+    folder = Path(folder).resolve()
+    local = {p.stem for p in folder.glob("*.py")} | {
+        p.name for p in folder.iterdir() if (p / "__init__.py").is_file()
+    }
+    # Same-named modules already loaded (e.g. the worker's own) are set
+    # aside while the script runs, then restored
+    shadowed = {
+        name: module for name, module in sys.modules.items()
+        if name.split(".")[0] in local and not _in_folder(module, folder)
+    }
+    for name in shadowed:
+        del sys.modules[name]
+    loaded = set(sys.modules)
+    code = 0
+    workdir = output_dir(folder)
+    workdir.mkdir(exist_ok=True)
+    os.chdir(workdir)
+    sys.path.insert(0, str(folder))
+    try:
+        with redirect_stdout(out), redirect_stderr(err):
+            try:
+                runpy.run_path(str(folder / "run.py"), run_name="__main__")
+            except SystemExit as e:
+                if isinstance(e.code, int) or e.code is None:
+                    code = e.code or 0
+                else:
+                    print(e.code, file=sys.stderr)
+                    code = 1
+            except Exception:
+                traceback.print_exc()
+                code = 1
+    finally:
+        os.chdir(cwd)
+        sys.path[:] = path
+        for name in set(sys.modules) - loaded:
+            if name.split(".")[0] in local or _in_folder(sys.modules[name], folder):
+                del sys.modules[name]
+        sys.modules.update(shadowed)
+        if "matplotlib.pyplot" in sys.modules:
+            sys.modules["matplotlib.pyplot"].close("all")
+    return code, out.getvalue(), err.getvalue()
+
+
+def _run_subprocess(folder):
+    """Execute run.py in a fresh interpreter, in output_dir(folder).
+    Returns (exit code, stdout, stderr)."""
+    workdir = output_dir(folder)
+    workdir.mkdir(exist_ok=True)
+    proc = subprocess.run(
+        [sys.executable, str(Path(folder) / "run.py")], cwd=workdir,
+        capture_output=True, text=True,
+    )
+    return proc.returncode, proc.stdout, proc.stderr
+
+
+def run_analysis(name, isolated=False, analyses_dir=ANALYSES_DIR):
+    """Run one analysis and return a result dict (name, code, seconds, stdout, stderr)."""
+    start = time.perf_counter()
+    folder = analyses_dir / name
+    runner = _run_subprocess if isolated else _run_in_process
+    profiling.ANALYSIS_CLOCK.clear()
+    peak_before = profiling.peak_rss_mb()
+    code, stdout, stderr = runner(folder)
+    result = {
+        "name": name,
+        "code": code,
+        "seconds": time.perf_counter() - start,
+        "stdout": stdout,
+        "stderr": stderr,
+    }
+    if profiling.enabled() and not isolated:
+        # ru_maxrss only grows over the worker's lifetime: report what this
+        # analysis added to it next to the lifetime value
+        peak = profiling.peak_rss_mb()
+        result["profile"] = dict(profiling.ANALYSIS_CLOCK)
+        if peak is not None:
+            result["profile"].update(rss_growth_mb=round(peak - peak_before, 1), worker_peak_rss_mb=peak)
+    return result
+
+
+def _indent(text, prefix="    "):
+    return "\n".join(prefix + line for line in text.rstrip().splitlines())
+
+
+def run_all(analyses, jobs, isolated=False, force=False, only=None):
+    """Run stale analyses respecting their dependencies.
+
+    Args:
+        analyses: {name: [dependencies]} as returned by discover()
+        jobs: number of worker processes
+        isolated: run each run.py in a fresh interpreter
+        force: ignore the cache and run everything selected
+        only: names to consider (default: all); other analyses are left as is
+
+    Returns a list of result dicts (code None = skipped, "cached" = up to date).
+    """
+    for name, deps in analyses.items():
+        unknown = [d for d in deps if d not in analyses]
+        if unknown:
+            raise SystemExit(f"✗ {name}: depends_on unknown analysis: {', '.join(unknown)}")
+
+    fingerprints = db_fingerprints(DB_PATH)
+    cache = read_state(CACHE_FILE, {})
+    results, ok, failed = [], set(), set()
+    remaining = dict(analyses)
+    if only:
+        unknown = sorted(set(only) - set(analyses))
+        if unknown:
+            raise SystemExit(f"✗ Unknown analysis: {', '.join(unknown)}")
+        ok = set(analyses) - set(only)
+        remaining = {n: d for n, d in analyses.items() if n in only}
+    reasons = {}
+    # Figures drawn by analysis_kit in isolated workers share the CPUs with
+    # the other workers (warm workers draw serially, see _init_worker)
+    os.environ.setdefault(analysis_kit.FIGURE_JOBS_ENV, str(max(1, (os.cpu_count() or 1) // jobs)))
+    with ProcessPoolExecutor(
+        max_workers=jobs, initializer=_init_worker, initargs=(isolated,)
+    ) as pool:
+        running = {}
+        while remaining or running:
+            # Until a pass changes nothing: an analysis found up to date or
+            # skipped can unblock one checked earlier in the same pass
+            changed = True
+            while changed:
+                changed = False
+                for name, deps in list(remaining.items()):
+                    blocked = [d for d in deps if d in failed]  # failed or skipped
+                    if blocked:
+                        del remaining[name]
+                        failed.add(name)
+                        results.append({
+                            "name": name, "code": None, "seconds": 0.0, "stdout": "",
+                            "stderr": f"skipped: dependency failed ({', '.join(blocked)})",
+                        })
+                        print(f"- {name}: skipped (dependency failed: {', '.join(blocked)})")
+                        changed = True
+                    elif all(d in ok for d in deps):
+                        del remaining[name]
+                        reason = "forced" if force else stale_reason(name, fingerprints, cache)
+                        if reason is None:
+                            ok.add(name)
+                            results.append({
+                                "name": name, "code": 0, "seconds": 0.0, "stdout": "",
+                                "stderr": "", "cached": True,
+                            })
+                            print(f"· {name}: up to date")
+                            changed = True
+                            continue
+                        reasons[name] = reason
+                        running[pool.submit(run_analysis, name, isolated)] = name
+                        changed = True
+            if not running:
+                if remaining:
+                    raise SystemExit(
+                        f"✗ Dependency cycle between: {', '.join(sorted(remaining))}"
+                    )
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for f in finished:
+                name = running.pop(f)
+                result = f.result()
+                results.append(result)
+                profiling.record(
+                    "analyses", name, result["seconds"], code=result["code"],
+                    **{k: round(v, 4) for k, v in result.get("profile", {}).items()},
+                )
+                if result["code"] == 0:
+                    ok.add(name)
+                    print(f"✓ {name} ({result['seconds']:.2f}s) — {reasons[name]}")
+                    results_json = output_dir(ANALYSES_DIR / name) / "results.json"
+                    if results_json.exists():
+                        if SAMPLE:
+                            mark_sampled(results_json, SAMPLE)
+                        cache[name] = cache_record(name, fingerprints, cache)
+                        write_state(CACHE_FILE, cache)
+                else:
+                    failed.add(name)
+                    print(f"✗ {name} (exit {result['code']}, {result['seconds']:.2f}s)"
+                          f" — {reasons[name]}")
+                    cache.pop(name, None)
+                    write_state(CACHE_FILE, cache)
+                if result["stdout"].strip():
+                    print(_indent(result["stdout"]))
+                if result["code"] != 0 and result["stderr"].strip():
+                    print(_indent(result["stderr"]))
+    return results
+
+
+def print_summary(results, elapsed):
+    """Print a table of every analysis with its status and duration."""
+    width = max([len(r["name"]) for r in results] + [8])
+    print("\n" + "─" * (width + 24))
+    print(f"{'Analysis':<{width}}  {'Status':<8}  {'Time':>8}")
+    print("─" * (width + 24))
+    for r in sorted(results, key=lambda r: -r["seconds"]):
+        if r.get("cached"):
+            status = "cached"
+        elif r["code"] == 0:
+            status = "ok"
+        else:
+            status = "skipped" if r["code"] is None else f"exit {r['code']}"
+        print(f"{r['name']:<{width}}  {status:<8}  {r['seconds']:>7.2f}s")
+    print("─" * (width + 24))
+    n_ok = sum(r["code"] == 0 for r in results)
+    n_cached = sum(bool(r.get("cached")) for r in results)
+    print(f"{n_ok}/{len(results)} succeeded ({n_cached} up to date) in {elapsed:.2f}s "
+          f"wall time ({sum(r['seconds'] for r in results):.2f}s total)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run every analysis in 3_analyses/")
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=os.cpu_count() or 1,
+        help="number of worker processes (default: CPU count)",
+    )
+    parser.add_argument(
+        "--isolated", action="store_true",
+        help="run each run.py in its own Python process instead of in a warm worker",
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="re-run analyses even if they are up to date",
+    )
+    parser.add_argument(
+        "--only", action="append", metavar="NAME",
+        help="only consider this analysis (repeatable)",
+    )
+    parser.add_argument(
+        "--profile", action="store_true",
+        help="record query/figure/write time and peak RSS growth per analysis "
+             "in .pipeline_state/timings.jsonl",
+    )
+    args = parser.parse_args(argv)
+    if args.profile or profiling.enabled():
+        profiling.enable()
+
+    analyses = discover()
+    if not analyses:
+        print("No analyses found in 3_analyses/")
+        return 0
+
+    if SAMPLE:
+        print(f"▶ Sample mode: reading {DB_PATH.name}, writing results to <analysis>/_sample/")
+    prune_views()
+    start = time.perf_counter()
+    results = run_all(analyses, max(1, args.jobs), args.isolated, args.force, args.only)
+    elapsed = time.perf_counter() - start
+    profiling.record("analyses", "total", elapsed, analyses=len(results))
+    print_summary(results, elapsed)
+    return 0 if all(r["code"] == 0 for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,14 +9,72 @@
 #
 #   data = load_analysis("value_frequency")
 #   fig  = load_figure("value_frequency", "bar_chart.pdf")
+#   df   = load_table("value_frequency", columns=["category", "n"])
+#   top  = query("SELECT * FROM sales WHERE region = ? LIMIT 10", ["EU"])
+#
+# Parsed analyses are kept in an in-process LRU cache, so repeated calls
+# during one render only re-read a results.json when it changed on disk.
+#
+# In sample mode ($PIPELINE_SAMPLE, make outputs SAMPLE=1%) query() reads
+# project_sample.duckdb and analyses are loaded from their _sample/
+# subfolder. Outside it, results computed on a sample raise
+# SampledResultsError, so sampled numbers never reach a final deliverable.
+#
+# Every Quarto kernel imports this module, so importing it only loads the
+# standard library and pipeline.results/state: pandas, pyarrow and DuckDB are
+# imported by the functions that return DataFrames, tables or query results.
+#
+# Check the analyses a deliverable will load, without rendering it:
+#   python 4_output/helpers.py [NAME ...]      (default: every analysis)
 
 import json
+import os
+import re
+import sys
+import warnings
+from collections import OrderedDict
 from pathlib import Path
 
-ANALYSES_DIR = Path(__file__).parent.parent / "3_analyses"
+ROOT = Path(__file__).resolve().parent.parent
+ANALYSES_DIR = ROOT / "3_analyses"
+
+sys.path.insert(0, str(ROOT))
+from pipeline.results import (  # noqa: E402
+    is_sidecar, read_sidecar, results_file_issues, scan_results, sidecar_dataset, sidecar_issues,
+    sidecar_path,
+)
+from pipeline.state import (  # noqa: E402
+    DB_PATH, SAMPLE, STATE_DIR, atomic_path, file_signature, hash_text, output_dir,
+)
 
 REQUIRED_KEYS = {"query", "n_results", "results", "description", "interpretation", "figures"}
 
+# Cache limits: number of analyses, and their total size on disk
+# (results.json + sidecar). Analyses larger than the byte cap are not cached.
+CACHE_MAX_ENTRIES = 64
+CACHE_MAX_BYTES = int(os.environ.get("HELPERS_CACHE_MB", "512")) * 1024 * 1024
+
+_cache = OrderedDict()  # results.json path -> (files, signature, nbytes, data)
+
+# Set by 4_output/render.py: every analysis loaded during a render is appended
+# to this file, so the orchestrator knows which analyses a deliverable uses.
+TRACE_ENV = "PIPELINE_RENDER_TRACE"
+_traced = set()
+
+
+def _trace(name):
+    path = os.environ.get(TRACE_ENV)
+    if not path or name in _traced:
+        return
+    _traced.add(name)
+    with open(path, "a") as f:
+        f.write(name + "\n")
+
+
+def _results_path(name):
+    """results.json of an analysis (of its sample run in sample mode)."""
+    return output_dir(ANALYSES_DIR / name) / "results.json"
+
 
 def validate_results(data, name):
     """Check that a results.json dict conforms to the expected schema.
@@ -28,12 +86,16 @@ def validate_results(data, name):
         raise ValueError(
             f"Analysis '{name}/results.json' is missing required keys: {missing}"
         )
-    if not isinstance(data["results"], list):
+    if is_sidecar(data["results"]):
+        issues = sidecar_issues(_results_path(name).parent, data["results"], data["n_results"])
+        if issues:
+            raise ValueError(f"Analysis '{name}/results.json': {issues[0]}")
+    elif not isinstance(data["results"], list):
         raise ValueError(
-            f"Analysis '{name}/results.json': 'results' must be a list, "
-            f"got {type(data['results']).__name__}"
+            f"Analysis '{name}/results.json': 'results' must be a list or a "
+            f"sidecar reference, got {type(data['results']).__name__}"
         )
-    if data["n_results"] != len(data["results"]):
+    elif data["n_results"] != len(data["results"]):
         raise ValueError(
             f"Analysis '{name}/results.json': 'n_results' is {data['n_results']} "
             f"but 'results' has {len(data['results'])} items"
@@ -51,6 +113,114 @@ def validate_results(data, name):
                 )
 
 
+class SampledResultsError(ValueError):
+    """Results computed on the sampled database, loaded outside sample mode."""
+
+
+def _check_sample(data, name):
+    sample = data.get("sample")
+    if sample and sample != SAMPLE:
+        raise SampledResultsError(
+            f"Analysis '{name}' was computed on a {sample} sample of the data "
+            f"and cannot be used outside sample mode. Run: make analyses"
+        )
+
+
+def validate_results_file(name):
+    """Check an analysis's results.json on disk without loading its rows.
+
+    The file is streamed in constant memory, so this is cheap even for very
+    large results. Raises FileNotFoundError or ValueError like load_analysis().
+    """
+    p = _results_path(name)
+    if not p.exists():
+        raise FileNotFoundError(
+            f"Analysis '{name}' not found at {p}. "
+            f"Run: cd 3_analyses/{name} && python run.py"
+        )
+    issues = results_file_issues(p)
+    if issues:
+        raise ValueError(f"Analysis '{name}/results.json': {'; '.join(issues)}")
+
+
+class AnalysisData(dict):
+    """The dict returned by load_analysis().
+
+    When results.json stores its rows in a sidecar file, `data["results"]`
+    is read into a pandas DataFrame on first access only.
+    """
+
+    def __init__(self, data, sidecar=None):
+        super().__init__(data)
+        self.sidecar = sidecar  # path of the sidecar file, if any
+        self._sidecar = sidecar  # not read yet
+        self._frame = None
+        self.aggregates = {}  # (column, agg) -> value computed by load_values()
+
+    def frame(self):
+        """Columnar view of the results as a pandas DataFrame, built once."""
+        if self._frame is None:
+            results = self["results"]
+            if isinstance(results, list):
+                import pandas as pd
+
+                # convert_dtypes keeps integer columns integer despite nulls
+                results = pd.DataFrame.from_records(results).convert_dtypes()
+            self._frame = results
+        return self._frame
+
+    def __getitem__(self, key):
+        if key == "results" and self._sidecar is not None:
+            self["results"] = read_sidecar(self._sidecar)
+            self._sidecar = None
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+
+def _signature(*paths):
+    """(mtime_ns, size) of each existing path; changes when a file is rewritten."""
+    sig = []
+    for p in paths:
+        try:
+            st = p.stat()
+        except FileNotFoundError:
+            sig.append(None)
+            continue
+        sig.append((st.st_mtime_ns, st.st_size))
+    return tuple(sig)
+
+
+def clear_cache():
+    """Forget every cached analysis (the next load re-reads from disk)."""
+    _cache.clear()
+
+
+def _cache_get(p):
+    entry = _cache.get(p)
+    if entry is None:
+        return None
+    files, signature, _, data = entry
+    if _signature(*files) != signature:
+        del _cache[p]
+        return None
+    _cache.move_to_end(p)
+    return data
+
+
+def _cache_put(p, files, data):
+    signature = _signature(*files)
+    nbytes = sum(size for _, size in filter(None, signature))
+    if nbytes > CACHE_MAX_BYTES:
+        return
+    _cache[p] = (files, signature, nbytes, data)
+    total = sum(entry[2] for entry in _cache.values())
+    while len(_cache) > CACHE_MAX_ENTRIES or total > CACHE_MAX_BYTES:
+        _, (_, _, n, _) = _cache.popitem(last=False)
+        total -= n
+
+
 def load_analysis(name):
     """Load results.json from a named analysis subfolder.
 
@@ -58,9 +228,16 @@ def load_analysis(name):
         name: subfolder name in 3_analyses/ (e.g., "value_frequency")
 
     Returns:
-        dict with keys: query, n_results, results, description, interpretation, figures
+        dict with keys: query, n_results, results, description, interpretation, figures.
+        `results` is a list of dicts, or a pandas DataFrame (loaded on first
+        access) when the analysis stores its rows in a sidecar file.
+        The dict is cached and shared between calls: treat it as read-only.
     """
-    p = ANALYSES_DIR / name / "results.json"
+    _trace(name)
+    p = _results_path(name)
+    cached = _cache_get(p)
+    if cached is not None:
+        return cached
     if not p.exists():
         raise FileNotFoundError(
             f"Analysis '{name}' not found at {p}. "
@@ -69,48 +246,141 @@ def load_analysis(name):
     with open(p) as f:
         data = json.load(f)
     validate_results(data, name)
+    _check_sample(data, name)
+    files = [p]
+    if is_sidecar(data["results"]):
+        files.append(sidecar_path(p.parent, data["results"]))
+        data = AnalysisData(data, files[1])
+    else:
+        data = AnalysisData(data)
+    _cache_put(p, files, data)
     return data
 
 
+AGGREGATIONS = (
+    "first", "sum", "mean", "min", "max", "count",
+    "median", "std", "nunique", "count_nonnull", "count_null", "size",
+)
+QUANTILE_RE = re.compile(r"q(\d+(?:\.\d+)?)")
+# Aggregations that do not skip null values, so nulls are not warned about
+_KEEP_NULLS = ("first", "count", "count_nonnull", "count_null", "size")
+
+
+def _check_agg(agg):
+    if agg in AGGREGATIONS:
+        return
+    m = QUANTILE_RE.fullmatch(str(agg))
+    if m and 0 <= float(m.group(1)) <= 100:
+        return
+    raise ValueError(
+        f"Unknown aggregation '{agg}'. Use: {', '.join(AGGREGATIONS)}, "
+        f"or q<percentile> (e.g. q25, q90)"
+    )
+
+
+def _scalar(value):
+    import pandas as pd
+
+    if pd.isna(value):  # e.g. std of a single value
+        return None
+    return value.item() if hasattr(value, "item") else value
+
+
+def _aggregate(data, series, column, agg):
+    """Compute one aggregation of `column` (its values in `series`), vectorized."""
+    if agg in ("first", "count"):
+        rows = data["results"]
+        if isinstance(rows, list):  # rows without the key are not counted
+            values = [row[column] for row in rows if column in row]
+            return values[0] if agg == "first" else len(values)
+        if agg == "count":
+            return len(series)
+        return _scalar(series.iloc[0]) if len(series) else None
+    if agg == "size":
+        return len(series)
+    if agg == "count_nonnull":
+        return int(series.count())
+    if agg == "count_null":
+        return int(series.isna().sum())
+    if agg == "nunique":
+        return int(series.nunique())
+    values = series.dropna()
+    if values.empty:
+        return 0 if agg == "sum" else None
+    if agg in ("sum", "mean", "min", "max", "median", "std"):
+        return _scalar(getattr(values, agg)())
+    return _scalar(values.quantile(float(agg[1:]) / 100))
+
+
+def _column(data, name, column):
+    frame = data.frame()
+    if column not in frame.columns:
+        raise KeyError(
+            f"Column '{column}' not found in analysis '{name}'. "
+            f"Available: {list(frame.columns) if len(frame.columns) else '(empty)'}"
+        )
+    return frame[column]
+
+
+def _value(data, name, column, agg):
+    """Aggregation `agg` of `column`, computed once per cached analysis."""
+    key = (column, agg)
+    if key not in data.aggregates:
+        data.aggregates[key] = _aggregate(data, _column(data, name, column), column, agg)
+    return data.aggregates[key]
+
+
+def load_values(name, spec):
+    """Load several aggregated values from one analysis in a single pass.
+
+    Args:
+        name: subfolder name in 3_analyses/ (e.g., "value_frequency")
+        spec: {label: (column, agg)} — e.g.
+            {"total": ("count", "sum"), "typical": ("count", "median")}
+
+    Returns:
+        {label: value}. Aggregations are those of load_value().
+    """
+    data = load_analysis(name)
+    for column, agg in spec.values():
+        _check_agg(agg)
+    values = {}
+    warned = set()
+    for label, (column, agg) in spec.items():
+        values[label] = _value(data, name, column, agg)
+        if agg not in _KEEP_NULLS and column not in warned:
+            n_null = _value(data, name, column, "count_null")
+            if n_null:
+                warned.add(column)
+                n = _value(data, name, column, "size")
+                warnings.warn(
+                    f"Column '{column}' is missing or null in {n_null}/{n} rows "
+                    f"of analysis '{name}'. Aggregation uses only {n - n_null} rows."
+                )
+    return values
+
+
 def load_value(name, column, agg="first"):
     """Load a single scalar value from an analysis, useful for dashboard value boxes.
 
+    Aggregations run vectorized over a columnar view of the results, which is
+    built once per analysis and cached with it, as is every value computed.
+    Missing and null values are ignored by the value aggregations.
+
     Args:
         name: subfolder name in 3_analyses/ (e.g., "value_frequency")
         column: column name to extract from results
-        agg: aggregation method — "first" (default), "sum", "mean", "min", "max", "count"
+        agg: aggregation method — "first" (default, value of the first row
+            that has the column), "sum", "mean", "min", "max", "median",
+            "std", "nunique", "q<percentile>" (e.g. "q25", "q90"), "count"
+            (rows that have the column), "count_nonnull" (non-null values),
+            "count_null" (missing or null values), "size" (all rows)
 
     Returns:
-        The scalar value (number or string)
+        The scalar value (number or string); None if the column has no
+        non-null values (0 for "sum")
     """
-    data = load_analysis(name)
-    values = [row[column] for row in data["results"] if column in row]
-    n_total = len(data["results"])
-    n_found = len(values)
-    if not values:
-        raise KeyError(
-            f"Column '{column}' not found in analysis '{name}'. "
-            f"Available: {list(data['results'][0].keys()) if data['results'] else '(empty)'}"
-        )
-    if n_found < n_total:
-        import warnings
-        warnings.warn(
-            f"Column '{column}' missing in {n_total - n_found}/{n_total} rows "
-            f"of analysis '{name}'. Aggregation uses only {n_found} rows."
-        )
-    if agg == "first":
-        return values[0]
-    if agg == "sum":
-        return sum(values)
-    if agg == "mean":
-        return sum(values) / len(values)
-    if agg == "min":
-        return min(values)
-    if agg == "max":
-        return max(values)
-    if agg == "count":
-        return len(values)
-    raise ValueError(f"Unknown aggregation '{agg}'. Use: first, sum, mean, min, max, count")
+    return load_values(name, {column: (column, agg)})[column]
 
 
 def load_figure(name, fig_name):
@@ -123,10 +393,254 @@ def load_figure(name, fig_name):
     Returns:
         str path to the figure file
     """
-    p = ANALYSES_DIR / name / "figures" / fig_name
+    _trace(name)
+    results = _results_path(name)
+    if results.exists():
+        data, _ = scan_results(results)  # header only, the rows are not kept
+        _check_sample(data, name)  # raises if the figure was drawn from a sample
+    p = results.parent / "figures" / fig_name
     if not p.exists():
         raise FileNotFoundError(
             f"Figure '{fig_name}' not found in analysis '{name}' at {p}. "
             f"Run: cd 3_analyses/{name} && python run.py"
         )
     return str(p)
+
+
+# ── Arrow tables ─────────────────────────────────────────────────
+# load_table() reads results through Arrow instead of building the whole
+# DataFrame: a Parquet sidecar is scanned through a memory map for the
+# requested columns and row groups only, an Arrow IPC sidecar is
+# memory-mapped in place. Row-layout results are converted once to an Arrow
+# IPC copy in .pipeline_state/tables/ (rewritten when results.json changes),
+# so later renders map that copy instead of parsing the JSON again. Sample
+# mode keeps its own copies (<analysis>_sample.arrow), also stamped with the
+# sample mode, so a copy of sampled results is never read outside it.
+TABLES_DIR = STATE_DIR / "tables"
+_STAMP_KEY = b"results_signature"
+
+
+def _stamp(p):
+    return json.dumps([file_signature(p), SAMPLE]).encode()
+
+
+def _arrow_path(name):
+    return TABLES_DIR / f"{name}{'_sample' if SAMPLE else ''}.arrow"
+
+
+def _arrow_copy(name, p):
+    """Path of the Arrow IPC copy of a row-layout results.json, or None if
+    it is missing or older than results.json."""
+    import pyarrow as pa
+
+    path = _arrow_path(name)
+    try:
+        with pa.memory_map(str(path)) as source:
+            stamp = (pa.ipc.open_file(source).schema.metadata or {}).get(_STAMP_KEY)
+    except (FileNotFoundError, pa.ArrowInvalid):
+        return None
+    return path if stamp == _stamp(p) else None
+
+
+def _write_arrow_copy(name, p, data):
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(data.frame(), preserve_index=False)
+    table = table.replace_schema_metadata({
+        **(table.schema.metadata or {}), _STAMP_KEY: _stamp(p),
+    })
+    path = _arrow_path(name)
+    with atomic_path(path) as tmp:
+        with pa.OSFile(str(tmp), "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    return path
+
+
+def load_table(name, columns=None, filter=None, arrow=False):
+    """Load some columns and rows of an analysis's results, reading only those.
+
+    Use it instead of load_analysis() for large results of which a chunk
+    needs a few columns or a subset of rows (dashboard tables and charts).
+
+    Args:
+        name: subfolder name in 3_analyses/ (e.g., "value_frequency")
+        columns: column names to load (default: all)
+        filter: rows to keep, as (column, op, value) tuples that must all
+            hold, e.g. [("year", ">=", 2020), ("region", "in", ["EU", "US"])];
+            a list of such lists means any of them (OR). Operators: ==, !=,
+            <, <=, >, >=, in, not in. A pyarrow.compute expression also works.
+        arrow: return a pyarrow.Table (memory-mapped where possible, no
+            copy) instead of a pandas DataFrame
+
+    Returns:
+        pandas DataFrame (or pyarrow.Table) with the selected columns and rows
+    """
+    _trace(name)
+    p = _results_path(name)
+    path = _arrow_copy(name, p)
+    if path is None:
+        data = load_analysis(name)
+        path = data.sidecar or _write_arrow_copy(name, p, data)
+    dataset = sidecar_dataset(path)
+
+    missing = [c for c in columns or [] if c not in dataset.schema.names]
+    if missing:
+        raise KeyError(
+            f"Column(s) {missing} not found in analysis '{name}'. "
+            f"Available: {dataset.schema.names or '(empty)'}"
+        )
+    if isinstance(filter, tuple):
+        filter = [filter]
+    if isinstance(filter, list):
+        import pyarrow.parquet as pq
+
+        filter = pq.filters_to_expression(filter)
+    table = dataset.to_table(columns=columns, filter=filter)
+    return table if arrow else table.to_pandas()
+
+
+# ── Direct queries ───────────────────────────────────────────────
+# query() runs SQL on project.duckdb from a deliverable, for drill-downs too
+# small to deserve an analysis. The database is opened read-only once per
+# process (the Quarto kernel) and the connection is reused by every chunk.
+# Results are cached on disk as Arrow IPC files in .pipeline_state/queries/,
+# keyed by the SQL, its parameters and the build fingerprints of the tables
+# it names, so a re-render reads them back through a memory map without
+# touching the database, and a rebuild of those tables invalidates them.
+QUERIES_DIR = STATE_DIR / "queries"
+QUERY_CACHE_MAX_BYTES = int(os.environ.get("HELPERS_QUERY_CACHE_MB", "256")) * 1024 * 1024
+
+_seen = {}  # source -> (signature, {table: fingerprint}) when last read
+
+
+def _source_fingerprints(source):
+    """Return (path, {table: fingerprint}) of the database ("db") or of its
+    Parquet export ("parquet"), re-read only when it changed; the shared
+    connection to it is closed when it changed since it was opened.
+    Raises FileNotFoundError if it does not exist."""
+    from pipeline.export import EXPORT_DIR, MANIFEST_FILE
+
+    if source not in ("db", "parquet"):
+        raise ValueError(f"Unknown source '{source}'. Use: db, parquet")
+    path = DB_PATH if source == "db" else EXPORT_DIR
+    signature = file_signature(path if source == "db" else path / MANIFEST_FILE)
+    if signature is None:
+        hint = "make db" if source == "db" else "make db EXPORT=1"
+        raise FileNotFoundError(f"{'Database' if source == 'db' else 'Parquet export'} "
+                                f"not found at {path}. Run: {hint}")
+    if _seen.get(source, (None,))[0] != signature:
+        from pipeline.analysis_kit import close_connections
+        from pipeline.export import export_fingerprints
+        from pipeline.lineage import db_fingerprints
+
+        close_connections(path)
+        fingerprints = db_fingerprints(path) if source == "db" else export_fingerprints(path)
+        _seen[source] = (signature, fingerprints)
+    return path, _seen[source][1]
+
+
+def _read_cached_query(path):
+    import pyarrow as pa
+
+    try:
+        source = pa.memory_map(str(path))
+    except FileNotFoundError:
+        return None
+    try:
+        table = pa.ipc.open_file(source).read_all()
+    except pa.ArrowInvalid:  # truncated or corrupt: run the query again
+        return None
+    os.utime(path)  # the cache is pruned least recently used first
+    return table
+
+
+def _write_cached_query(path, table):
+    import pyarrow as pa
+
+    with atomic_path(path) as tmp:
+        with pa.OSFile(str(tmp), "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    files = sorted(QUERIES_DIR.glob("*.arrow"), key=lambda p: p.stat().st_mtime_ns)
+    total = sum(p.stat().st_size for p in files)
+    for old in files[:-1]:
+        if total <= QUERY_CACHE_MAX_BYTES:
+            break
+        total -= old.stat().st_size
+        old.unlink(missing_ok=True)
+
+
+def query(sql, params=None, arrow=False, cache=True, source="db"):
+    """Run a read-only SQL query on project.duckdb.
+
+    Args:
+        sql: the query; use ? or $name placeholders for values
+        params: values for the placeholders (list or dict)
+        arrow: return a pyarrow.Table instead of a pandas DataFrame
+        cache: reuse and store the result in .pipeline_state/queries/
+            (only when the database has build fingerprints)
+        source: "db" (project.duckdb) or "parquet" (its Parquet export in
+            2_db/parquet/, see make db EXPORT=1; filters on partition
+            columns only read the matching files)
+
+    Returns:
+        pandas DataFrame (or pyarrow.Table) with the result
+    """
+    path, fingerprints = _source_fingerprints(source)
+    # Tables are matched by name in the SQL, as for analyses; a query naming
+    # none (table functions, views built outside the pipeline) depends on all
+    words = {w.lower() for w in re.findall(r"\w+", sql)}
+    tables = {t: fp for t, fp in (fingerprints or {}).items() if t.lower() in words}
+    for t in tables or fingerprints or []:
+        _trace(f"table:{t}")
+
+    cached = None
+    if cache and fingerprints is not None:
+        key = hash_text(source, sql.strip(), params, tables or fingerprints)
+        cached = QUERIES_DIR / f"{key}.arrow"
+        table = _read_cached_query(cached)
+        if table is not None:
+            return table if arrow else table.to_pandas()
+
+    from pipeline.analysis_kit import connection
+
+    result = connection(path).execute(sql, params or []).arrow()
+    table = result.read_all() if hasattr(result, "read_all") else result
+    if cached is not None:
+        _write_cached_query(cached, table)
+    return table if arrow else table.to_pandas()
+
+
+def main(argv=None):
+    """Validate analyses as load_analysis() would, without loading their rows."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Check the analyses a deliverable loads")
+    parser.add_argument(
+        "names", nargs="*", metavar="NAME",
+        help="analyses to check (default: every analysis with a results.json)",
+    )
+    args = parser.parse_args(argv)
+
+    names = args.names or sorted(
+        d.name for d in ANALYSES_DIR.iterdir() if _results_path(d.name).is_file()
+    )
+    failed = 0
+    for name in names:
+        try:
+            validate_results_file(name)
+            data, _ = scan_results(_results_path(name))
+            _check_sample(data, name)
+        except (OSError, ValueError) as e:
+            failed += 1
+            print(f"  ✗ {name}: {e}")
+            continue
+        print(f"  ✓ {name}: {data['n_results']:,} results, {len(data['figures'])} figure(s)")
+    if failed:
+        print(f"✗ {failed}/{len(names)} analyses cannot be loaded")
+        return 1
+    print(f"✓ {len(names)} analyses can be loaded")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
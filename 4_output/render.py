@@ -0,0 +1,176 @@
+# 4_output/render.py
+# Render the deliverables in 4_output/ whose inputs changed, in parallel.
+# Run: python 4_output/render.py [-j N] [--force] [--profile] [DELIVERABLE ...]
+#      (from project root)
+#  or: make outputs  /  make outputs J=4 FORCE=1  /  make render d=<folder>
+#
+# A deliverable is re-rendered when one of its files, helpers.py or the
+# outputs of an analysis it loads changed since its last successful render
+# (see pipeline/lineage.py); the reason is printed. The analyses it loads are
+# recorded by helpers.py while Quarto executes the document: every
+# load_analysis()/load_value(s)()/load_figure()/load_table() call is appended
+# to a trace file named by $PIPELINE_RENDER_TRACE. Calls spelled out in the
+# .qmd are added too, so documents rendered from Quarto's freeze cache are
+# covered. Tables read with helpers.query() are traced the same way, and the
+# deliverable is re-rendered when one of them is rebuilt.
+#
+# Each deliverable is rendered by its own `quarto render` processes; up to
+# -j deliverables render at once, their .qmd files one after another.
+# --profile appends each render's wall time to .pipeline_state/timings.jsonl.
+#
+# In sample mode (make outputs SAMPLE=1%) helpers.py reads the sampled
+# analyses and database. The render is recorded as sampled, so it counts as
+# out of date outside sample mode and the next `make outputs` renders it again
+# from the full data.
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+OUTPUT_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(OUTPUT_DIR.parent))
+from pipeline import profiling  # noqa: E402
+from pipeline.lineage import loaded_analyses, record_render, render_stale_reason  # noqa: E402
+from pipeline.state import SAMPLE  # noqa: E402
+
+TRACE_ENV = "PIPELINE_RENDER_TRACE"  # read by helpers.py
+SKIP = {"templates", "__pycache__"}
+
+
+def discover(output_dir=OUTPUT_DIR):
+    """Return the deliverable folders (subfolders with at least one .qmd)."""
+    return [
+        d for d in sorted(output_dir.iterdir())
+        if d.is_dir() and d.name not in SKIP and not d.name.startswith(".")
+        and any(d.glob("*.qmd"))
+    ]
+
+
+def render_deliverable(folder):
+    """Render every .qmd of a deliverable, tracing the analyses it loads.
+
+    Returns a result dict (name, code, seconds, output, analyses, tables).
+    """
+    start = time.perf_counter()
+    fd, trace = tempfile.mkstemp(prefix=f".render-{folder.name}.", suffix=".trace")
+    os.close(fd)
+    env = dict(os.environ, **{TRACE_ENV: trace})
+    code, output = 0, []
+    try:
+        for qmd in sorted(folder.glob("*.qmd")):
+            proc = subprocess.run(
+                ["quarto", "render", qmd.name], cwd=folder, env=env,
+                capture_output=True, text=True,
+            )
+            output.append(proc.stdout + proc.stderr)
+            if proc.returncode != 0:
+                code = proc.returncode
+                break
+        traced = set(Path(trace).read_text().split())
+    finally:
+        Path(trace).unlink(missing_ok=True)
+    tables = {n.split(":", 1)[1] for n in traced if n.startswith("table:")}
+    return {
+        "name": folder.name,
+        "code": code,
+        "seconds": time.perf_counter() - start,
+        "output": "".join(output),
+        "analyses": sorted({n for n in traced if ":" not in n} | set(loaded_analyses(folder))),
+        "tables": sorted(tables),
+    }
+
+
+def _indent(text, prefix="    "):
+    return "\n".join(prefix + line for line in text.rstrip().splitlines())
+
+
+def render_all(deliverables, jobs, force=False):
+    """Render stale deliverables, at most `jobs` at a time.
+
+    Returns a list of result dicts (cached=True for deliverables up to date).
+    """
+    results, reasons = [], {}
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        running = {}
+        for folder in deliverables:
+            reason = "forced" if force else render_stale_reason(folder)
+            if reason is None:
+                results.append({"name": folder.name, "code": 0, "seconds": 0.0, "cached": True})
+                print(f"· {folder.name}: up to date")
+                continue
+            reasons[folder.name] = reason
+            running[pool.submit(render_deliverable, folder)] = folder
+        while running:
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for f in finished:
+                folder = running.pop(f)
+                result = f.result()
+                results.append(result)
+                profiling.record("render", folder.name, result["seconds"], code=result["code"])
+                if result["code"] == 0:
+                    record_render(folder, result["analyses"], result["tables"])
+                    print(f"✓ {folder.name} ({result['seconds']:.2f}s) — {reasons[folder.name]}")
+                    if SAMPLE:
+                        print(f"  ⚠ rendered from the {SAMPLE} sample: not a final deliverable")
+                else:
+                    print(f"✗ {folder.name} (exit {result['code']}, {result['seconds']:.2f}s)"
+                          f" — {reasons[folder.name]}")
+                    print(_indent(result["output"]))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render the deliverables in 4_output/")
+    parser.add_argument(
+        "deliverables", nargs="*", metavar="DELIVERABLE",
+        help="folders in 4_output/ to consider (default: all)",
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=os.cpu_count() or 1,
+        help="number of deliverables rendered at once (default: CPU count)",
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="re-render even if the inputs are unchanged",
+    )
+    parser.add_argument(
+        "--profile", action="store_true",
+        help="record render times in .pipeline_state/timings.jsonl",
+    )
+    args = parser.parse_args(argv)
+    if args.profile or profiling.enabled():
+        profiling.enable()
+
+    if shutil.which("quarto") is None:
+        print("✗ quarto not found. Install it: https://quarto.org/docs/get-started/")
+        return 1
+
+    if args.deliverables:
+        deliverables = [OUTPUT_DIR / Path(d).name for d in args.deliverables]
+        missing = [d.name for d in deliverables if not d.is_dir()]
+        if missing:
+            print(f"✗ Directory not found: {', '.join(f'4_output/{m}' for m in missing)}")
+            return 1
+    else:
+        deliverables = discover()
+    if not deliverables:
+        print("No deliverables found in 4_output/")
+        return 0
+
+    start = time.perf_counter()
+    results = render_all(deliverables, max(1, args.jobs), args.force)
+    profiling.record("render", "total", time.perf_counter() - start, deliverables=len(results))
+    n_ok = sum(r["code"] == 0 for r in results)
+    n_cached = sum(bool(r.get("cached")) for r in results)
+    print(f"{n_ok}/{len(results)} succeeded ({n_cached} up to date) "
+          f"in {time.perf_counter() - start:.2f}s")
+    return 0 if n_ok == len(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,359 @@
+# benchmarks/bench.py
+# Time every stage of the pipeline on a synthetic project and write a JSON
+# report that can be compared against a baseline.
+# Run: python benchmarks/bench.py [--preset small|medium|large|xlarge] [options]
+#      python benchmarks/bench.py --preset medium --compare baseline.json
+#
+# The project is generated in a temporary directory from the current working
+# tree (see synth.py); nothing in this repository is touched. Every case runs
+# in its own process, `--repeat` times: stages end-to-end through their
+# command line, functions through a small script that times the call alone
+# (imports excluded). The report keeps the median wall time and the peak RSS
+# of each case, plus throughput where it applies.
+#
+# With --compare, cases slower (or using more memory) than the baseline by
+# more than --max-regression are listed and the exit code is 1, so the suite
+# can gate a change in CI.
+#
+# Startup cases (a warm `status.py`, `import helpers` and `python -c pass`)
+# run at least 10 times each. A warm status.py, interpreter startup
+# included, must finish within --status-budget (default 100 ms), otherwise
+# the exit code is 1: `--preset startup` (300 analyses, little
+# data) checks it on a project with hundreds of analyses.
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import textwrap
+import time
+from datetime import datetime
+from pathlib import Path
+
+import duckdb
+
+from synth import ROOT, make_project
+
+REPORTS_DIR = Path(__file__).resolve().parent / "reports"
+
+PRESETS = {
+    "small": {"rows": 10**4, "tables": 4, "analyses": 8, "result_rows": 1_000},
+    "medium": {"rows": 10**6, "tables": 8, "analyses": 40, "result_rows": 10_000},
+    "large": {"rows": 10**7, "tables": 8, "analyses": 80, "result_rows": 100_000},
+    "xlarge": {"rows": 10**8, "tables": 4, "analyses": 80, "result_rows": 1_000_000},
+    "startup": {"rows": 10**3, "tables": 2, "analyses": 300, "result_rows": 20},
+}
+
+STARTUP_REPEAT = 10  # minimum runs of the startup cases, which last milliseconds
+
+# Function benchmarks: run inside the project, print {"seconds": [...]}.
+# `REPEAT` is substituted; the timed region excludes imports.
+FUNCTIONS = {
+    "write_schema": """
+        import duckdb
+        from pipeline.build import SCHEMA_PATH, write_schema
+        from pipeline.state import DB_PATH
+        con = duckdb.connect(str(DB_PATH), read_only=True)
+        for _ in range(REPEAT):
+            SCHEMA_PATH.with_suffix(".json").unlink(missing_ok=True)  # no reuse
+            with timer():
+                write_schema(con, SCHEMA_PATH, exact_counts=True)
+    """,
+    "load_analysis": """
+        import helpers
+        names = [d.name for d in sorted(helpers.ANALYSES_DIR.glob("a*"))]
+        for _ in range(REPEAT):
+            helpers.clear_cache()
+            with timer():
+                for name in names:
+                    helpers.load_analysis(name)
+    """,
+    "load_value": """
+        import helpers
+        # No more analyses than the cache holds, or the warm-up is evicted
+        names = [d.name for d in sorted(helpers.ANALYSES_DIR.glob("a*"))]
+        names = names[:helpers.CACHE_MAX_ENTRIES]
+        for name in names:  # warm the cache and the columnar views
+            helpers.load_value(name, "value", "mean")
+        for _ in range(REPEAT):
+            with timer():
+                for _ in range(10):
+                    for name in names:
+                        helpers.load_value(name, "value", "mean")
+    """,
+    "validate_results": """
+        from pipeline.results import results_file_issues
+        from pipeline.state import ROOT
+        paths = sorted((ROOT / "3_analyses").glob("a*/results.json"))
+        for _ in range(REPEAT):
+            with timer():
+                for p in paths:
+                    assert not results_file_issues(p), p
+    """,
+}
+
+FUNCTION_PRELUDE = """
+import json, sys, time
+from contextlib import contextmanager
+sys.path[:0] = [".", "4_output"]
+_seconds = []
+@contextmanager
+def timer():
+    start = time.perf_counter()
+    yield
+    _seconds.append(time.perf_counter() - start)
+"""
+
+
+# Commands are started by this small interpreter rather than by bench.py: a
+# spawned process inherits the RSS high-water mark of its parent, which here
+# holds DuckDB and the generated data. It times the command itself and
+# writes "<seconds> <ru_maxrss>" to the file descriptor given first.
+SPAWN = """
+import os, sys, time
+fd = int(sys.argv[1])
+os.set_inheritable(fd, False)
+start = time.perf_counter()
+pid = os.posix_spawn(sys.argv[2], sys.argv[2:], os.environ)
+_, status, usage = os.wait4(pid, 0)
+os.write(fd, f"{time.perf_counter() - start} {usage.ru_maxrss}".encode())
+sys.exit(os.waitstatus_to_exitcode(status))
+"""
+
+
+def run_process(cmd, cwd):
+    """Run a command; return (seconds, peak RSS in MB, stdout). Raises on failure.
+
+    `cmd[0]` must be an absolute path (e.g. sys.executable).
+    """
+    # Bytecode is cached as in a real project, even where the environment
+    # disables it: recompiling every module would dominate the startup cases
+    env = {k: v for k, v in os.environ.items() if k != "PYTHONDONTWRITEBYTECODE"}
+    read_fd, write_fd = os.pipe()
+    try:
+        proc = subprocess.Popen(
+            [sys.executable, "-c", SPAWN, str(write_fd), *map(str, cmd)], cwd=cwd, env=env,
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, pass_fds=(write_fd,),
+        )
+    finally:
+        os.close(write_fd)
+    with os.fdopen(read_fd) as report:
+        out = proc.stdout.read()
+        proc.wait()
+        measured = report.read().split()
+    if proc.returncode != 0:
+        raise RuntimeError(f"{' '.join(map(str, cmd))} failed:\n{out}")
+    seconds, maxrss = float(measured[0]), int(measured[1])
+    # ru_maxrss: kilobytes on Linux, bytes on macOS
+    rss = maxrss / (1 << 20 if sys.platform == "darwin" else 1 << 10)
+    return seconds, round(rss, 1), out
+
+
+def summarize_runs(seconds, rss, **extra):
+    return {
+        "seconds": round(statistics.median(seconds), 4),
+        "runs": [round(s, 4) for s in seconds],
+        "peak_rss_mb": max(rss),
+        **extra,
+    }
+
+
+def bench_command(name, cmd, project, repeat, before=None, **extra):
+    """Time a stage command `repeat` times (calling `before()` before each run)."""
+    seconds, rss = [], []
+    for _ in range(repeat):
+        if before:
+            before()
+        s, r, _ = run_process([sys.executable, *cmd], project)
+        seconds.append(s)
+        rss.append(r)
+    result = summarize_runs(seconds, rss, **extra)
+    print(f"  ✓ {name}: {result['seconds']:.3f}s, peak {result['peak_rss_mb']:.0f} MB")
+    return result
+
+
+def bench_function(name, body, project, repeat):
+    """Time a function benchmark script; returns the median of its inner timings."""
+    script = (
+        FUNCTION_PRELUDE
+        + textwrap.dedent(body).replace("REPEAT", str(repeat))
+        + "\nprint(json.dumps({'seconds': _seconds}))\n"
+    )
+    _, rss, out = run_process([sys.executable, "-c", script], project)
+    seconds = json.loads(out.strip().splitlines()[-1])["seconds"]
+    result = summarize_runs(seconds, [rss])
+    print(f"  ✓ {name}: {result['seconds']:.4f}s, peak {result['peak_rss_mb']:.0f} MB")
+    return result
+
+
+def run_benchmarks(project, params, repeat, jobs):
+    """Run every case in `project`; return {case: result}."""
+    db = project / "2_db" / "project.duckdb"
+    rows = params["rows"] * params["tables"]
+    cases = {}
+
+    def drop_db():
+        db.unlink(missing_ok=True)
+        shutil.rmtree(project / ".pipeline_state", ignore_errors=True)
+
+    build = ["2_db/build_db.py", "-j", str(jobs)]
+    cases["build_db.full"] = bench_command(
+        "build_db.full", build, project, repeat, before=drop_db, rows=rows,
+    )
+    cases["build_db.full"]["rows_per_second"] = round(rows / cases["build_db.full"]["seconds"])
+    cases["build_db.noop"] = bench_command("build_db.noop", build, project, repeat)
+
+    run = ["3_analyses/run_analyses.py", "-j", str(jobs)]
+    cases["analyses.full"] = bench_command(
+        "analyses.full", run + ["--force"], project, repeat, analyses=params["analyses"],
+    )
+    cases["analyses.noop"] = bench_command("analyses.noop", run, project, repeat)
+
+    cases["status.cold"] = bench_command(
+        "status.cold", ["status.py", "--no-cache", "--json"], project, repeat,
+    )
+
+    startup_repeat = max(repeat, STARTUP_REPEAT)
+    cases["status.warm"] = bench_command(
+        "status.warm", ["status.py", "--json"], project, startup_repeat,
+        analyses=params["analyses"],
+    )
+    cases["python.startup"] = bench_command("python.startup", ["-c", "pass"], project, startup_repeat)
+    cases["helpers.import"] = bench_command(
+        "helpers.import", ["-c", "import sys; sys.path.insert(0, '4_output'); import helpers"],
+        project, startup_repeat,
+    )
+    for name in ("helpers.import", "status.warm"):
+        cases[name]["over_python_seconds"] = round(
+            cases[name]["seconds"] - cases["python.startup"]["seconds"], 4
+        )
+
+    for name, body in FUNCTIONS.items():
+        cases[name] = bench_function(name, body, project, repeat)
+    return cases
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"], cwd=ROOT,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline, max_regression):
+    """Print the change of every case against `baseline`; return the regressions."""
+    regressions = []
+    print(f"\nCompared with {baseline['meta'].get('revision')} ({baseline['meta']['time']}):")
+    for name, case in report["cases"].items():
+        base = baseline["cases"].get(name)
+        if base is None:
+            continue
+        parts = []
+        for key, label in (("seconds", "time"), ("peak_rss_mb", "memory")):
+            if not base.get(key):
+                continue
+            change = case[key] / base[key] - 1
+            parts.append(f"{label} {change:+.0%}")
+            if change > max_regression:
+                regressions.append(f"{name} {label} {change:+.0%}")
+        marker = "✗" if any(r.startswith(name + " ") for r in regressions) else "·"
+        print(f"  {marker} {name}: {', '.join(parts)}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline on synthetic data")
+    parser.add_argument("--preset", choices=PRESETS, default="small")
+    parser.add_argument("--rows", type=int, help="rows per raw table")
+    parser.add_argument("--tables", type=int, help="number of raw tables")
+    parser.add_argument("--analyses", type=int, help="number of analyses")
+    parser.add_argument("--result-rows", type=int, help="rows per results.json")
+    parser.add_argument("--format", choices=("csv", "parquet"), default="csv")
+    parser.add_argument("--figures", action="store_true", help="analyses also save a figure")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case (median kept)")
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=os.cpu_count() or 1,
+        help="workers for build_db.py and run_analyses.py (default: CPU count)",
+    )
+    parser.add_argument("--out", type=Path, help="report path (default: benchmarks/reports/)")
+    parser.add_argument("--compare", type=Path, metavar="BASELINE", help="report to compare with")
+    parser.add_argument(
+        "--max-regression", type=float, default=0.2,
+        help="allowed slowdown or memory growth vs. the baseline (default: 0.2 = 20%%)",
+    )
+    parser.add_argument(
+        "--status-budget", type=float, default=0.1, metavar="SECONDS",
+        help="max wall time of a warm status.py, interpreter startup included (default: 0.1)",
+    )
+    parser.add_argument("--keep", action="store_true", help="keep the generated project")
+    args = parser.parse_args(argv)
+
+    params = dict(PRESETS[args.preset])
+    for key in ("rows", "tables", "analyses", "result_rows"):
+        if getattr(args, key) is not None:
+            params[key] = getattr(args, key)
+
+    project = Path(tempfile.mkdtemp(prefix="pipeline-bench-"))
+    try:
+        print(f"▶ Generating {args.preset} project in {project}")
+        start = time.perf_counter()
+        info = make_project(project, fmt=args.format, figures=args.figures, **params)
+        print(f"  ✓ generated {info['data_bytes'] / 1e6:.1f} MB of raw data "
+              f"in {time.perf_counter() - start:.1f}s")
+        print("▶ Running benchmarks")
+        cases = run_benchmarks(project, params, max(1, args.repeat), max(1, args.jobs))
+    finally:
+        if args.keep:
+            print(f"  Project kept at {project}")
+        else:
+            shutil.rmtree(project, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "preset": args.preset,
+            "params": info,
+            "repeat": args.repeat,
+            "jobs": args.jobs,
+            "revision": git_revision(),
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "duckdb": duckdb.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "cases": cases,
+    }
+    out = args.out or REPORTS_DIR / f"{args.preset}-{datetime.now():%Y%m%d-%H%M%S}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=2))
+    print(f"✓ Report written: {out}")
+
+    status = cases["status.warm"]
+    over = status["over_python_seconds"]
+    within = status["seconds"] <= args.status_budget
+    print(f"{'✓' if within else '✗'} status.py: {status['seconds'] * 1000:.0f} ms with "
+          f"{params['analyses']} analyses (budget {args.status_budget * 1000:.0f} ms), "
+          f"{over * 1000:.0f} ms over interpreter startup")
+    if not within:
+        return 1
+
+    if args.compare:
+        regressions = compare(report, json.loads(args.compare.read_text()), args.max_regression)
+        if regressions:
+            print(f"✗ {len(regressions)} regression(s) above {args.max_regression:.0%}: "
+                  + "; ".join(regressions))
+            return 1
+        print(f"✓ No regression above {args.max_regression:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+# benchmarks/synth.py
+# Generate a synthetic project for the benchmarks: a copy of the pipeline code
+# plus generated raw data, build_db.py and analyses.
+#
+# Raw files are written by DuckDB straight from range(), deterministically, so
+# 10^8-row sources are generated without going through pandas or Python loops.
+
+import json
+import shutil
+from pathlib import Path
+
+import duckdb
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Code copied from the working tree into every synthetic project, so the
+# benchmarks measure the current (possibly uncommitted) version.
+PROJECT_FILES = [
+    "pipeline",
+    "status.py",
+    "0_plan",
+    "1_data/README.md",
+    "2_db/README.md",
+    "3_analyses/README.md",
+    "3_analyses/run_analyses.py",
+    "4_output/helpers.py",
+    "4_output/render.py",
+]
+
+CATEGORIES = 50
+
+BUILD_DB = '''\
+# 2_db/build_db.py (generated by benchmarks/synth.py)
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from pipeline.build import Build
+
+build = Build()
+{tables}
+build.run()
+'''
+
+RUN_PY = '''\
+# 3_analyses/{name}/run.py (generated by benchmarks/synth.py)
+import duckdb, json, sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from pipeline.state import DB_PATH  # project_sample.duckdb in sample mode
+
+con = duckdb.connect(str(DB_PATH), read_only=True)
+query = """{query}"""
+df = con.sql(query).df()
+{figure}
+output = {{
+    "query": query,
+    "n_results": len(df),
+    "results": df.to_dict(orient="records"),
+    "description": "Synthetic benchmark analysis",
+    "interpretation": "",
+    "figures": {figures},
+}}
+with open("results.json", "w") as f:
+    json.dump(output, f, default=str)
+'''
+
+FIGURE = '''
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+Path("figures").mkdir(exist_ok=True)
+fig, ax = plt.subplots()
+ax.plot(range(min(len(df), 1000)), df["value"].head(1000))
+fig.savefig("figures/plot.png")
+plt.close(fig)
+'''
+
+
+def copy_code(dest):
+    """Copy the pipeline code of this working tree into `dest`."""
+    ignore = shutil.ignore_patterns("__pycache__", "*.pyc")
+    for rel in PROJECT_FILES:
+        src, dst = ROOT / rel, Path(dest) / rel
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        if src.is_dir():
+            shutil.copytree(src, dst, ignore=ignore, dirs_exist_ok=True)
+        elif src.exists():
+            shutil.copy2(src, dst)
+
+
+def write_source(path, rows, fmt, seed):
+    """Write a synthetic table of `rows` rows (CSV or Parquet) with DuckDB."""
+    con = duckdb.connect()
+    try:
+        select = f"""
+            SELECT
+                range AS id,
+                'cat_' || (hash(range + {seed}) % {CATEGORIES}) AS category,
+                TIMESTAMP '2020-01-01' + to_seconds(range % 100000000) AS ts,
+                (hash(range * 31 + {seed}) % 100000) / 100.0 AS value,
+                range % 3 = 0 AS flag
+            FROM range({rows})
+        """
+        options = "FORMAT parquet" if fmt == "parquet" else "FORMAT csv, HEADER"
+        con.execute(f"COPY ({select}) TO '{path}' ({options})")
+    finally:
+        con.close()
+
+
+def make_project(dest, rows=10_000, tables=4, analyses=8, result_rows=1_000,
+                 fmt="csv", figures=False):
+    """Create a synthetic project in `dest`.
+
+    Args:
+        dest: empty or missing directory
+        rows: rows per raw table
+        tables: number of raw tables (each gets a derived aggregate table)
+        analyses: number of analyses in 3_analyses/
+        result_rows: rows written to each analysis's results.json
+        fmt: "csv" or "parquet" for the raw files
+        figures: whether analyses also save a matplotlib figure
+
+    Returns a dict describing the project (the parameters and sizes).
+    """
+    dest = Path(dest)
+    copy_code(dest)
+    data_dir = dest / "1_data"
+    data_dir.mkdir(parents=True, exist_ok=True)
+    (dest / "2_db").mkdir(exist_ok=True)
+    (dest / "4_output").mkdir(exist_ok=True)
+
+    sources, declarations = [], []
+    for i in range(tables):
+        file = f"t{i}.{fmt}"
+        write_source(data_dir / file, rows, fmt, seed=i)
+        sources.append({"file": file, "format": fmt.upper(), "encoding": "utf-8"})
+        declarations.append(f'build.source("t{i}", "{file}")')
+        declarations.append(
+            f'build.table("t{i}_by_category", sql="SELECT category, COUNT(*) AS n, '
+            f'AVG(value) AS value FROM t{i} GROUP BY category")'
+        )
+    # sources.yaml as JSON (a YAML subset)
+    (data_dir / "sources.yaml").write_text(json.dumps(sources, indent=2))
+    (dest / "2_db" / "build_db.py").write_text(
+        BUILD_DB.format(tables="\n".join(declarations))
+    )
+
+    for j in range(analyses):
+        name = f"a{j:03d}"
+        folder = dest / "3_analyses" / name
+        folder.mkdir(parents=True, exist_ok=True)
+        query = f"SELECT * FROM t{j % tables} ORDER BY id LIMIT {result_rows}"
+        (folder / "run.py").write_text(RUN_PY.format(
+            name=name, query=query,
+            figure=FIGURE if figures else "",
+            figures=json.dumps([{"file": "figures/plot.png", "caption": "Plot"}] if figures else []),
+        ))
+
+    return {
+        "rows": rows, "tables": tables, "analyses": analyses,
+        "result_rows": result_rows, "format": fmt, "figures": figures,
+        "data_bytes": sum(p.stat().st_size for p in data_dir.glob(f"*.{fmt}")),
+    }
@@ -0,0 +1,7 @@
+# pipeline/__init__.py
+# Shared internals used by the stage scripts (2_db/build_db.py, status.py, ...).
+#
+# Stage scripts put the project root on sys.path and import from here:
+#
+#   import sys; sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+#   from pipeline.build import Build
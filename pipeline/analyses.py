@@ -0,0 +1,131 @@
+# pipeline/analyses.py
+# Discovery of the analyses in 3_analyses/ and the record of what produced
+# each results.json, shared by the runner (3_analyses/run_analyses.py) and
+# status.py.
+#
+# After a successful run the runner stores, per analysis, the hash of run.py
+# and of its query, the build fingerprints of the tables it reads, the
+# results hashes of the analyses it depends on, the SQL of the shared views
+# it reads (3_analyses/_views/) and the hash of results.json, in
+# .pipeline_state/analyses.json. Tables read through a view count as tables
+# of the analysis. An analysis is stale when any of them
+# differs, or when it was computed in sample mode and is read outside it;
+# nothing here compares mtimes.
+#
+# In sample mode the outputs live in each analysis's _sample/ subfolder
+# (see output_dir() in pipeline/state.py) and their records in
+# .pipeline_state/analyses_sample.json, so the full-data ones are untouched.
+
+import os
+from pathlib import Path
+
+from pipeline.state import ROOT, SAMPLE, file_signature, hash_file, hash_text, output_dir
+
+ANALYSES_DIR = ROOT / "3_analyses"
+DEPENDS_PATTERN = r"^#\s*depends_on:\s*(.+)$"
+CACHE_FILE = "analyses_sample.json" if SAMPLE else "analyses.json"
+
+
+def discover_deps(code):
+    """Return the analyses named in `# depends_on:` comments of a run.py."""
+    import re  # compiled on first use, not when status.py imports this module
+
+    deps = []
+    for line in re.findall(DEPENDS_PATTERN, code, re.MULTILINE):
+        deps += [n.strip() for n in line.split(",") if n.strip()]
+    return deps
+
+
+def discover(analyses_dir=ANALYSES_DIR):
+    """Return {name: [dependencies]} for every subfolder with a run.py."""
+    found = {}
+    for d in sorted(analyses_dir.iterdir()):
+        if (
+            not d.is_dir()
+            or d.name.startswith((".", "_deprecated_", "__"))
+            or not (d / "run.py").exists()
+        ):
+            continue
+        found[d.name] = discover_deps((d / "run.py").read_text())
+    return found
+
+
+def cache_record(name, fingerprints, cache, analyses_dir=ANALYSES_DIR):
+    """Describe the inputs and output of a finished analysis for the cache."""
+    from pipeline.results import scan_results
+    from pipeline.views import discover_views, expand
+
+    folder = analyses_dir / name
+    results = output_dir(folder) / "results.json"
+    code = (folder / "run.py").read_text()
+    data, _ = scan_results(results)  # header only, rows are streamed
+    query = data.get("query", "")
+    views = discover_views()
+    used, words = expand(code + "\n" + query, views)
+    return {
+        "run_py": hash_text(code),
+        "run_py_sig": file_signature(folder / "run.py"),
+        "query": hash_text(query),
+        "tables": {t: fp for t, fp in (fingerprints or {}).items() if t.lower() in words},
+        "views": {v: hash_text(views[v]) for v in used},
+        "figures": [f.get("file") for f in data.get("figures", []) if isinstance(f, dict)],
+        "deps": {d: cache.get(d, {}).get("results_hash") for d in discover_deps(code)},
+        "results_sig": file_signature(results),
+        "results_hash": hash_file(results),
+        "sample": data.get("sample"),
+    }
+
+
+def stale_reason(name, fingerprints, cache, analyses_dir=ANALYSES_DIR):
+    """Return why an analysis must run, or None if its results.json is current."""
+    # status.py calls this for every analysis on every run: paths are plain
+    # strings, and files are re-hashed only when their size or mtime differs
+    # from the record
+    folder = os.path.join(analyses_dir, name)
+    record = cache.get(name)
+    outputs = output_dir(folder)
+    results = os.path.join(outputs, "results.json")
+    results_sig = file_signature(results)
+    if results_sig is None:
+        return "no results.json"
+    if record is None:
+        return "no cache record"
+    if fingerprints is None:
+        return "database missing or has no build manifest"
+    if record.get("sample") and record["sample"] != SAMPLE:
+        return f"computed on a {record['sample']} sample"
+    run_py = os.path.join(folder, "run.py")
+    if (
+        record.get("run_py_sig") != file_signature(run_py)
+        and hash_text(Path(run_py).read_text()) != record["run_py"]
+    ):
+        return "run.py changed"
+    changed = sorted(
+        t for t, fp in record["tables"].items() if fingerprints.get(t) != fp
+    )
+    if changed:
+        return f"tables changed: {', '.join(changed)}"
+    if record.get("views"):
+        from pipeline.views import discover_views
+
+        views = discover_views()
+        changed = sorted(
+            v for v, h in record["views"].items()
+            if v not in views or hash_text(views[v]) != h
+        )
+        if changed:
+            return f"views changed: {', '.join(changed)}"
+    changed = sorted(
+        d for d, h in record["deps"].items() if cache.get(d, {}).get("results_hash") != h
+    )
+    if changed:
+        return f"upstream results changed: {', '.join(changed)}"
+    missing = [f for f in record["figures"] if f and not os.path.exists(os.path.join(outputs, f))]
+    if missing:
+        return f"figures missing: {', '.join(missing)}"
+    if (
+        record.get("results_sig") != results_sig
+        and hash_file(results) != record["results_hash"]
+    ):
+        return "results.json modified outside the runner"
+    return None
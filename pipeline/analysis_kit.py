@@ -0,0 +1,312 @@
+# pipeline/analysis_kit.py
+# Declarative analyses: a run.py states its query, description and figures,
+# and the kit does the rest.
+#
+#   import sys
+#   from pathlib import Path
+#   sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+#   from pipeline.analysis_kit import Analysis
+#
+#   analysis = Analysis(
+#       query="SELECT category, COUNT(*) AS n FROM sales GROUP BY category",
+#       description="Number of sales per category",
+#   )
+#
+#   @analysis.figure("figures/bar_chart.pdf", caption="Sales per category")
+#   def bar_chart(df, plt):
+#       fig, ax = plt.subplots(figsize=(8, 5))
+#       df.plot.barh(x="category", y="n", ax=ax)
+#       return fig
+#
+#   analysis.run()
+#
+# run() finds project.duckdb from the project root (not the working
+# directory), runs the query on a read-only connection shared by every
+# analysis of the process, draws the figures and writes results.json (and a
+# results.parquet sidecar for large results) atomically. matplotlib is only
+# imported when the analysis declares a figure. Inside run_analyses.py's warm
+# workers the connection and the imports are paid once per worker, so a
+# batch of analyses pays Python, pandas and DuckDB startup once.
+#
+# Figures are cached: each is keyed by a hash of the results it is drawn from
+# and of its function's source, recorded with the hash of the file written
+# in .pipeline_state/figures/<analysis>.json (<analysis>_sample.json in
+# sample mode). A figure whose key is unchanged and whose file still has the
+# recorded content is not drawn again. The others are drawn in parallel in
+# forked processes (at most $PIPELINE_FIGURE_JOBS, default: CPU count), after
+# the kit's DuckDB connections are closed: their threads must not be running
+# across fork(). run_analyses.py divides the CPUs between isolated workers;
+# its warm workers keep their connection open and draw serially. Values a
+# figure function reads from outside its arguments are not part of the key:
+# change the function, or delete its file, to redraw after changing them.
+#
+# The query may name shared views declared in 3_analyses/_views/: they are
+# computed once per build and read from their stored copy (see
+# pipeline/views.py).
+#
+# In sample mode (make analyses SAMPLE=1%) the default database is
+# project_sample.duckdb, and results.json (marked with the sample size), its
+# sidecar and the figures are written to the _sample/ subfolder of the
+# analysis, leaving the full-data outputs in place.
+#
+# Plain run.py scripts keep working; the kit is optional.
+
+import hashlib
+import inspect
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from pipeline import profiling
+from pipeline.state import (
+    DB_PATH, SAMPLE, SAMPLE_DIR, atomic_path, hash_file, hash_text, output_dir, read_state,
+    write_state,
+)
+
+SIDECAR_ROWS = 10_000  # above this, rows go to results.parquet
+FIGURE_JOBS_ENV = "PIPELINE_FIGURE_JOBS"
+
+_connections = {}  # db path -> read-only connection, reused by every analysis
+_pending = None  # (analysis, folder, df) read by the forked figure workers
+
+
+def connection(db_path=DB_PATH):
+    """Return this process's read-only connection to `db_path`, opening it once.
+
+    `db_path` may also be a Parquet export directory (EXPORT_DIR), read
+    through views over its files (see pipeline/export.py).
+    """
+    key = str(Path(db_path).resolve())
+    if key not in _connections:
+        if Path(key).is_dir():
+            from pipeline.export import connect
+
+            _connections[key] = connect(key)
+        else:
+            import duckdb
+
+            _connections[key] = duckdb.connect(key, read_only=True)
+    return _connections[key]
+
+
+def close_connections(db_path=None):
+    """Close the connections opened by connection() (all, or the one to
+    `db_path`), e.g. once the database was rebuilt."""
+    keys = list(_connections) if db_path is None else [str(Path(db_path).resolve())]
+    for key in keys:
+        con = _connections.pop(key, None)
+        if con is not None:
+            con.close()
+
+
+def pyplot():
+    """Import matplotlib.pyplot with the non-interactive Agg backend."""
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    return plt
+
+
+def figure_jobs():
+    """Number of processes drawing figures ($PIPELINE_FIGURE_JOBS or CPU count)."""
+    return max(1, int(os.environ.get(FIGURE_JOBS_ENV, 0)) or os.cpu_count() or 1)
+
+
+def data_hash(df):
+    """Hash of a DataFrame's columns, dtypes and values."""
+    import pandas as pd
+
+    h = hashlib.sha256(hash_text(list(map(str, df.columns)), list(map(str, df.dtypes))).encode())
+    try:
+        h.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    except TypeError:  # unhashable cells (lists, dicts)
+        h.update(df.to_json(orient="split", index=False, default_handler=str).encode())
+    return h.hexdigest()
+
+
+def code_hash(fn):
+    """Hash of a function's source (of its bytecode if the source is unavailable)."""
+    try:
+        source = inspect.getsource(fn)
+    except (OSError, TypeError):
+        code = fn.__code__
+        source = code.co_code.hex() + repr(code.co_consts)
+    return hash_text(source)
+
+
+def _name(folder):
+    """Name of the analysis writing to `folder` (<analysis>_sample in sample mode)."""
+    return folder.parent.name + SAMPLE_DIR if folder.name == SAMPLE_DIR else folder.name
+
+
+def _draw_figure(i):
+    """Draw figure `i` of the pending analysis; return (file, sha256 of the file)."""
+    analysis, folder, df = _pending
+    file, _, fn = analysis.figures[i]
+    plt = pyplot()
+    fig = fn(df, plt)
+    if fig is None:
+        fig = plt.gcf()
+    path = folder / file
+    try:
+        with atomic_path(path) as tmp:
+            fig.savefig(tmp, format=path.suffix.lstrip(".") or None, bbox_inches="tight")
+    finally:
+        plt.close(fig)
+    return file, hash_file(path)
+
+
+class Analysis:
+    """One analysis: a query, its description and optional figures.
+
+    Args:
+        query: SQL run against project.duckdb (also stored in results.json)
+        description: what this analysis does (English)
+        interpretation: what the results mean; fill it after reviewing them
+        folder: where outputs are written (default: the working directory,
+            i.e. the analysis subfolder, as when running `python run.py`);
+            in sample mode, its _sample/ subfolder
+        db_path: database to query (default: 2_db/project.duckdb, or
+            project_sample.duckdb in sample mode); pass
+            EXPORT_DIR (from pipeline.export) to query the Parquet export
+        sidecar_rows: above this number of rows, results are written to
+            results.parquet instead of row dicts in results.json
+        figure_jobs: processes drawing figures (default: figure_jobs())
+    """
+
+    def __init__(self, query, description, interpretation="", folder=None,
+                 db_path=DB_PATH, sidecar_rows=SIDECAR_ROWS, figure_jobs=None):
+        self.query = query.strip()
+        self.description = description
+        self.interpretation = interpretation
+        self.folder = Path(folder) if folder is not None else None
+        self.db_path = Path(db_path)
+        self.sidecar_rows = sidecar_rows
+        self.figure_jobs = figure_jobs
+        self.figures = []  # (file, caption, function)
+        self.df = None
+
+    def figure(self, file, caption):
+        """Decorator declaring a figure drawn from the results.
+
+        The function receives the results DataFrame and matplotlib.pyplot,
+        and returns the Figure to save (or None to save the current one).
+
+        Args:
+            file: path relative to the analysis folder (e.g. "figures/top.pdf");
+                the format is taken from the extension
+            caption: what the figure shows
+        """
+        def register(fn):
+            self.figures.append((file, caption, fn))
+            return fn
+
+        return register
+
+    def fetch(self):
+        """Run the query and return the results as a DataFrame.
+
+        Shared views it names (3_analyses/_views/) are read from their stored
+        copy, computed first if this build has none yet. When profiling, the
+        query's time is recorded and a slow query keeps its DuckDB profile.
+        """
+        from pipeline.views import use_views
+
+        name = _name(output_dir(self.folder or Path.cwd()).resolve())
+        cursor = connection(self.db_path).cursor()
+        with profiling.ANALYSIS_CLOCK.measure("query"):
+            use_views(cursor, self.query, self.db_path)
+            with profiling.query_profile(cursor, "analyses", f"{name}/query"):
+                return cursor.sql(self.query).df()
+
+    def _render(self, folder, df, todo):
+        """Draw the figures at indices `todo`; return {file: sha256}."""
+        global _pending
+        pyplot()  # imported once here rather than in every forked process
+        jobs = min(self.figure_jobs or figure_jobs(), len(todo))
+        _pending = (self, folder, df)
+        try:
+            if jobs > 1 and "fork" in multiprocessing.get_all_start_methods():
+                # Forked children inherit the figure functions and the results,
+                # so neither has to be pickled. A child forked while DuckDB's
+                # worker threads hold a lock can deadlock on it: close the
+                # connections first (fetch() reopens them when needed)
+                close_connections()
+                context = multiprocessing.get_context("fork")
+                with ProcessPoolExecutor(max_workers=jobs, mp_context=context) as pool:
+                    return dict(pool.map(_draw_figure, todo))
+            return dict(map(_draw_figure, todo))
+        finally:
+            _pending = None
+
+    def _draw(self, folder, df):
+        """Draw the figures whose data or code changed. Returns how many were drawn."""
+        state = f"figures/{_name(folder)}.json"
+        cache = read_state(state, {})
+        data = data_hash(df)
+        keys, todo = {}, []
+        for i, (file, _, fn) in enumerate(self.figures):
+            keys[file] = hash_text(file, data, code_hash(fn))
+            entry = cache.get(file)
+            path = folder / file
+            if not (entry and entry["key"] == keys[file] and path.exists()
+                    and hash_file(path) == entry["sha"]):
+                todo.append(i)
+        drawn = self._render(folder, df, todo) if todo else {}
+        write_state(state, {
+            file: {"key": key, "sha": drawn.get(file) or cache[file]["sha"]}
+            for file, key in keys.items()
+        })
+        return len(todo)
+
+    def _write(self, folder, df):
+        sidecar = folder / "results.parquet"
+        results = None
+        if len(df) > self.sidecar_rows:
+            with atomic_path(sidecar) as tmp:
+                df.to_parquet(tmp, index=False)
+            results = {"file": sidecar.name}
+        output = {
+            "query": self.query,
+            "n_results": len(df),
+            "results": results if results is not None else df.to_dict(orient="records"),
+            "description": self.description,
+            "interpretation": self.interpretation,
+            "figures": [{"file": file, "caption": caption} for file, caption, _ in self.figures],
+        }
+        if SAMPLE:
+            output["sample"] = SAMPLE  # helpers.py refuses it outside sample mode
+        with atomic_path(folder / "results.json") as tmp:
+            with open(tmp, "w") as f:
+                json.dump(output, f, indent=2, ensure_ascii=False, default=str)
+        if results is None:
+            sidecar.unlink(missing_ok=True)  # only after results.json stopped using it
+
+    def run(self):
+        """Query the database, draw the figures and write results.json.
+
+        Returns the results DataFrame (also kept as `self.df`).
+        """
+        if not self.db_path.exists():
+            print(f"⚠ Skipping: database not found at {self.db_path}")
+            print("  Run 'make db' first.")
+            return None
+        folder = output_dir(self.folder or Path.cwd()).resolve()
+        folder.mkdir(exist_ok=True)
+        clock = profiling.ANALYSIS_CLOCK  # read by run_analyses.py --profile
+        self.df = df = self.fetch()
+        with clock.measure("figures"):
+            drawn = self._draw(folder, df) if self.figures else 0
+        with clock.measure("write"):
+            self._write(folder, df)
+        missing = [file for file, _, _ in self.figures if not (folder / file).is_file()]
+        if missing:
+            raise RuntimeError(f"figures listed in results.json were not written: {missing}")
+        print(f"✓ {len(df)} results → results.json"
+              + (f" + {len(self.figures)} figure(s), {drawn} drawn" if self.figures else ""))
+        return df
+
@@ -0,0 +1,1126 @@
+# pipeline/build.py
+# Incremental, parallel DuckDB build driven by 2_db/build_db.py.
+#
+# build_db.py declares every table with the raw files (in 1_data/) and the
+# upstream tables it reads; together they form a dependency graph (DAG).
+# A manifest stored inside project.duckdb (schema `_pipeline`) records a
+# content hash per source file and a fingerprint per table, so a rebuild only
+# re-imports and re-derives what actually changed.
+#
+# Tables without upstream tables (raw imports) are staged concurrently by
+# worker threads, each with its own in-memory DuckDB connection writing a
+# Parquet file. A single writer connection to project.duckdb loads staged
+# files and runs dependent tables as soon as their upstream tables are done.
+#
+# Raw files are best declared with `Build.source()`, which reads them with
+# DuckDB's native readers (format and encoding taken from 1_data/sources.yaml)
+# so they stream to disk in bounded memory instead of going through pandas.
+#
+# In sample mode ($PIPELINE_SAMPLE, e.g. `make db SAMPLE=1%`) the same build
+# writes project_sample.duckdb (and schema_sample.md), keeping a
+# deterministic, hash-based sample of every raw import; derived tables are
+# computed from the sampled ones. See sample_sql() and Build.table().
+
+import argparse
+import inspect
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import duckdb
+
+from pipeline import profiling
+from pipeline.export import EXPORT_DIR, read_manifest, remove_table, replace_dir, write_manifest
+from pipeline.fetch import PARTS_MANIFEST, read_parts
+from pipeline.lineage import db_record, record_db, restore_db_record
+from pipeline.sql import quote, sql_literal
+from pipeline.state import (
+    DB_PATH, MANIFEST_SCHEMA, ROOT, SAMPLE, SCHEMA_PATH, STATE_DIR, atomic_write, hash_file,
+    hash_text, read_state, table_fingerprints, write_state,
+)
+
+DATA_DIR = ROOT / "1_data"
+# The database and schema files replaced by the last build (see Build.rollback)
+ROLLBACK_DIR = STATE_DIR / "rollback"
+SOURCE_HASHES_FILE = "source_hashes.json"  # size/mtime/sha256 of sources, see _file_hashes
+
+# DuckDB table function for each `format` in sources.yaml (or file extension)
+READERS = {
+    "csv": "read_csv",
+    "tsv": "read_csv",
+    "txt": "read_csv",
+    "parquet": "read_parquet",
+    "json": "read_json",
+    "jsonl": "read_json",
+    "ndjson": "read_json",
+    "xlsx": "read_xlsx",
+}
+
+CSV_ENCODINGS = {"": "utf-8", "utf8": "utf-8", "iso-8859-1": "latin-1", "latin1": "latin-1"}
+
+
+def load_sources(data_dir=DATA_DIR):
+    """Return {file: entry} for every entry of 1_data/sources.yaml."""
+    import yaml
+
+    path = Path(data_dir) / "sources.yaml"
+    if not path.exists():
+        return {}
+    entries = yaml.safe_load(path.read_text()) or []
+    return {e["file"]: e for e in entries if isinstance(e, dict) and "file" in e}
+
+
+@dataclass
+class Table:
+    """A table declared in build_db.py.
+
+    Exactly one of `sql` (a SELECT statement) or `fn` (a callable taking the
+    connection and returning a DataFrame, Arrow table or DuckDB relation)
+    defines its contents.
+    """
+
+    name: str
+    sql: str = None
+    fn: object = None
+    sources: list = field(default_factory=list)
+    deps: list = field(default_factory=list)
+    partition_by: list = field(default_factory=list)
+    sample: bool = True
+    sample_by: list = field(default_factory=list)
+    sample_key: str = None
+
+    def definition(self):
+        """Text that identifies the table body; a change forces a rebuild."""
+        if self.sql is not None:
+            return " ".join(self.sql.split())
+        try:
+            return inspect.getsource(self.fn)
+        except (OSError, TypeError):
+            return getattr(self.fn, "__qualname__", repr(self.fn))
+
+
+class Build:
+    """Collects table declarations and builds project.duckdb incrementally."""
+
+    def __init__(self, db_path=DB_PATH, data_dir=DATA_DIR, schema_path=SCHEMA_PATH,
+                 export_dir=EXPORT_DIR, sample=SAMPLE):
+        self.db_path = Path(db_path)
+        self.sample = parse_fraction(sample) if sample else None
+        self.data_dir = Path(data_dir)
+        self.schema_path = Path(schema_path)
+        self.export_dir = Path(export_dir)
+        self.tables = {}
+        self.skipped = {}  # table -> why it is not built by this run
+        self._sources = None
+
+    # ── Declarations ─────────────────────────────────────────────
+    def table(self, name, sql=None, fn=None, sources=(), deps=(), partition_by=(),
+              sample=True, sample_by=(), sample_key=None):
+        """Declare a table.
+
+        Args:
+            name: table name in project.duckdb
+            sql: SELECT statement producing the table
+            fn: alternative to `sql` — callable(con) returning a DataFrame,
+                Arrow table or DuckDB relation. Tables without upstream
+                tables get a private in-memory connection and run in a
+                worker thread, so `con` cannot see project.duckdb there.
+            sources: raw files read by the table, relative to 1_data/
+            deps: upstream tables read by the table. Declared tables that
+                `sql` reads are detected automatically (from DuckDB's parse
+                tree: mentions in comments or strings do not count).
+            partition_by: columns the Parquet export (--export) is
+                Hive-partitioned by, e.g. ["year", "region"]
+            sample: in sample mode (make db SAMPLE=1%), keep only a sample of
+                this table; False keeps it whole (e.g. a small lookup table).
+                Only tables without upstream tables are sampled: the others
+                are derived from sampled tables.
+            sample_by: stratify the sample: keep the same fraction of every
+                group of these columns, at least one row per group
+            sample_key: sample whole values of this column instead of rows,
+                e.g. "customer_id": tables sampled on the same key keep the
+                same customers, so joins between them stay complete
+        """
+        if (sql is None) == (fn is None):
+            raise ValueError(f"Table '{name}': pass exactly one of sql= or fn=")
+        if name in self.tables:
+            raise ValueError(f"Table '{name}' is declared twice")
+        if sample_by and sample_key:
+            raise ValueError(f"Table '{name}': pass at most one of sample_by= or sample_key=")
+        self.tables[name] = Table(
+            name, sql, fn, list(sources), list(deps), list(partition_by),
+            sample, list(sample_by), sample_key,
+        )
+        return self.tables[name]
+
+    def source(self, name, file, partition_by=(), sample=True, sample_by=(), sample_key=None,
+               **options):
+        """Declare a table imported as-is from a raw file, without pandas.
+
+        The file is read by DuckDB's native reader for its `format` in
+        1_data/sources.yaml (falling back to the file extension), honouring
+        the `encoding` field for CSV files. Data streams straight to disk,
+        so peak memory stays bounded by --memory-limit whatever the size.
+
+        A directory (e.g. "trips/") is read as the Parquet parts written by
+        a fetch script (see pipeline/fetch.py), those listed in its manifest,
+        _parts.json, only: parts still being written are left out, and the
+        table is rebuilt when the manifest changes. Until a part is listed
+        the table is skipped, with the tables that read it; a copy built
+        earlier is kept.
+
+        Args:
+            name: table name in project.duckdb
+            file: path relative to 1_data/, as listed in sources.yaml
+            partition_by: columns the Parquet export is partitioned by
+            sample, sample_by, sample_key: how sample mode samples the
+                table (see table())
+            **options: extra reader options, e.g. delim=";" or sheet="Q4"
+        """
+        if self._sources is None:
+            self._sources = load_sources(self.data_dir)
+        sampling = {"sample": sample, "sample_by": sample_by, "sample_key": sample_key}
+        if file.endswith("/") or (self.data_dir / file).is_dir():
+            directory = file.rstrip("/")
+            parts = sorted(p["part"] for p in read_parts(self.data_dir / directory).values())
+            if not parts:
+                self.skipped[name] = (
+                    f"no parts fetched yet in 1_data/{directory}/ (run its fetch script)"
+                )
+                return None
+            args = [sql_literal([str(self.data_dir / directory / part) for part in parts])]
+            args += [f"{key} = {sql_literal(value)}" for key, value in sorted(options.items())]
+            return self.table(
+                name, sql=f"SELECT * FROM read_parquet({', '.join(args)})",
+                sources=[f"{directory}/{PARTS_MANIFEST}"], partition_by=partition_by, **sampling,
+            )
+        entry = self._sources.get(file, {})
+        fmt = str(entry.get("format") or Path(file).suffix.lstrip(".")).lower()
+        if fmt not in READERS:
+            raise ValueError(
+                f"Table '{name}': no native reader for format '{fmt}' ({file}). "
+                f"Supported: {', '.join(sorted(READERS))}. Use fn= instead."
+            )
+
+        encoding = str(entry.get("encoding") or "").lower()
+        if READERS[fmt] == "read_csv":
+            options.setdefault("encoding", CSV_ENCODINGS.get(encoding, encoding))
+            if fmt == "tsv":
+                options.setdefault("delim", "\t")
+        elif encoding not in ("", "utf-8", "utf8"):
+            raise ValueError(
+                f"Table '{name}': DuckDB reads {fmt.upper()} as UTF-8 only, but "
+                f"sources.yaml declares encoding '{encoding}' for {file}. Use fn= instead."
+            )
+
+        args = [sql_literal(str(self.data_dir / file))]
+        args += [f"{key} = {sql_literal(value)}" for key, value in sorted(options.items())]
+        sql = f"SELECT * FROM {READERS[fmt]}({', '.join(args)})"
+        return self.table(name, sql=sql, sources=[file], partition_by=partition_by, **sampling)
+
+    def _resolve(self):
+        """Complete each table's deps and return the tables in dependency order."""
+        parser = None  # in-memory connection parsing the tables' SQL
+        for t in self.tables.values():
+            for dep in t.deps:
+                if dep not in self.tables and dep not in self.skipped:
+                    raise ValueError(f"Table '{t.name}' depends on undeclared table '{dep}'")
+            if t.sql is not None:
+                if parser is None:
+                    parser = duckdb.connect()
+                names = referenced_tables(parser, t.sql)
+                if names is None:  # not a statement DuckDB serializes: match by name
+                    text = SQL_NOISE_RE.sub(" ", t.sql)
+                    names = {
+                        o.lower() for o in [*self.tables, *self.skipped]
+                        if re.search(rf"\b{re.escape(o)}\b", text)
+                    }
+                for other in [*self.tables, *self.skipped]:
+                    if other != t.name and other not in t.deps and other.lower() in names:
+                        t.deps.append(other)
+            if t.deps and (t.sample_by or t.sample_key):
+                raise ValueError(
+                    f"Table '{t.name}': sample_by=/sample_key= only apply to tables "
+                    "without upstream tables (the others are derived from sampled tables)"
+                )
+
+        if parser is not None:
+            parser.close()
+
+        # Tables reading a skipped table are skipped too
+        reading = True
+        while reading:
+            reading = [t for t in self.tables.values() if set(t.deps) & set(self.skipped)]
+            for t in reading:
+                del self.tables[t.name]
+                skipped = sorted(set(t.deps) & set(self.skipped))
+                self.skipped[t.name] = f"reads {', '.join(skipped)}, which is skipped"
+
+        order, seen, visiting = [], set(), set()
+
+        def visit(t, path):
+            if t.name in visiting:
+                raise ValueError(f"Dependency cycle: {' → '.join(path + [t.name])}")
+            if t.name in seen:
+                return
+            visiting.add(t.name)
+            for dep in t.deps:
+                visit(self.tables[dep], path + [t.name])
+            visiting.discard(t.name)
+            seen.add(t.name)
+            order.append(t)
+
+        for t in self.tables.values():
+            visit(t, [])
+        return order
+
+    # ── Manifest ─────────────────────────────────────────────────
+    def _init_manifest(self, con):
+        con.execute(f"CREATE SCHEMA IF NOT EXISTS {MANIFEST_SCHEMA}")
+        con.execute(f"""
+            CREATE TABLE IF NOT EXISTS {MANIFEST_SCHEMA}.files (
+                path VARCHAR PRIMARY KEY,
+                size BIGINT,
+                mtime_ns BIGINT,
+                sha256 VARCHAR
+            )
+        """)
+        con.execute(f"""
+            CREATE TABLE IF NOT EXISTS {MANIFEST_SCHEMA}.tables (
+                name VARCHAR PRIMARY KEY,
+                fingerprint VARCHAR,
+                built_at TIMESTAMP,
+                seconds DOUBLE
+            )
+        """)
+
+    def _has_manifest(self, con):
+        n = con.execute(
+            "SELECT COUNT(*) FROM duckdb_tables() WHERE schema_name = ? AND table_name = 'tables'",
+            [MANIFEST_SCHEMA],
+        ).fetchone()[0]
+        return n > 0
+
+    def _file_hashes(self, con):
+        """Hash every declared source file, reusing the hash stored in the
+        manifest of `con` (None: no manifest), or recorded in
+        .pipeline_state/source_hashes.json, when size and mtime are unchanged.
+
+        Returns ({file: sha256}, rows to store with _store_file_hashes()).
+        """
+        manifest = {} if con is None else {
+            path: (size, mtime_ns, sha)
+            for path, size, mtime_ns, sha in con.execute(
+                f"SELECT path, size, mtime_ns, sha256 FROM {MANIFEST_SCHEMA}.files"
+            ).fetchall()
+        }
+        recorded = read_state(SOURCE_HASHES_FILE, {})
+        hashes, updates = {}, []
+        for t in self.tables.values():
+            for src in t.sources:
+                if src in hashes:
+                    continue
+                p = self.data_dir / src
+                if not p.exists():
+                    raise FileNotFoundError(f"Table '{t.name}': source file not found: {p}")
+                st = p.stat()
+                for prev in (manifest.get(src), recorded.get(src)):
+                    if prev and prev[0] == st.st_size and prev[1] == st.st_mtime_ns:
+                        hashes[src] = prev[2]
+                        break
+                else:
+                    hashes[src] = hash_file(p)
+                if manifest.get(src) != (st.st_size, st.st_mtime_ns, hashes[src]):
+                    updates.append([src, st.st_size, st.st_mtime_ns, hashes[src]])
+        return hashes, updates
+
+    def _record_file_hashes(self, updates):
+        """Keep the new size/mtime of re-hashed sources outside the database,
+        so a build that writes no database (nothing to rebuild, failed
+        checks) does not hash them again next time."""
+        recorded = read_state(SOURCE_HASHES_FILE, {})
+        declared = {src for t in self.tables.values() for src in t.sources}
+        merged = {src: v for src, v in recorded.items() if src in declared}
+        merged.update({src: [size, mtime_ns, sha] for src, size, mtime_ns, sha in updates})
+        if merged != recorded:
+            write_state(SOURCE_HASHES_FILE, merged)
+
+    def _store_file_hashes(self, con, updates):
+        if updates:
+            con.executemany(
+                f"INSERT OR REPLACE INTO {MANIFEST_SCHEMA}.files VALUES (?, ?, ?, ?)", updates
+            )
+
+    def _built(self, con):
+        """{table: fingerprint} of the tables present in the database of `con`."""
+        return dict(con.execute(
+            f"SELECT m.name, m.fingerprint FROM {MANIFEST_SCHEMA}.tables m "
+            "JOIN duckdb_tables() t ON t.table_name = m.name AND t.schema_name = 'main'"
+        ).fetchall())
+
+    def _fingerprints(self, order, file_hashes):
+        """Fingerprint of each table: its definition, source hashes and the
+        fingerprints of its upstream tables."""
+        fps = {}
+        for t in order:
+            # Source paths in generated SQL are absolute: hash them relative to
+            # 1_data/ so moving or copying the project does not force a rebuild
+            definition = t.definition().replace(str(self.data_dir), "1_data")
+            parts = [
+                definition,
+                {src: file_hashes[src] for src in t.sources},
+                {dep: fps[dep] for dep in sorted(t.deps)},
+            ]
+            if self._sampled(t):
+                parts.append(["sample", self.sample, t.sample_by, t.sample_key])
+            fps[t.name] = hash_text(*parts)
+        return fps
+
+    # ── Execution ────────────────────────────────────────────────
+    def _select(self, con, t):
+        """Return a SQL expression (a SELECT or a view name) for the table body."""
+        if t.sql is not None:
+            return t.sql
+        with profiling.timed("build", f"{t.name}/fn"):
+            result = t.fn(con)
+        if isinstance(result, duckdb.DuckDBPyRelation):
+            result.create_view("_build_result")
+        else:
+            con.register("_build_result", result)
+        return "SELECT * FROM _build_result"
+
+    def _run_statement(self, con, t, statement, sql):
+        """Execute `sql` for table `t`. When profiling, record its time and keep
+        DuckDB's query profile (the EXPLAIN ANALYZE tree) if it was slow."""
+        with profiling.query_profile(con, "build", f"{t.name}/{statement}"):
+            con.execute(sql)
+
+    def _sampled(self, t):
+        """Whether `t` is sampled in this build (sample mode, raw import)."""
+        return bool(self.sample and t.sample and not t.deps)
+
+    def _stage(self, t, stage_dir, threads, memory_limit):
+        """Worker thread: materialize a table without upstream tables to Parquet."""
+        start = time.perf_counter()
+        path = stage_dir / f"{t.name}.parquet"
+        con = duckdb.connect()
+        try:
+            con.execute(f"SET threads = {threads}")
+            con.execute(f"SET temp_directory = {sql_literal(f'{stage_dir / t.name}.tmp')}")
+            if memory_limit:
+                limit_memory(con, memory_limit)
+            select = self._select(con, t)
+            if self._sampled(t):
+                select = sample_sql(select, self.sample, t.sample_by, t.sample_key)
+            self._run_statement(
+                con, t, "stage", f"COPY ({select}) TO {sql_literal(str(path))} (FORMAT parquet)"
+            )
+        finally:
+            con.close()
+        return path, time.perf_counter() - start
+
+    def _commit(self, con, t, select, fingerprint, seconds):
+        """Writer: create the table from `select` and record it in the manifest."""
+        start = time.perf_counter()
+        con.execute("BEGIN TRANSACTION")
+        try:
+            self._run_statement(
+                con, t, "create", f"CREATE OR REPLACE TABLE {quote(t.name)} AS {select}"
+            )
+            seconds += time.perf_counter() - start
+            con.execute(
+                f"INSERT OR REPLACE INTO {MANIFEST_SCHEMA}.tables "
+                "VALUES (?, ?, current_timestamp, ?)",
+                [t.name, fingerprint, seconds],
+            )
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+        finally:
+            con.execute("DROP VIEW IF EXISTS _build_result")
+        return seconds
+
+    def _execute(self, con, order, fingerprints, built, jobs, worker_limit):
+        """Build every table whose fingerprint changed, staging independent
+        imports in parallel. Returns {table: wall seconds} for built tables.
+
+        `worker_limit` is the memory limit of each staging worker (None: no limit).
+        """
+        todo = [t for t in order if built.get(t.name) != fingerprints[t.name]]
+        done = {t.name for t in order} - {t.name for t in todo}
+        for t in order:
+            if t.name in done:
+                print(f"  · {t.name}: unchanged")
+        timings = {}
+
+        stage_dir = Path(tempfile.mkdtemp(prefix=".staging-", dir=self.db_path.parent))
+        threads = max(1, (os.cpu_count() or 1) // jobs)
+        try:
+            with ThreadPoolExecutor(max_workers=jobs) as pool:
+                staging = {
+                    pool.submit(self._stage, t, stage_dir, threads, worker_limit): t
+                    for t in todo if not t.deps
+                }
+                remaining = [t for t in todo if t.deps]
+                while staging or remaining:
+                    ready = [t for t in remaining if set(t.deps) <= done]
+                    if ready:
+                        finished = [f for f in staging if f.done()]
+                    elif staging:
+                        finished, _ = wait(staging, return_when=FIRST_COMPLETED)
+                    else:
+                        raise RuntimeError("Build stalled: unmet dependencies")
+
+                    for f in finished:
+                        t = staging.pop(f)
+                        try:
+                            path, stage_seconds = f.result()
+                        except Exception:
+                            for other in staging:
+                                other.cancel()
+                            raise
+                        select = f"SELECT * FROM read_parquet({sql_literal(str(path))})"
+                        timings[t.name] = self._commit(
+                            con, t, select, fingerprints[t.name], stage_seconds
+                        )
+                        path.unlink()
+                        done.add(t.name)
+                        print(f"  ✓ {t.name}: {timings[t.name]:.2f}s "
+                              f"(staged in {stage_seconds:.2f}s)")
+
+                    for t in ready:
+                        remaining.remove(t)
+                        timings[t.name] = self._commit(
+                            con, t, self._select(con, t), fingerprints[t.name], 0.0
+                        )
+                        done.add(t.name)
+                        print(f"  ✓ {t.name}: {timings[t.name]:.2f}s")
+        finally:
+            shutil.rmtree(stage_dir, ignore_errors=True)
+        return timings
+
+    # ── Parquet export ───────────────────────────────────────────
+    def _export(self, con, order, fingerprints):
+        """Export every table whose export is missing or out of date to
+        Hive-partitioned Parquet in export_dir (see pipeline/export.py)."""
+        self.export_dir.mkdir(parents=True, exist_ok=True)
+        manifest = read_manifest(self.export_dir)
+        for t in order:
+            entry = manifest.get(t.name)
+            if (
+                entry and entry["fingerprint"] == fingerprints[t.name]
+                and entry["partition_by"] == t.partition_by
+                and (self.export_dir / t.name).is_dir()
+            ):
+                continue
+            start = time.perf_counter()
+            tmp = Path(tempfile.mkdtemp(prefix=f".{t.name}.", dir=self.export_dir))
+            try:
+                if t.partition_by:
+                    target = tmp
+                    options = f"FORMAT parquet, PARTITION_BY ({', '.join(map(quote, t.partition_by))})"
+                else:
+                    target, options = tmp / "data_0.parquet", "FORMAT parquet"
+                self._run_statement(
+                    con, t, "export",
+                    f"COPY (SELECT * FROM {quote(t.name)}) TO {sql_literal(str(target))} ({options})",
+                )
+                replace_dir(tmp, self.export_dir / t.name)
+            except BaseException:
+                shutil.rmtree(tmp, ignore_errors=True)
+                raise
+            columns = con.execute(
+                "SELECT column_name, data_type FROM duckdb_columns() "
+                "WHERE schema_name = 'main' AND table_name = ? ORDER BY column_index",
+                [t.name],
+            ).fetchall()
+            manifest[t.name] = {
+                "fingerprint": fingerprints[t.name],
+                "partition_by": t.partition_by,
+                "columns": [list(c) for c in columns],
+            }
+            write_manifest(manifest, self.export_dir)
+            by = f", partitioned by {', '.join(t.partition_by)}" if t.partition_by else ""
+            print(f"  ✓ {t.name}: exported in {time.perf_counter() - start:.2f}s{by}")
+        self._prune_exports(manifest, fingerprints)
+
+    def _prune_exports(self, manifest, fingerprints, reason=None):
+        """Delete exports of tables that are no longer declared or, with
+        `reason`, no longer match their table."""
+        removed = []
+        for name, entry in sorted(manifest.items()):
+            if name not in self.tables or (
+                reason and entry["fingerprint"] != fingerprints.get(name)
+            ):
+                remove_table(name, self.export_dir)
+                removed.append(name)
+        if removed:
+            for name in removed:
+                del manifest[name]
+            write_manifest(manifest, self.export_dir)
+            if reason:
+                print(f"  ⚠ Parquet export removed ({reason}): {', '.join(removed)}")
+
+    def _record_lineage(self, file_hashes, fingerprints):
+        """Record the content hashes this build read in .pipeline_state/lineage.json."""
+        inputs = {self.data_dir / src: sha for src, sha in file_hashes.items()}
+        script = getattr(sys.modules["__main__"], "__file__", None)
+        if script:
+            inputs[Path(script)] = hash_file(script)
+        if self._sources is not None and (self.data_dir / "sources.yaml").exists():
+            inputs[self.data_dir / "sources.yaml"] = hash_file(self.data_dir / "sources.yaml")
+        record_db(self.db_path, inputs, fingerprints)
+
+    def run(self, argv=None):
+        """Parse command-line flags and build the database."""
+        parser = argparse.ArgumentParser(description="Build project.duckdb from 1_data/")
+        parser.add_argument(
+            "--full", action="store_true",
+            help="rebuild every table from scratch",
+        )
+        parser.add_argument(
+            "--no-checks", action="store_true",
+            help="swap the new database in without integrity checks",
+        )
+        parser.add_argument(
+            "--max-row-change", type=float, default=0.5, metavar="FRACTION",
+            help="largest row count change of a rebuilt table vs. the previous build "
+                 "(default: 0.5 = ±50%%)",
+        )
+        parser.add_argument(
+            "--rollback", action="store_true",
+            help="swap back the database and schema replaced by the last build",
+        )
+        parser.add_argument(
+            "-j", "--jobs", type=int, default=os.cpu_count() or 1,
+            help="number of raw imports staged concurrently (default: CPU count)",
+        )
+        parser.add_argument(
+            "--memory-limit", metavar="SIZE",
+            help="total DuckDB memory budget, e.g. 8GB (default: DuckDB's 80%% of RAM)",
+        )
+        parser.add_argument(
+            "--exact-counts", action="store_true",
+            help="count rows exactly in schema.md instead of using catalog estimates",
+        )
+        parser.add_argument(
+            "--stats", action="store_true",
+            help="add min/max/null fraction/distinct estimates per column to schema.md",
+        )
+        parser.add_argument(
+            "--export", action="store_true",
+            help="also export every table to Hive-partitioned Parquet in 2_db/parquet/",
+        )
+        parser.add_argument(
+            "--profile", action="store_true",
+            help="record per-statement timings in .pipeline_state/timings.jsonl",
+        )
+        args = parser.parse_args(argv)
+        if args.rollback:
+            sys.exit(self.rollback())
+        if args.profile or profiling.enabled():
+            profiling.enable()
+        order = self._resolve()
+
+        start = time.perf_counter()
+        if self.sample:
+            print(f"▶ Sample mode: {self.sample * 100:g}% of every raw table → {self.db_path.name}")
+        for name, reason in self.skipped.items():
+            print(f"  ⚠ {name}: skipped, {reason}")
+        full = args.full or not self.db_path.exists()
+        built, previous_rows = {}, {}
+        # Plan against the current database, read-only: readers keep using it
+        current = duckdb.connect(str(self.db_path), read_only=True) if self.db_path.exists() else None
+        try:
+            if not full and not self._has_manifest(current):
+                print("⚠ No build manifest found, doing a full rebuild")
+                full = True
+            with profiling.timed("build", "hash sources"):
+                file_hashes, updates = self._file_hashes(None if full else current)
+            self._record_file_hashes(updates)
+            fingerprints = self._fingerprints(order, file_hashes)
+            if not full:
+                built = self._built(current)
+            todo = [t.name for t in order if built.get(t.name) != fingerprints[t.name]]
+            dropped = sorted(set(built) - set(self.tables) - set(self.skipped))
+            if current is not None:
+                previous_rows = self._row_counts(current, todo)
+            if not (full or todo or dropped):
+                timings = self._finish_unchanged(current, order, fingerprints, args)
+        finally:
+            if current is not None:
+                current.close()
+
+        if full or todo or dropped:
+            timings = self._build_and_swap(
+                order, fingerprints, built, updates, previous_rows, full, args,
+            )
+        self._record_lineage(file_hashes, fingerprints)
+
+        elapsed = time.perf_counter() - start
+        profiling.record(
+            "build", "total", elapsed, peak_rss_mb=profiling.peak_rss_mb(),
+            tables=len(timings),
+        )
+        mode = "full rebuild" if full else f"{len(timings)}/{len(self.tables)} table(s) rebuilt"
+        print(f"✓ Database built in {elapsed:.2f}s: {self.db_path} ({mode})")
+        if timings:
+            slowest = sorted(timings.items(), key=lambda kv: -kv[1])[:5]
+            print("  Slowest: " + ", ".join(f"{n} {s:.2f}s" for n, s in slowest))
+
+    def _finish_unchanged(self, con, order, fingerprints, args):
+        """Nothing to rebuild: export and refresh schema.md from the current
+        database, without writing to it. Returns {} (no table built)."""
+        for t in order:
+            print(f"  · {t.name}: unchanged")
+        self._sync_exports(con, order, fingerprints, args.export)
+        if args.exact_counts or args.stats or not self.schema_path.exists():
+            with profiling.timed("build", "schema"):
+                write_schema(
+                    con, self.schema_path, exact_counts=args.exact_counts,
+                    stats=args.stats, fingerprints=fingerprints,
+                )
+            print(f"✓ Schema written: {self.schema_path} "
+                  f"(+ {self.schema_path.with_suffix('.json').name})")
+        return {}
+
+    def _sync_exports(self, con, order, fingerprints, export):
+        if export:
+            with profiling.timed("build", "export"):
+                self._export(con, order, fingerprints)
+        elif read_manifest(self.export_dir):
+            # Never leave an export that disagrees with the database
+            self._prune_exports(
+                read_manifest(self.export_dir), fingerprints,
+                reason="out of date, run make db EXPORT=1",
+            )
+
+    def _build_and_swap(self, order, fingerprints, built, updates, previous_rows, full, args):
+        """Build into a copy of the database, check it, then swap it in.
+
+        Returns {table: wall seconds} for the tables built.
+        """
+        tmp_db, tmp_schema = self._temp_paths()
+        self._discard(tmp_db, tmp_schema)  # left over by a crashed build
+        if not full:
+            with profiling.timed("build", "copy"):
+                clone_file(self.db_path, tmp_db)
+        con = duckdb.connect(str(tmp_db))
+        jobs = max(1, args.jobs)
+        # The writer and every staging worker are separate DuckDB instances:
+        # each gets an equal share of the budget
+        share = args.memory_limit and f"{parse_bytes(args.memory_limit) // (jobs + 1)}B"
+        try:
+            if share:
+                limit_memory(con, share)
+            self._init_manifest(con)
+            self._store_file_hashes(con, updates)
+
+            # Tables that were removed from build_db.py
+            for name in sorted(set(built) - set(self.tables) - set(self.skipped)):
+                con.execute(f"DROP TABLE IF EXISTS {quote(name)}")
+                con.execute(f"DELETE FROM {MANIFEST_SCHEMA}.tables WHERE name = ?", [name])
+                print(f"  ✗ {name}: dropped (no longer declared)")
+
+            timings = self._execute(
+                con, order, fingerprints, built, jobs, share
+            )
+            if not args.no_checks:
+                issues = self._check(con, order, previous_rows, args.max_row_change)
+                if issues:
+                    print(f"✗ Integrity checks failed, {self.db_path.name} left unchanged:")
+                    for issue in issues:
+                        print(f"  - {issue}")
+                    print("  Allow larger changes with --max-row-change, or skip with --no-checks.")
+                    raise SystemExit(1)
+            self._sync_exports(con, order, fingerprints, args.export)
+            with profiling.timed("build", "schema"):
+                write_schema(
+                    con, self.schema_path, exact_counts=args.exact_counts,
+                    stats=args.stats, fingerprints=fingerprints, out_path=tmp_schema,
+                )
+            con.execute("CHECKPOINT")
+        except BaseException as e:
+            con.close()
+            self._discard(tmp_db, tmp_schema)
+            if not isinstance(e, SystemExit):
+                print(f"✗ Build failed, {self.db_path.name} left unchanged")
+            raise
+        con.close()
+        self._swap(tmp_db, tmp_schema)
+        print(f"✓ Schema written: {self.schema_path} (+ {self.schema_path.with_suffix('.json').name})")
+        return timings
+
+    # ── Integrity checks and swap ────────────────────────────────
+    def _row_counts(self, con, tables):
+        """{table: COUNT(*)} for the given tables present in the database of `con`."""
+        present = {
+            name for (name,) in con.execute(
+                "SELECT table_name FROM duckdb_tables() WHERE schema_name = 'main'"
+            ).fetchall()
+        }
+        return {
+            t: con.execute(f"SELECT COUNT(*) FROM {quote(t)}").fetchone()[0]
+            for t in tables if t in present
+        }
+
+    def _check(self, con, order, previous_rows, max_row_change):
+        """Check the new database before it replaces the current one: every
+        declared table exists, and the row count of every rebuilt table moved
+        by at most `max_row_change` (a fraction) from the previous build.
+        Tables reading fetched parts, which only ever grow, are only checked
+        for shrinking. Returns the list of issues (empty = passed)."""
+        appending = set()
+        for t in order:
+            if any(src.endswith(f"/{PARTS_MANIFEST}") for src in t.sources) or (
+                appending.intersection(t.deps)
+            ):
+                appending.add(t.name)
+        issues = []
+        present = {
+            name for (name,) in con.execute(
+                "SELECT table_name FROM duckdb_tables() WHERE schema_name = 'main'"
+            ).fetchall()
+        }
+        missing = sorted(set(self.tables) - present)
+        if missing:
+            issues.append(f"missing tables: {', '.join(missing)}")
+        for table, rows in self._row_counts(con, previous_rows).items():
+            before = previous_rows[table]
+            if before == 0:
+                continue
+            change = (rows - before) / before
+            if (-change if table in appending else abs(change)) > max_row_change:
+                issues.append(f"{table}: {before:,} → {rows:,} rows ({change:+.0%})")
+        return issues
+
+    def _temp_paths(self):
+        return (
+            self.db_path.with_name(f".{self.db_path.name}.building"),
+            self.schema_path.with_name(f".{self.schema_path.name}.building"),
+        )
+
+    def _discard(self, tmp_db, tmp_schema):
+        for p in (tmp_db, Path(f"{tmp_db}.wal"), tmp_schema, tmp_schema.with_suffix(".json")):
+            p.unlink(missing_ok=True)
+
+    @property
+    def _rollback_record(self):
+        """State file holding the lineage record of the kept database."""
+        return f"{ROLLBACK_DIR.name}/{self.db_path.stem}.lineage.json"
+
+    def _swap_pairs(self, tmp_db=None, tmp_schema=None):
+        """(live path, replacement) of the database, schema.md and schema.json."""
+        schema_json = self.schema_path.with_suffix(".json")
+        return [
+            (self.db_path, tmp_db),
+            (self.schema_path, tmp_schema),
+            (schema_json, tmp_schema and tmp_schema.with_suffix(".json")),
+        ]
+
+    def _swap(self, tmp_db, tmp_schema):
+        """Rename the new database and schema into place, keeping the current
+        ones (and their lineage record) in ROLLBACK_DIR."""
+        ROLLBACK_DIR.mkdir(parents=True, exist_ok=True)
+        write_state(self._rollback_record, db_record(self.db_path))
+        for live, new in self._swap_pairs(tmp_db, tmp_schema):
+            keep = ROLLBACK_DIR / live.name
+            keep.unlink(missing_ok=True)
+            if live.exists():
+                link_or_copy(live, keep)
+            os.replace(new, live)  # readers keep the file they opened
+
+    def rollback(self):
+        """Swap the database and schema with the ones the last build replaced.
+        Rolling back twice restores the newer build."""
+        if not (ROLLBACK_DIR / self.db_path.name).exists():
+            print("✗ No previous database to roll back to (kept by the last successful build)")
+            return 1
+        record = read_state(self._rollback_record)
+        write_state(self._rollback_record, db_record(self.db_path))
+        for live, _ in self._swap_pairs():
+            keep = ROLLBACK_DIR / live.name
+            if not keep.exists():
+                continue
+            swap = keep.with_name(f".{keep.name}.swap")
+            swap.unlink(missing_ok=True)
+            if live.exists():
+                link_or_copy(live, swap)
+            os.replace(keep, live)
+            if swap.exists():
+                os.replace(swap, keep)
+        if record is not None:
+            restore_db_record(self.db_path, record)
+        manifest = read_manifest(self.export_dir)
+        if manifest:
+            self._prune_exports(
+                manifest, table_fingerprints(self.db_path) or {},
+                reason="built from the replaced database, run make db EXPORT=1",
+            )
+        print(f"✓ Rolled back {self.db_path} and {self.schema_path.name} to the previous build")
+        return 0
+
+def clone_file(src, dst):
+    """Copy `src` to `dst`, in the kernel (and as a reflink on filesystems
+    that support it) when possible."""
+    with open(src, "rb") as fin, open(dst, "wb") as fout:
+        try:
+            remaining = os.fstat(fin.fileno()).st_size
+            while remaining > 0:
+                n = os.copy_file_range(fin.fileno(), fout.fileno(), remaining)
+                if n == 0:
+                    break
+                remaining -= n
+        except (AttributeError, OSError):  # not Linux, or unsupported
+            fin.seek(0)
+            fout.seek(0)
+            fout.truncate()
+            shutil.copyfileobj(fin, fout, 1 << 24)
+
+
+def link_or_copy(src, dst):
+    """Hard-link `src` to `dst` (copy across filesystems): a rename replacing
+    `src` afterwards leaves `dst` with the old content."""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+SAMPLE_BUCKETS = 1_000_000  # resolution of the sampled fraction
+
+
+def parse_fraction(value):
+    """Parse a sample size: "1%" or 0.01 → 0.01."""
+    text = str(value).strip()
+    try:
+        fraction = float(text[:-1]) / 100 if text.endswith("%") else float(text)
+    except ValueError:
+        fraction = None
+    if fraction is None or not 0 < fraction <= 1:
+        raise ValueError(f"Invalid sample size '{value}': use e.g. SAMPLE=1% or SAMPLE=0.01")
+    return fraction
+
+
+def sample_sql(select, fraction, by=(), key=None):
+    """Wrap `select` so it keeps a deterministic `fraction` of its rows.
+
+    Rows are chosen by hash, so the same inputs always give the same sample,
+    whatever the number of threads:
+    - by default, rows whose hash (of every column) falls in the fraction;
+    - with `key`, rows whose `key` value hashes into it, so tables sampled
+      on the same key keep the same key values;
+    - with `by`, in each group of those columns, the ceil(fraction × n) rows
+      of lowest hash (stratified: every group keeps at least one row).
+    """
+    if by:
+        groups = ", ".join(map(quote, by))
+        return (
+            f"SELECT * FROM ({select}) AS _sample "
+            f"QUALIFY row_number() OVER (PARTITION BY {groups} ORDER BY hash(_sample)) "
+            f"<= ceil({fraction!r} * count(*) OVER (PARTITION BY {groups}))"
+        )
+    hashed = f"_sample.{quote(key)}" if key else "_sample"
+    threshold = round(fraction * SAMPLE_BUCKETS)
+    return (
+        f"SELECT * FROM ({select}) AS _sample "
+        f"WHERE hash({hashed}) % {SAMPLE_BUCKETS} < {threshold}"
+    )
+
+
+SQL_NOISE_RE = re.compile(r"--[^\n]*|/\*.*?\*/|'(?:[^']|'')*'", re.DOTALL)  # comments, strings
+
+
+def referenced_tables(con, sql):
+    """Lowercase names of the tables a SELECT reads, from DuckDB's parse tree
+    (json_serialize_sql): names in comments, string literals or column
+    references do not count, nor do its CTEs. Tables of schemas other than
+    main are left out. Returns None if DuckDB cannot serialize `sql`.
+    """
+    tree = json.loads(con.execute("SELECT json_serialize_sql(?)", [sql]).fetchone()[0])
+    if tree.get("error"):
+        return None
+    tables, ctes = set(), set()
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(node)
+        elif isinstance(node, dict):
+            if node.get("type") == "BASE_TABLE" and node.get("schema_name") in ("", "main"):
+                tables.add(node["table_name"].lower())
+            if isinstance(node.get("cte_map"), dict):
+                ctes.update(entry["key"].lower() for entry in node["cte_map"].get("map", []))
+            stack.extend(node.values())
+    return tables - ctes
+
+
+def parse_bytes(size):
+    """Parse a size such as "8GB", "512MiB" or "1000000" into bytes."""
+    m = re.fullmatch(r"\s*([\d.]+)\s*([kmgt]?)(i?)b?\s*", str(size), re.IGNORECASE)
+    if not m:
+        raise ValueError(f"Invalid memory size: {size!r}")
+    base = 1024 if m.group(3) or not m.group(2) else 1000
+    power = " kmgt".index(m.group(2).lower() or " ")
+    return int(float(m.group(1)) * base**power)
+
+
+def limit_memory(con, memory_limit):
+    """Cap DuckDB memory on `con`; larger-than-memory work spills to disk.
+
+    Insertion order is not preserved under a limit, which lets DuckDB stream
+    imports without buffering them.
+    """
+    con.execute(f"SET memory_limit = '{parse_bytes(memory_limit)}B'")
+    con.execute("SET preserve_insertion_order = false")
+
+
+# ── Generate schema.md / schema.json ────────────────────────────
+NESTED_TYPES = ("[", "STRUCT", "MAP", "UNION")
+
+
+def _column_stats(con, table, columns):
+    """Min, max, null fraction and approximate distinct count of every
+    column, computed in a single scan of the table."""
+    exprs = ["COUNT(*)"]
+    for col in columns:
+        q = quote(col["name"])
+        exprs.append(f"COUNT({q})")
+        if any(t in col["type"].upper() for t in NESTED_TYPES):
+            exprs += ["NULL", "NULL", "NULL"]
+        else:
+            exprs += [f"MIN({q})::VARCHAR", f"MAX({q})::VARCHAR", f"approx_count_distinct({q})"]
+    row = con.execute(f"SELECT {', '.join(exprs)} FROM {quote(table)}").fetchone()
+    n = row[0]
+    stats = {}
+    for i, col in enumerate(columns):
+        non_null, lo, hi, distinct = row[1 + 4 * i: 5 + 4 * i]
+        stats[col["name"]] = {
+            "min": lo,
+            "max": hi,
+            "null_fraction": round(1 - non_null / n, 4) if n else None,
+            "distinct_estimate": distinct,
+        }
+    return n, stats
+
+
+def _cell(value, width=30):
+    """Format a value for a Markdown table cell."""
+    if value is None:
+        return ""
+    text = str(value).replace("|", "\\|").replace("\n", " ")
+    return text if len(text) <= width else text[: width - 1] + "…"
+
+
+def write_schema(con, schema_path, exact_counts=False, stats=False, fingerprints=None,
+                 out_path=None):
+    """Write schema.md and schema.json describing every table in the main schema.
+
+    Columns and row estimates come from two catalog queries (duckdb_tables(),
+    duckdb_columns()), so no table is scanned unless requested.
+
+    Args:
+        con: connection to the database
+        schema_path: path of schema.md; schema.json is written next to it
+        exact_counts: run COUNT(*) on every table instead of using estimates
+        stats: add per-column min/max/null fraction/distinct estimate,
+            computed in one scan per table
+        fingerprints: {table: build fingerprint}. Counts and stats of tables
+            whose fingerprint matches the previous schema.json are reused.
+        out_path: where to write schema.md (and its .json) instead of
+            `schema_path`, whose schema.json is still the one reused
+    """
+    schema_path = Path(schema_path)
+    json_path = schema_path.with_suffix(".json")
+    out_path = Path(out_path or schema_path)
+    fingerprints = fingerprints or {}
+    previous = {}
+    if json_path.exists():
+        try:
+            previous = {t["name"]: t for t in json.loads(json_path.read_text())["tables"]}
+        except (ValueError, KeyError, TypeError):
+            previous = {}
+
+    tables = con.execute("""
+        SELECT table_name, estimated_size FROM duckdb_tables()
+        WHERE database_name = current_database() AND schema_name = 'main'
+        ORDER BY table_name
+    """).fetchall()
+    columns = {}
+    for table, column, dtype, nullable in con.execute("""
+        SELECT table_name, column_name, data_type, is_nullable FROM duckdb_columns()
+        WHERE database_name = current_database() AND schema_name = 'main'
+        ORDER BY table_name, column_index
+    """).fetchall():
+        columns.setdefault(table, []).append(
+            {"name": column, "type": dtype, "nullable": bool(nullable)}
+        )
+
+    result = []
+    for table, estimated in tables:
+        entry = {
+            "name": table,
+            "rows": estimated,
+            "rows_exact": False,
+            "fingerprint": fingerprints.get(table),
+            "columns": columns.get(table, []),
+        }
+        prev = previous.get(table, {})
+        reuse = entry["fingerprint"] is not None and prev.get("fingerprint") == entry["fingerprint"]
+
+        if stats:
+            prev_stats = {c["name"]: c.get("stats") for c in prev.get("columns", [])}
+            if reuse and all(prev_stats.get(c["name"]) for c in entry["columns"]):
+                col_stats = prev_stats
+                entry["rows"], entry["rows_exact"] = prev["rows"], prev["rows_exact"]
+            else:
+                entry["rows"], col_stats = _column_stats(con, table, entry["columns"])
+                entry["rows_exact"] = True
+            for c in entry["columns"]:
+                c["stats"] = col_stats[c["name"]]
+        elif exact_counts:
+            if reuse and prev.get("rows_exact"):
+                entry["rows"] = prev["rows"]
+            else:
+                entry["rows"] = con.execute(f"SELECT COUNT(*) FROM {quote(table)}").fetchone()[0]
+            entry["rows_exact"] = True
+        result.append(entry)
+
+    atomic_write(
+        out_path.with_suffix(".json"),
+        json.dumps({"tables": result}, indent=2, ensure_ascii=False),
+    )
+
+    schema_lines = ["# Database Schema\n"]
+    schema_lines.append("_Auto-generated by `build_db.py`. Do not edit manually._\n")
+    schema_lines.append("_Run `make db` to rebuild the database and regenerate this file._\n")
+    for entry in result:
+        approx = "" if entry["rows_exact"] else "~"
+        schema_lines.append(f"\n## `{entry['name']}` ({approx}{entry['rows']:,} rows)\n")
+        if stats:
+            schema_lines.append("| Column | Type | Nullable | Min | Max | Nulls | Distinct (≈) |")
+            schema_lines.append("|--------|------|----------|-----|-----|-------|--------------|")
+        else:
+            schema_lines.append("| Column | Type | Nullable |")
+            schema_lines.append("|--------|------|----------|")
+        for c in entry["columns"]:
+            line = f"| `{c['name']}` | {c['type']} | {'YES' if c['nullable'] else 'NO'} |"
+            if stats:
+                st = c["stats"]
+                nulls = "" if st["null_fraction"] is None else f"{st['null_fraction']:.1%}"
+                line += (
+                    f" {_cell(st['min'])} | {_cell(st['max'])} | {nulls} |"
+                    f" {_cell(st['distinct_estimate'])} |"
+                )
+            schema_lines.append(line)
+        schema_lines.append("")
+
+    atomic_write(out_path, "\n".join(schema_lines))
@@ -0,0 +1,96 @@
+# pipeline/export.py
+# Optional export of project.duckdb to Hive-partitioned Parquet, next to the
+# database:
+#
+#   2_db/parquet/
+#     manifest.json                      tables, columns, partitions, fingerprints
+#     sales/year=2024/region=EU/data_0.parquet
+#     customers/data_0.parquet           (tables without partition columns)
+#
+# `make db EXPORT=1` (build_db.py --export) writes it. Partition columns are
+# declared per table in build_db.py: build.table(..., partition_by=["year"]).
+# Only tables whose build fingerprint or partition columns changed are
+# rewritten; each is written to a temporary directory and renamed into place.
+#
+# Readers do not need project.duckdb: connect() opens an in-memory DuckDB
+# connection with one view per exported table over its Parquet files. Any
+# number of processes can read them at once (project.duckdb allows readers
+# or a writer, not both), a filter on partition columns only opens the
+# matching directories, and a subset of tables or partitions can be copied to
+# another machine with manifest.json.
+
+import json
+import shutil
+from pathlib import Path
+
+from pipeline.sql import quote, sql_literal
+from pipeline.state import ROOT, SAMPLE, atomic_write
+
+EXPORT_DIR = ROOT / "2_db" / ("parquet_sample" if SAMPLE else "parquet")
+MANIFEST_FILE = "manifest.json"
+
+
+def read_manifest(export_dir=EXPORT_DIR):
+    """Return {table: entry} of an export ({} if there is none).
+
+    Each entry holds the table's build `fingerprint`, its `partition_by`
+    columns and its `columns` ([[name, type], ...] in table order).
+    """
+    try:
+        return json.loads((Path(export_dir) / MANIFEST_FILE).read_text())
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def write_manifest(manifest, export_dir=EXPORT_DIR):
+    atomic_write(Path(export_dir) / MANIFEST_FILE, json.dumps(manifest, indent=1, sort_keys=True))
+
+
+def export_fingerprints(export_dir=EXPORT_DIR):
+    """Return {table: build fingerprint} of the exported tables (None if no export)."""
+    manifest = read_manifest(export_dir)
+    return {t: e["fingerprint"] for t, e in manifest.items()} if manifest else None
+
+
+def replace_dir(tmp, final):
+    """Move a freshly written directory to `final`, replacing the old one."""
+    final = Path(final)
+    old = final.with_name(f".{final.name}.old")
+    shutil.rmtree(old, ignore_errors=True)
+    if final.exists():
+        final.rename(old)
+    Path(tmp).rename(final)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+def remove_table(name, export_dir=EXPORT_DIR):
+    shutil.rmtree(Path(export_dir) / name, ignore_errors=True)
+
+
+def view_sql(name, entry, export_dir=EXPORT_DIR):
+    """SELECT reading an exported table with its original column order and types."""
+    path = Path(export_dir) / name / ("**/*.parquet" if entry["partition_by"] else "*.parquet")
+    types = dict(entry["columns"])
+    hive = ""
+    if entry["partition_by"]:
+        hive_types = ", ".join(
+            f"{sql_literal(c)}: {sql_literal(types[c])}" for c in entry["partition_by"]
+        )
+        hive = f", hive_partitioning = true, hive_types = {{{hive_types}}}"
+    columns = ", ".join(quote(c) for c, _ in entry["columns"])
+    return f"SELECT {columns} FROM read_parquet({sql_literal(path)}{hive})"
+
+
+def connect(export_dir=EXPORT_DIR):
+    """Open an in-memory DuckDB connection with a view per exported table."""
+    import duckdb
+
+    manifest = read_manifest(export_dir)
+    if not manifest:
+        raise FileNotFoundError(
+            f"No Parquet export found in {export_dir}. Run: make db EXPORT=1"
+        )
+    con = duckdb.connect()
+    for name, entry in sorted(manifest.items()):
+        con.execute(f"CREATE VIEW {quote(name)} AS {view_sql(name, entry, export_dir)}")
+    return con
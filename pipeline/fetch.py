@@ -0,0 +1,354 @@
+# pipeline/fetch.py
+# Resumable, chunked, concurrent collection of a source documented in
+# 1_data/sources.yaml, written straight to append-only Parquet parts:
+#
+#   1_data/trips/
+#     _parts.json                        chunk id → part, rows, sha256
+#     part-3f2a9c0e1b7d4a65.parquet      one part per fetched chunk
+#
+# A fetch script in 1_data/ (e.g. fetch_trips.py) declares the chunks of a
+# sources.yaml entry and how to parse a response:
+#
+#   from pipeline.fetch import Fetch
+#
+#   fetch = Fetch(
+#       "trips/",                        # `file` of the sources.yaml entry
+#       chunks=lambda entry: [(m, f"{entry['url']}?month={m}") for m in MONTHS],
+#       parse="csv",                     # or callable(path, chunk_id) → table
+#   )
+#   sys.exit(fetch.run())
+#
+# Chunks are fetched by asyncio tasks, at most -j at a time, through a
+# transport: HttpTransport (urllib in worker threads, with retries) by
+# default, or LocalTransport, which serves requests from a local directory,
+# to work offline or against a stand-in of the remote server. A response is
+# streamed to a temporary file next to the parts, never held in memory
+# whole, then parsed in a worker thread into a compressed Parquet part,
+# renamed into place when complete, hashed and listed in _parts.json; the
+# temporary file is removed. _parts.json is rewritten at most once per
+# MANIFEST_INTERVAL seconds, and once more when the run ends. A re-run skips
+# the chunks already listed, so an interrupted fetch resumes where it stopped
+# (refetching at most the chunks of its last interval), and listed parts are
+# never rewritten.
+#
+# build_db.py reads the parts with build.source("trips", "trips/"), and
+# rebuilds the table when _parts.json changes. `make db` can run while a
+# fetch is in progress: it loads the parts listed in _parts.json so far.
+
+import argparse
+import asyncio
+import json
+import shutil
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from pipeline.state import ROOT, atomic_path, atomic_write, hash_file, hash_text
+
+DATA_DIR = ROOT / "1_data"
+PARTS_MANIFEST = "_parts.json"
+MANIFEST_INTERVAL = 1.0  # seconds between rewrites of _parts.json during a fetch
+COPY_BUFFER = 1 << 20  # bytes read from a response at a time
+
+
+def read_parts(directory):
+    """Return {chunk id: {"part", "rows", "sha256", "fetched_at"}} of a parts
+    directory ({} if nothing was fetched yet)."""
+    try:
+        return json.loads((Path(directory) / PARTS_MANIFEST).read_text())["chunks"]
+    except (FileNotFoundError, ValueError, KeyError):
+        return {}
+
+
+def part_name(chunk_id):
+    """File name of the part holding a chunk (stable across runs)."""
+    return f"part-{hash_text(chunk_id)[:16]}.parquet"
+
+
+# ── Transports ───────────────────────────────────────────────────
+class HttpTransport:
+    """Fetch URLs (or urllib Requests) with urllib, in worker threads.
+
+    Args:
+        headers: added to every request (e.g. an API token)
+        timeout: seconds per attempt
+        retries: attempts after the first one on connection errors, HTTP
+            429 and 5xx, with exponential backoff
+    """
+
+    RETRY_STATUS = {429, 500, 502, 503, 504}
+
+    def __init__(self, headers=None, timeout=60, retries=3):
+        self.headers = dict(headers or {})
+        self.timeout = timeout
+        self.retries = retries
+
+    def _download(self, request, path):
+        if isinstance(request, str):
+            request = urllib.request.Request(request)
+        for key, value in self.headers.items():
+            request.add_header(key, value)
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            with open(path, "wb") as f:
+                shutil.copyfileobj(response, f, COPY_BUFFER)
+                return f.tell()
+
+    async def download(self, request, path):
+        """Write the body of the response to `request` to `path`; return its size."""
+        for attempt in range(self.retries + 1):
+            try:
+                return await asyncio.to_thread(self._download, request, path)
+            except urllib.error.HTTPError as e:
+                if e.code not in self.RETRY_STATUS or attempt == self.retries:
+                    raise
+            except (urllib.error.URLError, TimeoutError, ConnectionError):
+                if attempt == self.retries:
+                    raise
+            await asyncio.sleep(2 ** attempt)
+
+
+class LocalTransport:
+    """Serve requests from files in a local directory.
+
+    A stand-in for the remote server, to develop and test a fetch script
+    offline: a request for "https://host/api/trips/2024-01.csv" reads
+    <root>/api/trips/2024-01.csv.
+
+    Args:
+        root: directory holding the files
+        route: callable(request) → path relative to `root`, when the URL
+            path alone does not identify the file (e.g. query strings)
+    """
+
+    def __init__(self, root, route=None):
+        self.root = Path(root)
+        self.route = route
+
+    def _copy(self, request, path):
+        relative = self.route(request) if self.route else urlsplit(str(request)).path
+        shutil.copyfile(self.root / str(relative).lstrip("/"), path)
+        return Path(path).stat().st_size
+
+    async def download(self, request, path):
+        """Copy the file `request` maps to to `path`; return its size."""
+        return await asyncio.to_thread(self._copy, request, path)
+
+
+# ── Parsers ──────────────────────────────────────────────────────
+def _parse_csv(path, chunk_id):
+    import pyarrow.csv
+
+    return pyarrow.csv.read_csv(path)
+
+
+def _parse_jsonl(path, chunk_id):
+    import pyarrow.json
+
+    return pyarrow.json.read_json(path)
+
+
+def _parse_json(path, chunk_id):
+    import pyarrow as pa
+
+    records = json.loads(Path(path).read_bytes())
+    return pa.Table.from_pylist(records if isinstance(records, list) else [records])
+
+
+def _parse_parquet(path, chunk_id):
+    import pyarrow.parquet as pq
+
+    return pq.read_table(path)
+
+
+PARSERS = {
+    "csv": _parse_csv,
+    "jsonl": _parse_jsonl,
+    "ndjson": _parse_jsonl,
+    "json": _parse_json,
+    "parquet": _parse_parquet,
+}
+
+
+def _to_arrow(result):
+    import pyarrow as pa
+
+    if isinstance(result, pa.Table):
+        return result
+    if hasattr(result, "to_arrow"):  # DuckDB relation, polars
+        return result.to_arrow()
+    return pa.Table.from_pandas(result, preserve_index=False)
+
+
+# ── Fetch ────────────────────────────────────────────────────────
+class Fetch:
+    """Collect the chunks of one sources.yaml entry into Parquet parts.
+
+    Args:
+        file: the entry's `file`, a directory relative to 1_data/ (e.g. "trips/")
+        chunks: (chunk id, request) pairs, or a callable(entry) returning
+            them, `entry` being the sources.yaml entry (its `url`, ...).
+            Ids are strings identifying a chunk across runs; a bare request
+            is its own id.
+        parse: format of a response ("csv", "jsonl", "json", "parquet") or
+            callable(path, chunk id) returning an Arrow table or DataFrame,
+            `path` being the file the response was written to
+        transport: object with an async download(request, path) writing the
+            response to `path` and returning its size (default: HttpTransport())
+        jobs: chunks fetched at once (overridden by -j)
+        data_dir: folder holding sources.yaml and the parts directory
+    """
+
+    def __init__(self, file, chunks, parse, transport=None, jobs=8, data_dir=DATA_DIR):
+        from pipeline.build import load_sources
+
+        self.data_dir = Path(data_dir)
+        self.file = file
+        self.dir = self.data_dir / file.rstrip("/")
+        entries = {name.rstrip("/"): e for name, e in load_sources(self.data_dir).items()}
+        if file.rstrip("/") not in entries:
+            raise ValueError(
+                f"'{file}' is not documented in {self.data_dir / 'sources.yaml'}: "
+                "add its entry (origin, url, ...) before fetching it"
+            )
+        self.entry = entries[file.rstrip("/")]
+        self.chunks = chunks
+        if isinstance(parse, str):
+            if parse not in PARSERS:
+                raise ValueError(f"Unknown format '{parse}'. Supported: {', '.join(PARSERS)}")
+            parse = PARSERS[parse]
+        self.parse = parse
+        self.transport = transport or HttpTransport()
+        self.jobs = jobs
+
+    def _chunk_list(self):
+        items = self.chunks(self.entry) if callable(self.chunks) else self.chunks
+        result = {}
+        for item in items:
+            chunk_id, request = item if isinstance(item, tuple) else (str(item), item)
+            if str(chunk_id) in result:
+                raise ValueError(f"Chunk '{chunk_id}' is listed twice")
+            result[str(chunk_id)] = request
+        return result
+
+    def _write_part(self, chunk_id, response):
+        """Worker thread: parse a downloaded response and write its part.
+        Returns (name, rows, sha256)."""
+        import pyarrow.parquet as pq
+
+        table = _to_arrow(self.parse(response, chunk_id))
+        path = self.dir / part_name(chunk_id)
+        with atomic_path(path) as tmp:
+            pq.write_table(table, tmp, compression="zstd")
+        return path.name, table.num_rows, hash_file(path)
+
+    async def _fetch(self, chunk_id, request, semaphore):
+        """Fetch and store one chunk. Returns (chunk id, stats or None, error)."""
+        response = self.dir / f".{part_name(chunk_id)}.download"
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                nbytes = await self.transport.download(request, response)
+                name, rows, sha256 = await asyncio.to_thread(
+                    self._write_part, chunk_id, response
+                )
+            except Exception as e:  # reported; the other chunks go on
+                return chunk_id, None, e
+            finally:
+                response.unlink(missing_ok=True)
+            return chunk_id, (name, rows, sha256, nbytes, time.perf_counter() - start), None
+
+    def _write_manifest(self, parts):
+        atomic_write(
+            self.dir / PARTS_MANIFEST, json.dumps({"chunks": parts}, indent=1, sort_keys=True)
+        )
+
+    async def _run(self, todo, parts, jobs):
+        """Fetch the chunks in `todo`, listing each in `parts` as soon as its
+        part is written, and in _parts.json at the next MANIFEST_INTERVAL (or
+        when the run ends). Returns the number of failures."""
+        semaphore = asyncio.Semaphore(jobs)
+        tasks = [
+            asyncio.create_task(self._fetch(chunk_id, request, semaphore))
+            for chunk_id, request in todo.items()
+        ]
+        failed = 0
+        unsaved, saved_at = 0, time.monotonic()
+        try:
+            for done, task in enumerate(asyncio.as_completed(tasks), 1):
+                chunk_id, stats, error = await task
+                if error is not None:
+                    failed += 1
+                    print(f"  ✗ [{done}/{len(tasks)}] {chunk_id}: {type(error).__name__}: {error}")
+                    continue
+                name, rows, sha256, nbytes, seconds = stats
+                # Listed only once its part is complete: a crash before the
+                # manifest is written leaves parts that the next run rewrites
+                parts[chunk_id] = {
+                    "part": name,
+                    "rows": rows,
+                    "sha256": sha256,
+                    "fetched_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                }
+                unsaved += 1
+                if time.monotonic() - saved_at >= MANIFEST_INTERVAL:
+                    self._write_manifest(parts)
+                    unsaved, saved_at = 0, time.monotonic()
+                print(f"  ✓ [{done}/{len(tasks)}] {chunk_id}: {rows:,} rows, "
+                      f"{nbytes / 1e6:.1f} MB in {seconds:.2f}s")
+        finally:
+            for task in tasks:
+                task.cancel()
+            if unsaved:
+                self._write_manifest(parts)
+        return failed
+
+    def run(self, argv=None):
+        """Parse command-line flags and fetch the chunks not fetched yet."""
+        parser = argparse.ArgumentParser(description=f"Fetch 1_data/{self.file}")
+        parser.add_argument(
+            "-j", "--jobs", type=int, default=self.jobs,
+            help=f"chunks fetched at once (default: {self.jobs})",
+        )
+        parser.add_argument(
+            "--limit", type=int, metavar="N", help="fetch at most N new chunks",
+        )
+        parser.add_argument(
+            "--status", action="store_true", help="list fetched and missing chunks, fetch nothing",
+        )
+        args = parser.parse_args(argv)
+
+        chunks = self._chunk_list()
+        self.dir.mkdir(parents=True, exist_ok=True)
+        parts = read_parts(self.dir)
+        done = {c for c, p in parts.items() if (self.dir / p["part"]).exists()}
+        parts = {c: parts[c] for c in done}
+        todo = {c: r for c, r in chunks.items() if c not in done}
+        extra = sorted(done - set(chunks))
+        print(f"▶ {self.file}: {len(chunks) - len(todo)}/{len(chunks)} chunk(s) fetched, "
+              f"{sum(p['rows'] for p in parts.values()):,} rows")
+        if extra:
+            print(f"  ⚠ Fetched but no longer listed (kept): {', '.join(extra)}")
+        if args.status:
+            if todo:
+                print(f"  · Missing: {', '.join(list(todo)[:20])}"
+                      + (" ..." if len(todo) > 20 else ""))
+            return 0
+        if args.limit is not None:
+            todo = dict(list(todo.items())[:max(0, args.limit)])
+        if not todo:
+            print("✓ Nothing to fetch")
+            return 0
+
+        start = time.perf_counter()
+        failed = asyncio.run(self._run(todo, parts, max(1, args.jobs)))
+        elapsed = time.perf_counter() - start
+        if failed:
+            print(f"✗ {failed}/{len(todo)} chunk(s) failed in {elapsed:.2f}s. "
+                  "Run again to retry them: fetched chunks are kept.")
+            return 1
+        print(f"✓ {len(todo)} chunk(s) fetched in {elapsed:.2f}s → {self.dir}")
+        return 0
+
@@ -0,0 +1,260 @@
+# pipeline/lineage.py
+# End-to-end lineage: the content hashes of what each stage read when it
+# produced its outputs, so status.py and the runners can tell exactly which
+# work is stale.
+#
+#   make db        1_data/ sources + build_db.py  → table fingerprints
+#   make analyses  run.py, tables, upstream results → results.json
+#                  (recorded by the runner, see pipeline/analyses.py)
+#   make render    deliverable files, helpers.py, analyses and tables read
+#                  with helpers.query() → PDF / HTML
+#
+# The db and render records live in .pipeline_state/lineage.json. Staleness
+# is always decided by comparing content hashes, never mtimes, so a git
+# checkout or a copy that touches files does not trigger a rebuild. Callers
+# that check often pass a FileIndex digest so unchanged files are not
+# re-hashed.
+#
+# Record a render by hand (make render / make outputs do it for you):
+#   python -m pipeline.lineage rendered 4_output/2026-02-18-short-report
+
+import sys
+from pathlib import Path
+
+from pipeline.state import (
+    DB_PATH, ROOT, SAMPLE, file_signature, hash_file, hash_text, output_dir, read_state,
+    relative_to_root, table_fingerprints, write_state,
+)
+
+LINEAGE_FILE = "lineage.json"
+ANALYSES_DIR = ROOT / "3_analyses"
+HELPERS_PATH = ROOT / "4_output" / "helpers.py"
+
+RENDERED_SUFFIXES = (".pdf", ".html")
+# Quarto by-products next to a rendered .qmd (not inputs of the render)
+BYPRODUCT_SUFFIXES = (".tex", ".log")
+LOAD_PATTERN = r"\bload_(?:analysis|values?|figure|table)\(\s*[\"']([\w.\-]+)[\"']"
+
+
+def _update(section, key, record):
+    data = read_state(LINEAGE_FILE, {})
+    data.setdefault(section, {})[key] = record
+    write_state(LINEAGE_FILE, data)
+
+
+def _changed(hashes, digest):
+    """Return the paths (relative to ROOT) in `hashes` whose content differs."""
+    return sorted(p for p, sha in hashes.items() if digest(ROOT / p) != sha)
+
+
+def _digest_or_none(path):
+    return hash_file(path) if Path(path).exists() else None
+
+
+# ── Database ─────────────────────────────────────────────────────
+def record_db(db_path, inputs, tables):
+    """Record a finished build.
+
+    Args:
+        db_path: the database that was built
+        inputs: {path: sha256} of every file the build read (sources, build_db.py)
+        tables: {table: fingerprint} of every table in the database
+    """
+    _update("db", relative_to_root(db_path), {
+        "inputs": {relative_to_root(p): sha for p, sha in inputs.items()},
+        "tables": tables,
+        "db": file_signature(db_path),
+    })
+
+
+def db_record(db_path=DB_PATH):
+    """Return the lineage recorded by the last build, or None if there is
+    none or the database file changed since (rebuilt or written elsewhere)."""
+    record = read_state(LINEAGE_FILE, {}).get("db", {}).get(relative_to_root(db_path))
+    if record is None or record["db"] != file_signature(db_path):
+        return None
+    return record
+
+
+def restore_db_record(db_path, record):
+    """Put back a record returned by db_record(), e.g. after swapping a
+    previous build of the database back into place."""
+    _update("db", relative_to_root(db_path), record)
+
+
+def db_fingerprints(db_path=DB_PATH):
+    """Return {table: fingerprint} for a database: from its recorded lineage
+    when available, else from the manifest inside it (None if neither)."""
+    record = db_record(db_path)
+    if record is not None:
+        return record["tables"]
+    return table_fingerprints(db_path)
+
+
+def db_changed_inputs(record, digest=_digest_or_none):
+    """Return the inputs of a recorded build whose content changed since."""
+    return _changed(record["inputs"], digest)
+
+
+# ── Deliverables ─────────────────────────────────────────────────
+def rendered_files(folder):
+    """Return the rendered outputs (one PDF/HTML per .qmd) present in `folder`."""
+    folder = Path(folder)
+    return sorted(
+        folder / (qmd.stem + suffix)
+        for qmd in folder.glob("*.qmd")
+        for suffix in RENDERED_SUFFIXES
+        if (folder / (qmd.stem + suffix)).exists()
+    )
+
+
+def deliverable_files(folder):
+    """Return the files a render of `folder` reads: everything in it except
+    rendered outputs, Quarto by-products and hidden files."""
+    folder = Path(folder)
+    stems = {qmd.stem for qmd in folder.glob("*.qmd")}
+    files = []
+    for p in sorted(folder.rglob("*")):
+        rel = p.relative_to(folder)
+        if not p.is_file() or any(
+            part.startswith((".", "__")) or part.endswith("_files") for part in rel.parts
+        ):
+            continue
+        if len(rel.parts) == 1 and p.stem in stems and (
+            p.suffix in RENDERED_SUFFIXES + BYPRODUCT_SUFFIXES
+        ):
+            continue
+        files.append(p)
+    return files
+
+
+def loaded_analyses(folder):
+    """Return the analyses named in load_analysis/load_value(s)/load_figure/
+    load_table calls of a deliverable's .qmd and .py files."""
+    import re  # compiled on first use, not when status.py imports this module
+
+    names = set()
+    for p in deliverable_files(folder):
+        if p.suffix in (".qmd", ".py"):
+            names.update(re.findall(LOAD_PATTERN, p.read_text(errors="replace")))
+    return sorted(names)
+
+
+def analysis_outputs(name):
+    """Return the files an analysis produced: results.json, its sidecar and
+    figures (those of its sample run in sample mode)."""
+    folder = output_dir(ANALYSES_DIR / name)
+    files = [p for p in folder.glob("results.*") if p.is_file()]
+    files += [p for p in (folder / "figures").rglob("*") if p.is_file()]
+    return sorted(files)
+
+
+def analysis_hash(name, digest=_digest_or_none):
+    """Hash of everything an analysis produced (None if it has no results)."""
+    files = analysis_outputs(name)
+    if not files:
+        return None
+    return hash_text({relative_to_root(p): digest(p) for p in files})
+
+
+def deliverable_inputs(folder, analyses=None, digest=_digest_or_none):
+    """Return the inputs of a render of `folder`: {"files": {path: sha256},
+    "analyses": {name: analysis_hash}}. `analyses` defaults to the ones
+    named in the deliverable's source (loaded_analyses)."""
+    if analyses is None:
+        analyses = loaded_analyses(folder)
+    files = deliverable_files(folder) + [HELPERS_PATH]
+    return {
+        "files": {relative_to_root(p): digest(p) for p in files},
+        "analyses": {name: analysis_hash(name, digest) for name in sorted(analyses)},
+    }
+
+
+def record_render(folder, analyses=None, tables=None, digest=_digest_or_none):
+    """Record a successful render of a deliverable folder.
+
+    Args:
+        folder: the deliverable folder
+        analyses: names of the analyses it loaded (default: loaded_analyses)
+        tables: tables it queried directly with helpers.query(), if any
+        digest: file hashing function (e.g. a FileIndex's digest)
+
+    In sample mode the record is marked with the sample size, so the
+    deliverable is rendered again outside sample mode.
+    """
+    record = deliverable_inputs(folder, analyses, digest)
+    record["outputs"] = {relative_to_root(p): digest(p) for p in rendered_files(folder)}
+    if tables:
+        fingerprints = db_fingerprints() or {}
+        record["tables"] = {t: fingerprints.get(t) for t in sorted(tables)}
+    if SAMPLE:
+        record["sample"] = SAMPLE
+    _update("outputs", relative_to_root(folder), record)
+
+
+def render_record(folder):
+    """Return the recorded lineage of a deliverable's last render, or None."""
+    return read_state(LINEAGE_FILE, {}).get("outputs", {}).get(relative_to_root(folder))
+
+
+def render_stale_reason(folder, record=None, digest=_digest_or_none):
+    """Return why a deliverable must be rendered again, or None if current."""
+    if record is None:
+        record = render_record(folder)
+    if record is None:
+        return "never rendered"
+    if not record["outputs"]:
+        return "no rendered output"
+    if record.get("sample") and record["sample"] != SAMPLE:
+        return f"rendered from a {record['sample']} sample"
+    changed = _changed(record["outputs"], digest)
+    if changed:
+        return f"output missing or modified: {', '.join(Path(p).name for p in changed)}"
+    current = deliverable_inputs(folder, record["analyses"], digest)
+    removed = sorted(set(record["files"]) - set(current["files"]))
+    added = sorted(set(current["files"]) - set(record["files"]))
+    changed = sorted(
+        p for p, sha in current["files"].items() if p in record["files"]
+        and record["files"][p] != sha
+    )
+    if changed or added or removed:
+        return f"files changed: {', '.join(Path(p).name for p in changed + added + removed)}"
+    changed = sorted(
+        n for n, h in current["analyses"].items() if record["analyses"].get(n) != h
+    )
+    if changed:
+        return f"analyses changed: {', '.join(changed)}"
+    if record.get("tables"):
+        fingerprints = db_fingerprints() or {}
+        changed = sorted(t for t, fp in record["tables"].items() if fingerprints.get(t) != fp)
+        if changed:
+            return f"queried tables changed: {', '.join(changed)}"
+    return None
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Record or inspect pipeline lineage")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rendered = sub.add_parser("rendered", help="record a successful render of deliverables")
+    rendered.add_argument("folders", nargs="+", type=Path)
+    stale = sub.add_parser("stale", help="print why deliverables are stale (exit 1 if any)")
+    stale.add_argument("folders", nargs="+", type=Path)
+    args = parser.parse_args(argv)
+
+    if args.command == "rendered":
+        for folder in args.folders:
+            record_render(folder.resolve())
+        return 0
+    code = 0
+    for folder in args.folders:
+        reason = render_stale_reason(folder.resolve())
+        if reason:
+            print(f"{folder}: {reason}")
+            code = 1
+    return code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
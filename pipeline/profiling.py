@@ -0,0 +1,212 @@
+# pipeline/profiling.py
+# Opt-in timing instrumentation for every stage, written to
+# .pipeline_state/timings.jsonl (one JSON object per line).
+#
+# Enable with `--profile` on build_db.py / run_analyses.py / render.py
+# (make db PROFILE=1, ...) or by setting PIPELINE_PROFILE=1. The flag sets
+# the variable, so worker processes and Quarto kernels inherit it. When it is
+# not set, every function here is a no-op.
+#
+# Each line records one step:
+#   {"run": "...", "time": "...", "stage": "build", "step": "sales/create",
+#    "seconds": 12.3, ...extra fields}
+# All lines written by one command share its "run" id. `python status.py
+# --timings` summarizes the slowest steps of the latest runs and their trend.
+#
+# Build statements and analysis_kit queries slower than PIPELINE_PROFILE_SLOW
+# seconds (default 1) keep DuckDB's profile of the query (the operator tree
+# printed by EXPLAIN ANALYZE) under .pipeline_state/profiles/.
+
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager, suppress
+from datetime import datetime, timezone
+
+from pipeline.sql import sql_literal
+from pipeline.state import STATE_DIR, relative_to_root
+
+PROFILE_ENV = "PIPELINE_PROFILE"
+RUN_ENV = "PIPELINE_RUN_ID"
+SLOW_ENV = "PIPELINE_PROFILE_SLOW"
+TIMINGS_PATH = STATE_DIR / "timings.jsonl"
+PROFILES_DIR = STATE_DIR / "profiles"
+
+
+def enabled():
+    """True if profiling is on for this process."""
+    return os.environ.get(PROFILE_ENV, "") not in ("", "0")
+
+
+def enable():
+    """Turn profiling on for this process and the processes it starts."""
+    os.environ[PROFILE_ENV] = "1"
+    run_id()
+
+
+def run_id():
+    """Id shared by every line written by one command (and its children)."""
+    if RUN_ENV not in os.environ:
+        os.environ[RUN_ENV] = f"{datetime.now():%Y%m%dT%H%M%S}-{os.getpid()}"
+    return os.environ[RUN_ENV]
+
+
+def slow_threshold():
+    """Seconds above which a build statement keeps its DuckDB profile."""
+    return float(os.environ.get(SLOW_ENV, "1"))
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB (None if unavailable)."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, in kilobytes elsewhere
+    return round(peak / (1 << 20 if sys.platform == "darwin" else 1 << 10), 1)
+
+
+def record(stage, step, seconds, **extra):
+    """Append one timing line to .pipeline_state/timings.jsonl (if enabled)."""
+    if not enabled():
+        return
+    line = {
+        "run": run_id(),
+        "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "stage": stage,
+        "step": step,
+        "seconds": round(seconds, 4),
+        **{k: v for k, v in extra.items() if v is not None},
+    }
+    TIMINGS_PATH.parent.mkdir(parents=True, exist_ok=True)
+    # A single O_APPEND write per line: safe with concurrent writers
+    fd = os.open(TIMINGS_PATH, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    try:
+        os.write(fd, (json.dumps(line, default=str) + "\n").encode())
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def timed(stage, step, rss=False, **extra):
+    """Record the wall time of the block as a step (no-op unless enabled)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if enabled():
+            record(stage, step, time.perf_counter() - start,
+                   peak_rss_mb=peak_rss_mb() if rss else None, **extra)
+
+
+# ── Queries ──────────────────────────────────────────────────────
+@contextmanager
+def query_profile(con, stage, step):
+    """Record the time of the block, which runs queries on `con`, as a step
+    and keep DuckDB's profile of them (the EXPLAIN ANALYZE tree) under
+    .pipeline_state/profiles/<stage>/ if it took at least slow_threshold()
+    seconds. No-op unless enabled."""
+    if not enabled():
+        yield
+        return
+    import duckdb
+
+    path = PROFILES_DIR / stage / f"{step.replace('/', '.')}.txt"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    con.execute(f"SET profiling_output = {sql_literal(str(path))}")
+    con.execute("SET enable_profiling = 'query_tree'")
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        with suppress(duckdb.Error):  # e.g. inside an aborted transaction
+            con.execute("PRAGMA disable_profiling")
+    seconds = time.perf_counter() - start
+    slow = seconds >= slow_threshold()
+    if not slow:
+        path.unlink(missing_ok=True)
+    record(stage, step, seconds, profile=relative_to_root(path) if slow else None)
+
+
+# ── Analysis breakdown ───────────────────────────────────────────
+class StepClock(dict):
+    """Seconds spent per bucket ("query", "figures", "write") by one analysis."""
+
+    @contextmanager
+    def measure(self, bucket):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self[bucket] = self.get(bucket, 0.0) + time.perf_counter() - start
+
+
+# Filled by pipeline/analysis_kit.py around its query, figures and writes;
+# the analysis runner clears it before each analysis and records it after.
+# Plain run.py scripts only get their total time.
+ANALYSIS_CLOCK = StepClock()
+
+
+# ── Summary ──────────────────────────────────────────────────────
+def read_timings(max_bytes=4 << 20):
+    """Return the timing lines, reading at most the last `max_bytes` of the file."""
+    try:
+        with open(TIMINGS_PATH, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            f.seek(max(0, size - max_bytes))
+            data = f.read()
+    except FileNotFoundError:
+        return []
+    lines = data.decode(errors="replace").splitlines()
+    if size > max_bytes:
+        lines = lines[1:]  # first line is probably cut
+    out = []
+    for line in lines:
+        try:
+            out.append(json.loads(line))
+        except ValueError:
+            continue
+    return out
+
+
+def summarize(lines, top=10, history=10):
+    """Slowest steps of the latest run of each stage, with their trend.
+
+    Returns a list of dicts (stage, step, seconds, run, previous, change):
+    `previous` is the mean over up to `history` earlier runs that recorded
+    the same step, `change` the relative difference (None without history).
+    """
+    runs = {}  # (stage, run) -> first time seen, to order runs per stage
+    for line in lines:
+        runs.setdefault((line["stage"], line["run"]), line["time"])
+    latest = {}
+    for (stage, run), t in runs.items():
+        if stage not in latest or t > runs[(stage, latest[stage])]:
+            latest[stage] = run
+
+    series = {}  # (stage, step) -> [(time, seconds)] over earlier runs
+    current = []
+    for line in lines:
+        key = (line["stage"], line["step"])
+        if line["run"] == latest[line["stage"]]:
+            current.append(line)
+        else:
+            series.setdefault(key, []).append((line["time"], line["seconds"]))
+
+    rows = []
+    for line in sorted(current, key=lambda l: -l["seconds"])[:top]:
+        past = [s for _, s in sorted(series.get((line["stage"], line["step"]), []))[-history:]]
+        previous = sum(past) / len(past) if past else None
+        rows.append({
+            "stage": line["stage"],
+            "step": line["step"],
+            "seconds": line["seconds"],
+            "run": line["run"],
+            "previous": previous,
+            "change": (line["seconds"] - previous) / previous if previous else None,
+            **{k: v for k, v in line.items() if k in ("peak_rss_mb", "rss_growth_mb", "worker_peak_rss_mb", "profile")},
+        })
+    return rows
@@ -0,0 +1,315 @@
+# pipeline/results.py
+# Helpers for the two layouts of an analysis's results.json:
+#
+#   rows:     "results": [{"col": "val", ...}, ...]
+#   sidecar:  "results": {"file": "results.parquet"}
+#
+# In the sidecar layout the rows live in a columnar file next to results.json
+# (Parquet, or Arrow IPC with the .arrow / .feather / .ipc extension), and
+# results.json only keeps the header: query, n_results, description,
+# interpretation and figures. pyarrow is imported only when a sidecar is read.
+#
+# scan_results() / results_file_issues() validate either layout while
+# streaming the file: rows are decoded one at a time and discarded, so memory
+# stays constant however large results.json is.
+#
+# Results computed from the sampled database (make analyses SAMPLE=1%) carry
+# an extra "sample" key holding the sample size; helpers.py refuses to load
+# them outside sample mode.
+
+import json
+import re
+from pathlib import Path
+
+from pipeline.state import atomic_write
+
+REQUIRED_KEYS = {"query", "n_results", "results", "description", "interpretation", "figures"}
+
+SIDECAR_FORMATS = {
+    ".parquet": "parquet",
+    ".arrow": "ipc",
+    ".feather": "ipc",
+    ".ipc": "ipc",
+}
+
+
+def is_sidecar(results):
+    """True if a `results` value points to a sidecar file."""
+    return isinstance(results, dict) and "file" in results
+
+
+def sidecar_path(folder, results):
+    """Return the path of the sidecar file referenced by `results`."""
+    return Path(folder) / results["file"]
+
+
+def sidecar_format(path):
+    """Return "parquet" or "ipc" for a sidecar path, or None if unsupported."""
+    return SIDECAR_FORMATS.get(Path(path).suffix.lower())
+
+
+def sidecar_rows(path):
+    """Number of rows in a sidecar, read from its metadata only."""
+    import pyarrow as pa
+
+    if sidecar_format(path) == "parquet":
+        import pyarrow.parquet as pq
+
+        return pq.ParquetFile(path).metadata.num_rows
+    with pa.memory_map(str(path)) as source:
+        reader = pa.ipc.open_file(source)
+        return sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+
+
+def read_sidecar(path, columns=None):
+    """Read a sidecar into a pandas DataFrame (optionally only `columns`)."""
+    import pyarrow as pa
+
+    if sidecar_format(path) == "parquet":
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(path, columns=columns, memory_map=True)
+    else:
+        with pa.memory_map(str(path)) as source:
+            table = pa.ipc.open_file(source).read_all()
+        if columns is not None:
+            table = table.select(columns)
+    return table.to_pandas()
+
+
+def sidecar_dataset(path):
+    """Open a sidecar as a pyarrow dataset, without reading its rows.
+
+    Parquet is scanned through a memory map, reading only the column chunks
+    and row groups a projection and filter need (row groups are skipped from
+    their min/max statistics). Arrow IPC is memory-mapped whole: its columns
+    are used in place, without copy.
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    from pyarrow import fs
+
+    if sidecar_format(path) == "parquet":
+        return ds.dataset(
+            str(path), format="parquet", filesystem=fs.LocalFileSystem(use_mmap=True)
+        )
+    source = pa.memory_map(str(path))
+    return ds.dataset(pa.ipc.open_file(source).read_all())
+
+
+def sidecar_issues(folder, results, n_results):
+    """Validate a sidecar reference. Returns a list of issues (empty = valid)."""
+    path = sidecar_path(folder, results)
+    if sidecar_format(path) is None:
+        return [f"'results' sidecar has unsupported extension: {results['file']}"]
+    if not path.exists():
+        return [f"'results' sidecar not found: {results['file']}"]
+    try:
+        n_rows = sidecar_rows(path)
+    except ImportError:
+        return []  # pyarrow not installed: cannot count rows
+    except Exception as e:
+        return [f"'results' sidecar unreadable: {e}"]
+    if n_rows != n_results:
+        return [f"n_results={n_results} but {results['file']} has {n_rows} rows"]
+    return []
+
+
+# ── Streaming validation ─────────────────────────────────────────
+_WS = re.compile(r"[ \t\n\r]*")
+_SEP = re.compile(r"[ \t\n\r]*([,\]])[ \t\n\r]*")
+_DECODER = json.JSONDecoder()
+# Characters that can follow a prefix of a number ("12." | "5", "1e" | "-3")
+_NUMBER_CONTINUATIONS = ("", ".", "e", "E", "+", "-")
+
+
+class _Stream:
+    """Minimal pull parser over a text file, decoding one value at a time."""
+
+    def __init__(self, f, chunk_size=1 << 20):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        if self.eof:
+            return False
+        data = self.f.read(self.chunk_size)
+        if not data:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Next non-whitespace character without consuming it ("" at EOF)."""
+        while True:
+            self.pos = _WS.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf) or not self._fill():
+                return self.buf[self.pos: self.pos + 1]
+
+    def take(self, expected):
+        """Consume the next non-whitespace character, which must be in `expected`."""
+        ch = self.peek()
+        if not ch or ch not in expected:
+            raise ValueError(
+                f"Invalid JSON: expected {' or '.join(repr(c) for c in expected)}, "
+                f"got {ch or 'end of file'!r}"
+            )
+        self.pos += 1
+        return ch
+
+    def value(self):
+        """Decode and consume the next complete JSON value."""
+        self.peek()
+        while True:
+            try:
+                obj, end = _DECODER.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError as e:
+                # Only a value cut off by the end of the buffer is worth
+                # another chunk; anything else is a genuine syntax error.
+                truncated = e.pos >= len(self.buf) - 6 or e.msg.startswith("Unterminated")
+                if truncated and self._fill():
+                    continue
+                raise ValueError(f"Invalid JSON: {e}") from None
+            # A number ending at the buffer end, or before a character that
+            # only a longer number could contain, may continue in the next chunk
+            if (
+                isinstance(obj, (int, float)) and not isinstance(obj, bool)
+                and self.buf[end:end + 1] in _NUMBER_CONTINUATIONS
+                and self._fill()
+            ):
+                continue
+            self.pos = end
+            return obj
+
+    def count_array(self):
+        """Consume the rest of an array whose "[" was taken; return its length.
+
+        Elements are decoded one by one with the C scanner and discarded. The
+        tight loop works within the current buffer; an element cut off by
+        the buffer end goes through value(), which reads the next chunk.
+        """
+        if self.peek() == "]":
+            self.pos += 1
+            return 0
+        scan, sep = _DECODER.scan_once, _SEP.match
+        n = 0
+        while True:
+            self.peek()
+            buf, pos = self.buf, self.pos
+            try:
+                while True:
+                    _, end = scan(buf, pos)
+                    m = sep(buf, end)
+                    if m is None or m.end() == len(buf):
+                        break
+                    n += 1
+                    pos = m.end()
+                    if m.group(1) == "]":
+                        self.pos = pos
+                        return n
+            except (StopIteration, json.JSONDecodeError):
+                pass
+            self.pos = pos
+            self.value()
+            n += 1
+            if self.take(",]") == "]":
+                return n
+
+
+def scan_results(path, chunk_size=1 << 20):
+    """Stream a results.json file, reading `chunk_size` characters at a time.
+
+    Returns (header, n_rows): `header` holds every top-level key, except
+    that a list of rows under "results" is counted (n_rows) instead of kept
+    (header["results"] is then None). n_rows is None for other layouts.
+    Raises ValueError if the file is not a valid JSON object.
+    """
+    header, n_rows = {}, None
+    with open(path, encoding="utf-8") as f:
+        s = _Stream(f, chunk_size)
+        s.take("{")
+        if s.peek() == "}":
+            s.take("}")
+        else:
+            while True:
+                key = s.value()
+                if not isinstance(key, str):
+                    raise ValueError("Invalid JSON: object keys must be strings")
+                s.take(":")
+                if key == "results" and s.peek() == "[":
+                    s.take("[")
+                    n_rows = s.count_array()
+                    header[key] = None
+                else:
+                    header[key] = s.value()
+                if s.take(",}") == "}":
+                    break
+        if s.peek():
+            raise ValueError("Invalid JSON: extra data after the top-level object")
+    return header, n_rows
+
+
+def results_file_issues(path, refs=None):
+    """Validate a results.json file in constant memory.
+
+    Returns a list of issues (empty = valid). If `refs` is a list, the paths
+    of the figure and sidecar files referenced by the header are appended to
+    it, so callers caching the verdict know which files it depends on.
+    """
+    path = Path(path)
+    try:
+        header, n_rows = scan_results(path)
+    except (ValueError, UnicodeDecodeError) as e:
+        return [str(e) if str(e).startswith("Invalid JSON") else f"Invalid JSON: {e}"]
+
+    missing = REQUIRED_KEYS - set(header)
+    if missing:
+        return [f"Missing keys: {missing}"]
+
+    issues = []
+    if refs is not None:
+        figures = header["figures"] if isinstance(header["figures"], list) else []
+        refs.extend(
+            path.parent / f["file"] for f in figures
+            if isinstance(f, dict) and isinstance(f.get("file"), str)
+        )
+        if is_sidecar(header["results"]):
+            refs.append(sidecar_path(path.parent, header["results"]))
+    if is_sidecar(header["results"]):
+        issues.extend(sidecar_issues(path.parent, header["results"], header["n_results"]))
+    elif n_rows is None:
+        issues.append("'results' is not a list or a sidecar reference")
+    elif header["n_results"] != n_rows:
+        issues.append(f"n_results={header['n_results']} but results has {n_rows} items")
+
+    if not isinstance(header["figures"], list):
+        issues.append("'figures' is not a list")
+    else:
+        for i, fig in enumerate(header["figures"]):
+            if not isinstance(fig, dict):
+                issues.append(f"figures[{i}] is not an object")
+                continue
+            if "file" not in fig:
+                issues.append(f"figures[{i}] missing 'file'")
+            elif not (path.parent / fig["file"]).exists():
+                issues.append(f"figures[{i}] file not found: {fig['file']}")
+            if "caption" not in fig:
+                issues.append(f"figures[{i}] missing 'caption'")
+
+    return issues
+
+
+def mark_sampled(path, sample):
+    """Add `"sample": sample` to a results.json that does not have it yet
+    (written by a run.py that does not use the analysis kit)."""
+    header, _ = scan_results(path)
+    if header.get("sample") == sample:
+        return
+    data = json.loads(Path(path).read_text())
+    data["sample"] = sample
+    atomic_write(path, json.dumps(data, indent=2, ensure_ascii=False))
@@ -0,0 +1,24 @@
+# pipeline/sql.py
+# Quoting of identifiers and values spliced into DuckDB SQL, shared by the
+# build, the Parquet export, the shared views and the profiler.
+#
+# Standard library only: views.py and export.py are imported by analyses and
+# status checks that must not pay for importing DuckDB.
+
+
+def quote(name):
+    """Quote a SQL identifier."""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def sql_literal(value):
+    """Render a Python value as a DuckDB literal for reader options."""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)):
+        return repr(value)
+    if isinstance(value, (list, tuple)):
+        return "[" + ", ".join(sql_literal(v) for v in value) + "]"
+    if isinstance(value, dict):
+        return "{" + ", ".join(f"{sql_literal(str(k))}: {sql_literal(v)}" for k, v in value.items()) + "}"
+    return "'" + str(value).replace("'", "''") + "'"
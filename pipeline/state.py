@@ -0,0 +1,182 @@
+# pipeline/state.py
+# Persisted pipeline state under .pipeline_state/ (gitignored), plus the
+# hashing helpers shared by the stage scripts.
+#
+# Keep this module cheap to import: it is imported by every command,
+# including `make status`, so heavy dependencies (duckdb) and modules that a
+# run with nothing to hash or write never uses (hashlib, tempfile) are
+# imported inside the functions that need them.
+
+import json
+import os
+from contextlib import contextmanager
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+STATE_DIR = ROOT / ".pipeline_state"
+
+# Sample mode: with $PIPELINE_SAMPLE set (make db SAMPLE=1%), every stage
+# builds and reads project_sample.duckdb instead (see pipeline/build.py), and
+# results computed from it are marked as sampled and written to the _sample/
+# subfolder of each analysis, next to the full-data outputs.
+SAMPLE_ENV = "PIPELINE_SAMPLE"
+SAMPLE = os.environ.get(SAMPLE_ENV) or None
+DB_PATH = ROOT / "2_db" / ("project_sample.duckdb" if SAMPLE else "project.duckdb")
+SCHEMA_PATH = ROOT / "2_db" / ("schema_sample.md" if SAMPLE else "schema.md")
+SAMPLE_DIR = "_sample"
+
+MANIFEST_SCHEMA = "_pipeline"
+
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def hash_file(path, chunk_size=1 << 20):
+    """Return the sha256 hex digest of a file, read in 1 MB chunks."""
+    import hashlib
+
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def hash_text(*parts):
+    """Return the sha256 hex digest of the JSON encoding of `parts`."""
+    import hashlib
+
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def file_signature(path):
+    """Return [size, mtime_ns] of a file, or None if it does not exist."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+def output_dir(folder):
+    """Folder the outputs of the analysis in `folder` are written to and read
+    from: `folder` itself, or its _sample/ subfolder in sample mode.
+
+    A str `folder` gives a str (status.py builds one per analysis on every
+    run, without the cost of a Path), anything else a Path.
+    """
+    if not isinstance(folder, str):
+        folder = Path(folder)
+    if not SAMPLE or os.path.basename(folder) == SAMPLE_DIR:  # already inside it (the runner's cwd)
+        return folder
+    return os.path.join(folder, SAMPLE_DIR) if isinstance(folder, str) else folder / SAMPLE_DIR
+
+
+_ROOT_PREFIX = str(ROOT) + os.sep
+
+
+def relative_to_root(path):
+    """Key for `path` in persisted state: relative to ROOT when possible.
+
+    Paths under ROOT are keyed without touching the filesystem (status.py
+    keys hundreds of files per run); others are resolved first, in case they
+    reach ROOT through a symlink.
+    """
+    absolute = os.path.abspath(path)
+    if not absolute.startswith(_ROOT_PREFIX):
+        absolute = str(Path(absolute).resolve())
+        if not absolute.startswith(_ROOT_PREFIX):
+            return absolute
+    return absolute[len(_ROOT_PREFIX):].replace(os.sep, "/")
+
+
+class FileIndex:
+    """Content hashes of files, recomputed only when their size or mtime changes.
+
+    `entries` maps paths (relative to ROOT) to [size, mtime_ns, sha256]; it is
+    a plain dict so callers can persist it with write_state().
+    """
+
+    def __init__(self, entries=None):
+        self.entries = dict(entries or {})
+        self.changed = False
+
+    def digest(self, path):
+        """Return the sha256 of `path`, or None if it does not exist."""
+        key = relative_to_root(path)
+        sig = file_signature(path)
+        if sig is None:
+            if self.entries.pop(key, None) is not None:
+                self.changed = True
+            return None
+        entry = self.entries.get(key)
+        if entry and entry[:2] == sig:
+            return entry[2]
+        digest = hash_file(path)
+        self.entries[key] = sig + [digest]
+        self.changed = True
+        return digest
+
+
+@contextmanager
+def atomic_path(path):
+    """Yield a temporary path next to `path`; on success it is renamed to
+    `path`, so readers never see a half-written file. On error it is removed.
+
+    Use it for writers that take a path (to_parquet, savefig):
+        with atomic_path("results.parquet") as tmp:
+            df.to_parquet(tmp, index=False)
+    """
+    import tempfile
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=f".{path.name}.", dir=path.parent)
+    os.close(fd)
+    os.chmod(tmp, 0o666 & ~_UMASK)  # mkstemp creates it 0600
+    try:
+        yield Path(tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+def atomic_write(path, data):
+    """Write text or bytes to `path` via a temporary file and a rename, so
+    readers never see a half-written file."""
+    with atomic_path(path) as tmp:
+        with open(tmp, "wb" if isinstance(data, bytes) else "w") as f:
+            f.write(data)
+
+
+def read_state(name, default=None):
+    """Load .pipeline_state/<name> (JSON), or `default` if missing or corrupt."""
+    try:
+        return json.loads((STATE_DIR / name).read_text())
+    except (FileNotFoundError, ValueError):
+        return default
+
+
+def write_state(name, data):
+    """Atomically write `data` as JSON to .pipeline_state/<name>."""
+    atomic_write(STATE_DIR / name, json.dumps(data, indent=1, sort_keys=True))
+
+
+def table_fingerprints(db_path=DB_PATH):
+    """Return {table: build fingerprint} from the build manifest of a
+    database, or None if it does not exist or was not built by pipeline.build."""
+    import duckdb
+
+    if not Path(db_path).exists():
+        return None
+    con = duckdb.connect(str(db_path), read_only=True)
+    try:
+        return dict(con.execute(
+            f"SELECT name, fingerprint FROM {MANIFEST_SCHEMA}.tables"
+        ).fetchall())
+    except duckdb.CatalogException:
+        return None
+    finally:
+        con.close()
@@ -0,0 +1,661 @@
+# pipeline/status.py
+# Pipeline status and validation, run by status.py (make status).
+#
+# Importable: collect() returns the report as a dict, for editors and
+# scripts polling the pipeline; main() is the command line. Startup is kept
+# to a few milliseconds over the interpreter's own, since `make status` runs
+# constantly: the module imports only os, sys and pipeline.state, and
+# everything else (argparse, json, re, PyYAML, results validation, lineage,
+# profiling) is imported on the code path that needs it. check_analyses()
+# and stale_reason() handle one path per analysis as a plain string.
+#
+# Verdicts are cached in .pipeline_state/status.json together with the size,
+# mtime and hash of every file they were computed from (plan.md, sources.yaml,
+# schema.md, each results.json and the figures/sidecars it references). A
+# file is only re-read when its size or mtime changed, and only re-validated
+# when its content did, so polling `python status.py --json` every few
+# seconds costs a few stat() calls.
+#
+# Staleness (DB vs. 1_data/, results.json vs. DB, deliverables vs. analyses)
+# comes from the content-hash lineage recorded by each stage; see
+# pipeline/lineage.py.
+#
+# In sample mode (make status SAMPLE=1%), the database checks read
+# project_sample.duckdb and schema_sample.md (DB_PATH and SCHEMA_PATH in
+# pipeline/state.py) and the analysis checks each _sample/results.json.
+
+import os
+import sys
+
+from pipeline.state import (
+    DB_PATH, ROOT, SAMPLE, SCHEMA_PATH, FileIndex, file_signature, output_dir, read_state,
+    relative_to_root, write_state,
+)
+
+STATE_FILE = "status.json"
+STATE_VERSION = 2
+
+# ── Colors ───────────────────────────────────────────────────────
+GREEN = "\033[32m"
+YELLOW = "\033[33m"
+RED = "\033[31m"
+DIM = "\033[2m"
+BOLD = "\033[1m"
+RESET = "\033[0m"
+
+# Disable colors if not a terminal (e.g., piped to file)
+if not sys.stdout.isatty():
+    GREEN = YELLOW = RED = DIM = BOLD = RESET = ""
+
+
+def ok(msg):
+    return f"{GREEN}✓{RESET} {msg}"
+
+
+def warn(msg):
+    return f"{YELLOW}⚠{RESET} {msg}"
+
+
+def fail(msg):
+    return f"{RED}✗{RESET} {msg}"
+
+
+def dim(msg):
+    return f"{DIM}{msg}{RESET}"
+
+
+def bold(msg):
+    return f"{BOLD}{msg}{RESET}"
+
+
+# ── State index ──────────────────────────────────────────────────
+class StatusIndex:
+    """File hashes and cached verdicts, persisted in .pipeline_state/status.json."""
+
+    def __init__(self, use_cache=True):
+        data = read_state(STATE_FILE, {}) if use_cache else {}
+        if data.get("version") != STATE_VERSION:
+            data = {}
+        self.files = FileIndex(data.get("files"))
+        self.verdicts = data.get("verdicts", {})
+        self.used = set()
+        self.changed = False
+
+    def lookup(self, key):
+        """Return the stored {"inputs", "value"} entry for `key`, or None."""
+        self.used.add(key)
+        return self.verdicts.get(key)
+
+    def store(self, key, inputs, value):
+        self.used.add(key)
+        self.verdicts[key] = {"inputs": inputs, "value": value}
+        self.changed = True
+
+    def cached(self, key, inputs, compute):
+        """Return compute(), reusing the stored value while `inputs` are equal.
+
+        `inputs` must be JSON-serializable (file digests, signatures, ...);
+        the value returned by compute() must be too.
+        """
+        entry = self.lookup(key)
+        if entry is not None and entry["inputs"] == inputs:
+            return entry["value"]
+        value = compute()
+        self.store(key, inputs, value)
+        return value
+
+    def save(self):
+        """Persist the index if anything changed; drop verdicts no longer used."""
+        stale = set(self.verdicts) - self.used
+        for key in stale:
+            del self.verdicts[key]
+        if self.changed or stale or self.files.changed:
+            write_state(STATE_FILE, {
+                "version": STATE_VERSION,
+                "files": self.files.entries,
+                "verdicts": self.verdicts,
+            })
+
+
+# ── Stage 0: Plan ────────────────────────────────────────────────
+def _parse_plan(path):
+    """Return what the stages need from plan.md (read once per change)."""
+    import re
+
+    text = path.read_text()
+    # Placeholder patterns: _italic prompts ending with ?_
+    placeholders = re.findall(r"^_[^_]+\?_\s*$", text, re.MULTILINE)
+
+    planned = []
+    analyses_match = re.search(r"## Analyses\s*\n(.*?)(?=\n## |\Z)", text, re.DOTALL)
+    if analyses_match:
+        planned = re.findall(r"^\d+\.\s+(.+)$", analyses_match.group(1), re.MULTILINE)
+        planned = [p.strip() for p in planned if p.strip()]
+
+    return {"placeholders": len(placeholders), "planned": len(planned)}
+
+
+def _plan_info(index):
+    plan_path = ROOT / "0_plan" / "plan.md"
+    digest = index.files.digest(plan_path)
+    if digest is None:
+        return None
+    return index.cached("plan.md", [digest], lambda: _parse_plan(plan_path))
+
+
+def _count_decisions(path):
+    import re
+
+    return len(re.findall(r"^### \d{4}-\d{2}-\d{2}", path.read_text(), re.MULTILINE))
+
+
+def check_plan(index):
+    decisions_path = ROOT / "0_plan" / "decisions.md"
+
+    issues = []
+    details = []
+
+    plan = _plan_info(index)
+    if plan is None:
+        issues.append("plan.md not found")
+        return "missing", issues, details
+
+    if plan["placeholders"]:
+        issues.append(f"{plan['placeholders']} section(s) still have placeholder text")
+        return "incomplete", issues, details
+
+    # Check decisions log
+    digest = index.files.digest(decisions_path)
+    if digest is not None:
+        entries = index.cached("decisions.md", [digest], lambda: _count_decisions(decisions_path))
+        if entries:
+            details.append(f"{entries} decision(s) logged")
+
+    return "complete", issues, details
+
+
+# ── Stage 1: Data ────────────────────────────────────────────────
+META_FILES = {"README.md", "sources.yaml"}
+
+
+def _data_files():
+    """Return {name: mtime_ns} for the raw data files in 1_data/ (one scandir).
+
+    Fetch scripts (*.py) are skipped; directories of fetched parts (see
+    pipeline/fetch.py) count as one data file.
+    """
+    with os.scandir(ROOT / "1_data") as it:
+        return {
+            e.name: e.stat().st_mtime_ns
+            for e in it
+            if (e.is_dir() or (e.is_file() and not e.name.endswith(".py")))
+            and e.name not in META_FILES and not e.name.startswith((".", "__"))
+        }
+
+
+def _parse_sources_yaml(path):
+    """Parse sources.yaml, trying PyYAML first, then a regex fallback."""
+    text = path.read_text()
+    try:
+        import yaml
+
+        entries = yaml.safe_load(text)
+        if isinstance(entries, list) and entries:
+            return [
+                str(e["file"]).rstrip("/") for e in entries if isinstance(e, dict) and "file" in e
+            ]
+        return []
+    except ImportError:
+        # Fallback: extract '- file: <name>' lines with regex
+        import re
+
+        return [
+            f.rstrip("/")
+            for f in re.findall(r"^-\s+file:\s*[\"']?([^\"'\n]+)", text, re.MULTILINE)
+        ]
+    except Exception:
+        return None  # signals parse error
+
+
+def check_data(index):
+    sources_path = ROOT / "1_data" / "sources.yaml"
+
+    issues = []
+    details = []
+
+    # Find actual data files (exclude meta files and scripts)
+    data_files = sorted(_data_files())
+
+    # Parse sources.yaml (only when it changed)
+    documented = []
+    digest = index.files.digest(sources_path)
+    if digest is not None:
+        result = index.cached(
+            "sources.yaml", [digest], lambda: _parse_sources_yaml(sources_path)
+        )
+        if result is None:
+            issues.append("sources.yaml could not be parsed")
+        else:
+            documented = result
+    else:
+        issues.append("sources.yaml not found")
+
+    if not data_files and not documented:
+        return "empty", issues, details
+
+    if data_files:
+        details.append(f"{len(data_files)} data file(s): {', '.join(data_files)}")
+
+    # Cross-reference
+    undocumented = [f for f in data_files if f not in documented]
+    missing_files = [f for f in documented if f not in data_files]
+
+    if undocumented:
+        issues.append(f"Undocumented: {', '.join(undocumented)}")
+    if missing_files:
+        issues.append(f"In sources.yaml but missing on disk: {', '.join(missing_files)}")
+
+    if documented:
+        details.append(f"{len(documented)} documented in sources.yaml")
+
+    if not issues and documented and data_files:
+        return "complete", issues, details
+    elif data_files or documented:
+        return "partial", issues, details
+    return "empty", issues, details
+
+
+# ── Stage 2: Database ────────────────────────────────────────────
+def _schema_tables(path):
+    import re
+
+    return re.findall(r"^## `(\w+)`", path.read_text(), re.MULTILINE)
+
+
+def check_db(index):
+    # In sample mode (make status SAMPLE=1%), the sample database and schema
+    db_path = DB_PATH
+    schema_path = SCHEMA_PATH
+
+    issues = []
+    details = []
+
+    db_sig = file_signature(db_path)
+    if db_sig is None:
+        return "not_built", issues, details
+    if SAMPLE:
+        details.append(f"Sample mode ({SAMPLE}): {db_path.name}")
+
+    # Check schema.md has real tables
+    tables = []
+    digest = index.files.digest(schema_path)
+    if digest is not None:
+        tables = index.cached(schema_path.name, [digest], lambda: _schema_tables(schema_path))
+    has_tables = bool(tables)
+    if has_tables:
+        details.append(f"{len(tables)} table(s): {', '.join(tables)}")
+    else:
+        issues.append(f"{schema_path.name} has no tables (DB may be empty)")
+
+    # Staleness check: did the content of anything the last build read change?
+    from pipeline.lineage import db_changed_inputs, db_record
+
+    record = db_record(db_path)
+    if record is not None:
+        changed = db_changed_inputs(record, index.files.digest)
+        if changed:
+            issues.append(f"Changed since last build: {', '.join(changed)}")
+        read = {p.split("/")[1] for p in record["inputs"] if p.startswith("1_data/")}
+        unused = sorted(set(_data_files()) - read)
+        if unused:
+            details.append(f"Not read by build_db.py: {', '.join(unused)}")
+    else:
+        # No lineage (built before it was recorded, or DB modified outside
+        # `make db`): fall back to comparing mtimes
+        db_mtime = db_sig[1]
+        changed = sorted(name for name, mtime in _data_files().items() if mtime > db_mtime)
+        if changed:
+            issues.append(f"DB older than: {', '.join(changed)}")
+
+    if changed and has_tables:
+        return "stale", issues, details
+
+    if not issues:
+        return "complete", issues, details
+    return "partial", issues, details
+
+
+# ── Stage 3: Analyses ────────────────────────────────────────────
+def _validate_results_json(path, index):
+    """Validate a results.json file. Returns list of issues (empty = valid).
+
+    The file is streamed, so memory stays constant whatever its size. The
+    verdict is reused while results.json and the figures/sidecar it
+    references are unchanged.
+    """
+    key = f"results:{relative_to_root(path)}"
+    digest = index.files.digest(path)
+    entry = index.lookup(key)
+    if (
+        entry is not None
+        and entry["inputs"][0] == digest
+        and all(
+            file_signature(os.path.join(ROOT, r)) == sig for r, sig in entry["inputs"][1].items()
+        )
+    ):
+        return entry["value"]
+
+    from pipeline.results import results_file_issues
+
+    refs = []
+    issues = results_file_issues(path, refs)
+    signatures = {relative_to_root(r): file_signature(r) for r in refs}
+    index.store(key, [digest, signatures], issues)
+    return issues
+
+
+def check_analyses(index):
+    # Paths are plain strings below: a Path per analysis would cost more than
+    # the stat() calls on a project with hundreds of analyses
+    analyses_dir = os.path.join(ROOT, "3_analyses")
+
+    issues = []
+    details = []
+
+    # Find analysis subfolders (skip example, shared views, hidden, deprecated, __pycache__)
+    with os.scandir(analyses_dir) as it:  # file types come with the listing: no stat()
+        subfolders = sorted(
+            (e.name, e.path)
+            for e in it
+            if e.is_dir()
+            and e.name not in ("example_analysis", "_views")
+            and not e.name.startswith((".", "_deprecated_", "__"))
+        )
+
+    if not subfolders:
+        return "empty", issues, details
+
+    with_results = []
+    without_results = []
+    invalid = []
+
+    for name, d in subfolders:
+        rj = os.path.join(output_dir(d), "results.json")  # _sample/ in sample mode
+        if os.path.exists(rj):
+            validation_issues = _validate_results_json(rj, index)
+            if validation_issues:
+                invalid.append((name, validation_issues))
+            else:
+                with_results.append(name)
+        else:
+            without_results.append(name)
+
+    details.append(f"{len(subfolders)} analysis folder(s)")
+    if with_results:
+        details.append(f"{len(with_results)} with valid results.json")
+
+    if without_results:
+        issues.append(f"Missing results.json: {', '.join(without_results)}")
+    if invalid:
+        for name, errs in invalid:
+            issues.append(f"Invalid {name}/results.json: {'; '.join(errs)}")
+
+    # Lineage: results.json older than the tables, run.py or upstream results
+    from pipeline.lineage import db_record
+
+    record = db_record(DB_PATH)
+    stale = []
+    if record is not None:
+        from pipeline.analyses import CACHE_FILE as ANALYSES_CACHE, stale_reason
+
+        cache = read_state(ANALYSES_CACHE, {})
+        for name in with_results:
+            if name in cache:
+                reason = stale_reason(name, record["tables"], cache, analyses_dir)
+                if reason:
+                    stale.append(f"{name} ({reason})")
+        untracked = [n for n in with_results if n not in cache]
+        if untracked:
+            details.append(f"Not run via make analyses: {', '.join(untracked)}")
+    if stale:
+        issues.append(f"Stale: {', '.join(stale)}")
+
+    # Cross-reference with plan's Analyses section
+    plan = _plan_info(index)
+    if plan and plan["planned"]:
+        details.append(f"{plan['planned']} question(s) listed in plan")
+
+    if not issues and with_results:
+        return "complete", issues, details
+    elif stale and not (without_results or invalid):
+        return "stale", issues, details
+    elif with_results:
+        return "partial", issues, details
+    elif without_results or invalid:
+        return "incomplete", issues, details
+    return "empty", issues, details
+
+
+# ── Stage 4: Output ──────────────────────────────────────────────
+def check_output(index):
+    output_dir = ROOT / "4_output"
+    skip = {"templates", "__pycache__"}
+
+    issues = []
+    details = []
+
+    deliverables = sorted(
+        d
+        for d in output_dir.iterdir()
+        if d.is_dir() and d.name not in skip and not d.name.startswith(".")
+    )
+
+    if not deliverables:
+        return "empty", issues, details
+
+    from pipeline.lineage import render_record, render_stale_reason
+
+    rendered = []
+    unrendered = []
+    stale = []
+
+    for d in deliverables:
+        outputs = list(d.glob("*.pdf")) + list(d.glob("*.html"))
+        if outputs:
+            formats = sorted(set(o.suffix for o in outputs))
+            rendered.append(f"{d.name} ({', '.join(formats)})")
+            # Lineage is only known for renders done through make render/outputs
+            record = render_record(d)
+            reason = record and render_stale_reason(d, record, index.files.digest)
+            if reason:
+                stale.append(f"{d.name} ({reason})")
+        else:
+            unrendered.append(d.name)
+
+    details.append(f"{len(deliverables)} deliverable(s)")
+    if rendered:
+        details.append(f"Rendered: {', '.join(rendered)}")
+    if unrendered:
+        issues.append(f"Not yet rendered: {', '.join(unrendered)}")
+    if stale:
+        issues.append(f"Stale: {', '.join(stale)}")
+
+    if not issues:
+        return "complete", issues, details
+    if stale and not unrendered:
+        return "stale", issues, details
+    return "partial", issues, details
+
+
+# ── Suggest next action ─────────────────────────────────────────
+NEXT_ACTIONS = {
+    (0, "missing"): "Create 0_plan/plan.md or restore it from the template.",
+    (0, "incomplete"): "Fill in the remaining sections of 0_plan/plan.md.",
+    (1, "empty"): "Collect raw data into 1_data/ and document in sources.yaml.",
+    (1, "partial"): "Document all data files in 1_data/sources.yaml.",
+    (2, "not_built"): "Edit 2_db/build_db.py, then run: make db",
+    (2, "stale"): "Inputs have changed. Rebuild with: make db",
+    (2, "partial"): "Fix build_db.py and rebuild with: make db",
+    (3, "empty"): "Create analysis subfolders in 3_analyses/. See example_analysis/ for the template.",
+    (3, "incomplete"): "Run analyses to generate results.json: make analyses",
+    (3, "partial"): "Fix or complete remaining analyses, then: make analyses",
+    (3, "stale"): "Analyses are out of date. Re-run them with: make analyses",
+    (4, "empty"): "Create a deliverable subfolder in 4_output/ from a template.",
+    (4, "partial"): "Render deliverables with: make outputs",
+    (4, "stale"): "Deliverables are out of date. Re-render with: make outputs",
+}
+
+
+# ── Main ─────────────────────────────────────────────────────────
+STAGES = [
+    ("Stage 0 — Plan", check_plan),
+    ("Stage 1 — Data", check_data),
+    ("Stage 2 — Database", check_db),
+    ("Stage 3 — Analyses", check_analyses),
+    ("Stage 4 — Output", check_output),
+]
+
+STATUS_DISPLAY = {
+    "complete": lambda: ok("Complete"),
+    "incomplete": lambda: fail("Incomplete"),
+    "partial": lambda: warn("Partial"),
+    "empty": lambda: dim("Empty"),
+    "not_built": lambda: dim("Not built"),
+    "missing": lambda: fail("Missing"),
+    "stale": lambda: warn("Stale"),
+}
+
+
+def collect(use_cache=True, timings=False):
+    """Run every stage check. Returns a JSON-serializable report.
+
+    With `timings`, the report also lists the slowest profiled steps of the
+    latest run of each stage (see pipeline/profiling.py).
+    """
+    index = StatusIndex(use_cache)
+    stages = []
+    current = None
+    for i, (label, check_fn) in enumerate(STAGES):
+        status, issues, details = check_fn(index)
+        stages.append({
+            "stage": i, "label": label, "status": status,
+            "issues": issues, "details": details,
+        })
+        if status not in ("complete", "empty") and current is None:
+            current = i
+    slowest = None
+    if timings:
+        from pipeline.profiling import TIMINGS_PATH, read_timings, summarize
+
+        slowest = index.cached(
+            "timings", [file_signature(TIMINGS_PATH)], lambda: summarize(read_timings())
+        )
+    index.save()
+    return {
+        "stages": stages,
+        "current_stage": current,
+        "next_action": (
+            NEXT_ACTIONS.get((current, stages[current]["status"]), "")
+            if current is not None else ""
+        ),
+        "complete": current is None,
+        **({"timings": slowest} if timings else {}),
+    }
+
+
+def print_timings(rows):
+    print(f"\n{bold('Slowest steps')} {dim('(latest profiled run of each stage)')}")
+    if not rows:
+        print(f"  {dim('No timings recorded. Run a stage with PROFILE=1 (e.g. make db PROFILE=1).')}")
+        return
+    width = max(len(f"{r['stage']} {r['step']}") for r in rows)
+    for r in rows:
+        label = f"{r['stage']} {r['step']}"
+        line = f"  {label:<{width}}  {r['seconds']:>8.2f}s"
+        if r["change"] is not None:
+            trend = f"{r['change']:+.0%} vs {r['previous']:.2f}s avg"
+            line += f"  {warn(trend) if r['change'] > 0.2 else dim(trend)}"
+        if r.get("peak_rss_mb"):
+            line += "  " + dim(f"peak {r['peak_rss_mb']:.0f} MB")
+        if r.get("worker_peak_rss_mb"):
+            line += "  " + dim(f"peak +{r.get('rss_growth_mb', 0):.0f} MB "
+                               f"(worker lifetime {r['worker_peak_rss_mb']:.0f} MB)")
+        if r.get("profile"):
+            line += f"  {dim(r['profile'])}"
+        print(line)
+
+
+def print_report(report):
+    print(f"\n{bold('Pipeline Status')}")
+    print("═" * 50)
+
+    for stage in report["stages"]:
+        status = stage["status"]
+        status_str = STATUS_DISPLAY.get(status, lambda: status)()
+
+        print(f"\n{bold(stage['label'] + ':')}  {status_str}")
+        for d in stage["details"]:
+            print(f"  {dim(d)}")
+        for issue in stage["issues"]:
+            print(f"  {fail(issue)}")
+
+    print("\n" + "─" * 50)
+
+    if report["complete"]:
+        print(ok("All stages complete!"))
+    else:
+        stage_name = STAGES[report["current_stage"]][0]
+        print(f"→ Current stage: {bold(stage_name)}")
+        if report["next_action"]:
+            print(f"  {report['next_action']}")
+
+    if "timings" in report:
+        print_timings(report["timings"])
+
+    print()
+
+
+FLAGS = ("--json", "--timings", "--no-cache")
+
+
+def _parse_args(argv):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if set(argv) <= set(FLAGS):
+        # The usual call: read the flags directly, as argparse imports gettext,
+        # locale and shutil (several ms of every `make status`)
+        from types import SimpleNamespace
+
+        return SimpleNamespace(**{f[2:].replace("-", "_"): f in argv for f in FLAGS})
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Show pipeline status and validation")
+    parser.add_argument(
+        "--json", action="store_true", help="print a machine-readable JSON report",
+    )
+    parser.add_argument(
+        "--timings", action="store_true",
+        help="also show the slowest profiled steps and their trend",
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true",
+        help=f"re-read and re-validate everything (ignore .pipeline_state/{STATE_FILE})",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    report = collect(use_cache=not args.no_cache, timings=args.timings)
+    if args.json:
+        import json
+
+        json.dump(report, sys.stdout, indent=2, ensure_ascii=False)
+        print()
+    else:
+        print_report(report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,190 @@
+# pipeline/views.py
+# Shared intermediate views: aggregates that several analyses build on,
+# computed once per database build and reused by all of them.
+#
+# Each view is a SELECT in 3_analyses/_views/<name>.sql, reading tables of
+# project.duckdb or other views. An analysis uses it by name:
+#
+#   3_analyses/_views/sales_by_month.sql
+#     SELECT region, date_trunc('month', day) AS month, SUM(amount) AS total
+#     FROM sales GROUP BY ALL
+#
+#   Analysis(query="SELECT * FROM sales_by_month WHERE region = 'EU'", ...)
+#
+# The first query naming a view materializes it to
+# .pipeline_state/views/<database>/<name>-<fingerprint>.parquet (one store
+# per database, e.g. project and project_sample); every later query, in
+# any worker or run, reads that file through a temporary view instead of
+# scanning the tables again. The fingerprint hashes the view's SQL, the build
+# fingerprints of the tables it names and the fingerprints of the views it
+# names, so a rebuild of one of those tables (or an edit of the SQL)
+# computes the view again; the files of older fingerprints are deleted.
+# Processes wanting the same view at once compute it once: the others wait
+# for the file (a lock per view).
+#
+# The analysis kit does this for its query. A plain run.py calls
+# use_views(con, sql) before running `sql` on its own connection. The runner
+# counts the tables read through views among the inputs of an analysis (see
+# pipeline/analyses.py).
+
+import re
+from contextlib import contextmanager
+from pathlib import Path
+
+from pipeline.sql import quote, sql_literal
+from pipeline.state import DB_PATH, ROOT, STATE_DIR, atomic_path, hash_text
+
+VIEWS_DIR = ROOT / "3_analyses" / "_views"
+STORE_DIR = STATE_DIR / "views"
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def discover_views(views_dir=VIEWS_DIR):
+    """Return {name: SQL} of the views declared in 3_analyses/_views/."""
+    views_dir = Path(views_dir)
+    if not views_dir.is_dir():
+        return {}
+    return {
+        p.stem: p.read_text().strip().rstrip(";")
+        for p in sorted(views_dir.glob("*.sql"))
+    }
+
+
+def _words(text):
+    """Lowercase words of `text`: DuckDB identifiers are case-insensitive."""
+    return {w.lower() for w in _WORD_RE.findall(text)}
+
+
+def referenced(sql, names):
+    """The names in `names` that appear as words in `sql`, in any case."""
+    found = _words(sql)
+    return sorted(n for n in names if n.lower() in found)
+
+
+def expand(text, views):
+    """Return (views named in `text`, directly or through other views,
+    lowercase words of `text` and of those views' SQL)."""
+    found = _words(text)
+    seen, todo = set(), referenced(text, views)
+    while todo:
+        name = todo.pop()
+        if name in seen:
+            continue
+        seen.add(name)
+        found |= _words(views[name])
+        todo.extend(sorted(set(referenced(views[name], views)) - seen))
+    return sorted(seen), found
+
+
+def view_fingerprints(views, table_fps):
+    """Fingerprint of every view: its SQL, the build fingerprints of the
+    tables it names and the fingerprints of the views it names."""
+    fps, visiting = {}, set()
+
+    def visit(name, path):
+        if name in fps:
+            return fps[name]
+        if name in visiting:
+            raise ValueError(f"View dependency cycle: {' → '.join(path + [name])}")
+        visiting.add(name)
+        sql = views[name]
+        deps = {v: visit(v, path + [name]) for v in referenced(sql, views) if v != name}
+        tables = {t: table_fps[t] for t in referenced(sql, table_fps)}
+        visiting.discard(name)
+        fps[name] = hash_text(" ".join(sql.split()), tables, deps)
+        return fps[name]
+
+    for name in views:
+        visit(name, [])
+    return fps
+
+
+def _table_fingerprints(db_path):
+    """{table: build fingerprint} of a database or Parquet export (None if unknown)."""
+    if Path(db_path).is_dir():
+        from pipeline.export import export_fingerprints
+
+        return export_fingerprints(db_path)
+    from pipeline.lineage import db_fingerprints
+
+    return db_fingerprints(db_path)
+
+
+@contextmanager
+def _lock(path):
+    """Hold an exclusive lock on `path` across processes."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        try:
+            import fcntl
+        except ImportError:  # Windows: no lock, a view may be computed twice
+            yield
+            return
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _materialize(con, store, name, sql, fingerprint):
+    """Write view `name` to `store` unless it is there; return its path."""
+    path = store / f"{name}-{fingerprint[:16]}.parquet"
+    if path.exists():
+        return path
+    with _lock(store / f"{name}.lock"):
+        if not path.exists():  # computed by another process meanwhile
+            with atomic_path(path) as tmp:
+                con.execute(f"COPY ({sql}) TO {sql_literal(str(tmp))} (FORMAT parquet)")
+            for old in store.glob(f"{name}-*.parquet"):
+                if old != path:
+                    old.unlink(missing_ok=True)
+    return path
+
+
+def use_views(con, sql, db_path=DB_PATH, views_dir=VIEWS_DIR):
+    """Make the views named in `sql` (and those they use) queryable on `con`,
+    materializing them first if needed. Returns the names of those views.
+
+    Each view becomes a temporary view of `con` over its Parquet file, so
+    call it on the connection (or cursor) that then runs `sql`.
+    """
+    views = discover_views(views_dir)
+    names, _ = expand(sql, views)
+    if not names:
+        return []
+    table_fps = _table_fingerprints(db_path)
+    clash = sorted(set(views) & set(table_fps or {}))
+    if clash:
+        raise ValueError(f"View name(s) also used by a table: {', '.join(clash)}")
+    fps = view_fingerprints(views, table_fps or {})
+    store = STORE_DIR / Path(db_path).stem
+    done = set()
+
+    def prepare(name):
+        if name in done:
+            return
+        for dep in referenced(views[name], views):
+            if dep != name:
+                prepare(dep)
+        if table_fps is None:  # no build fingerprints: nothing to key a stored copy on
+            body = views[name]
+        else:
+            path = _materialize(con, store, name, views[name], fps[name])
+            body = f"SELECT * FROM read_parquet({sql_literal(str(path))})"
+        con.execute(f"CREATE OR REPLACE TEMP VIEW {quote(name)} AS {body}")
+        done.add(name)
+
+    for name in names:
+        prepare(name)
+    return names
+
+
+def prune(views_dir=VIEWS_DIR):
+    """Delete the stored files of views that are no longer declared."""
+    declared = set(discover_views(views_dir))
+    for path in [*STORE_DIR.glob("*/*.parquet"), *STORE_DIR.glob("*/*.lock")]:
+        name = path.stem.rsplit("-", 1)[0] if path.suffix == ".parquet" else path.stem
+        if name not in declared:
+            path.unlink(missing_ok=True)
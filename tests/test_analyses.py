@@ -0,0 +1,27 @@
+# tests/test_analyses.py
+# The cache records of pipeline/analyses.py.
+
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from pipeline.analyses import cache_record, stale_reason  # noqa: E402
+
+
+def test_tables_are_matched_in_any_case(tmp_path):
+    folder = tmp_path / "upper"
+    folder.mkdir()
+    query = "SELECT COUNT(*) AS n FROM Customers"
+    (folder / "run.py").write_text(f"QUERY = {query!r}\n")
+    (folder / "results.json").write_text(json.dumps({
+        "query": query, "n_results": 1, "results": [{"n": 101}],
+        "description": "", "interpretation": "", "figures": [],
+    }))
+
+    record = cache_record("upper", {"customers": "v1", "orders": "v1"}, {}, tmp_path)
+    assert record["tables"] == {"customers": "v1"}
+    cache = {"upper": record}
+    assert stale_reason("upper", {"customers": "v2"}, cache, tmp_path) == (
+        "tables changed: customers"
+    )
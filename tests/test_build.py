@@ -0,0 +1,75 @@
+# tests/test_build.py
+# Dependency inference of pipeline/build.py.
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from pipeline.build import Build  # noqa: E402
+
+
+def deps(tmp_path, **tables):
+    build = Build(db_path=tmp_path / "db.duckdb", data_dir=tmp_path)
+    for name, sql in tables.items():
+        build.table(name, sql=sql)
+    build._resolve()
+    return {name: sorted(t.deps) for name, t in build.tables.items()}
+
+
+def test_tables_read_are_dependencies(tmp_path):
+    assert deps(
+        tmp_path,
+        sales="SELECT 1 AS k",
+        regions="SELECT 1 AS k",
+        report="""
+            WITH s AS (SELECT * FROM Sales)
+            SELECT * FROM s JOIN main.regions USING (k)
+            WHERE k IN (SELECT k FROM sales)
+        """,
+    )["report"] == ["regions", "sales"]
+
+
+def test_names_outside_table_references_are_not_dependencies(tmp_path):
+    assert deps(
+        tmp_path,
+        sales="SELECT 1 AS k",
+        region="SELECT 1 AS k",
+        report="""
+            -- built from sales
+            SELECT 'sales' AS source, k AS region FROM read_parquet('/x/region.parquet')
+        """,
+    )["report"] == []
+
+
+def test_cte_named_like_a_table_is_not_a_dependency(tmp_path):
+    assert deps(
+        tmp_path,
+        totals="SELECT 1 AS k",
+        report="WITH totals AS (SELECT 2 AS k) SELECT * FROM totals",
+    )["report"] == []
+
+
+def test_parts_directory_reads_listed_parts_only(tmp_path):
+    import json
+
+    import duckdb
+
+    trips = tmp_path / "trips"
+    trips.mkdir()
+    for part, n in (("part-a.parquet", 3), ("part-b.parquet", 5)):
+        duckdb.sql(f"COPY (SELECT range AS k FROM range({n})) TO '{trips / part}'")
+    (trips / "_parts.json").write_text(json.dumps({"chunks": {"a": {"part": "part-a.parquet"}}}))
+
+    build = Build(db_path=tmp_path / "db.duckdb", data_dir=tmp_path)
+    t = build.source("trips", "trips/")
+    assert duckdb.sql(f"SELECT count(*) FROM ({t.sql})").fetchone() == (3,)
+
+
+def test_parts_directory_without_parts_is_skipped_with_its_readers(tmp_path):
+    (tmp_path / "trips").mkdir()
+    build = Build(db_path=tmp_path / "db.duckdb", data_dir=tmp_path)
+    assert build.source("trips", "trips/") is None
+    build.table("monthly", sql="SELECT count(*) AS n FROM trips")
+    build.table("other", sql="SELECT 1 AS k")
+    assert [t.name for t in build._resolve()] == ["other"]
+    assert set(build.skipped) == {"trips", "monthly"}
@@ -0,0 +1,57 @@
+# tests/test_helpers.py
+# Aggregations of 4_output/helpers.py load_value()/load_values().
+
+import json
+import sys
+import warnings
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "4_output"))
+import helpers  # noqa: E402
+
+ROWS = [
+    {"k": "a", "v": None},
+    {"k": "b", "v": 2},
+    {"k": "c"},
+    {"k": "d", "v": 4},
+]
+
+
+@pytest.fixture
+def analysis(tmp_path, monkeypatch):
+    folder = tmp_path / "kpis"
+    folder.mkdir()
+    (folder / "results.json").write_text(json.dumps({
+        "query": "", "n_results": len(ROWS), "results": ROWS,
+        "description": "", "interpretation": "", "figures": [],
+    }))
+    monkeypatch.setattr(helpers, "ANALYSES_DIR", tmp_path)
+    helpers.clear_cache()
+    yield "kpis"
+    helpers.clear_cache()
+
+
+def test_first_and_count_keep_their_row_meaning(analysis):
+    assert helpers.load_value(analysis, "v") is None  # first row, null
+    assert helpers.load_value(analysis, "v", "count") == 3  # rows with the key
+    assert helpers.load_value(analysis, "v", "count_nonnull") == 2
+    assert helpers.load_value(analysis, "v", "count_null") == 2
+    assert helpers.load_value(analysis, "v", "size") == 4
+
+
+def test_value_aggregations_skip_nulls_with_a_warning(analysis):
+    with pytest.warns(UserWarning, match="2/4 rows"):
+        assert helpers.load_values(analysis, {"s": ("v", "sum"), "m": ("v", "max")}) == {
+            "s": 6, "m": 4,
+        }
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        assert helpers.load_value(analysis, "v", "count") == 3
+
+
+def test_values_are_computed_once_per_cached_analysis(analysis, monkeypatch):
+    assert helpers.load_value(analysis, "k", "nunique") == 4
+    monkeypatch.setattr(helpers, "_aggregate", None)  # any recomputation fails
+    assert helpers.load_value(analysis, "k", "nunique") == 4
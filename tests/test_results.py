@@ -0,0 +1,60 @@
+# tests/test_results.py
+# Streaming validation of results.json (pipeline/results.py).
+
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from pipeline.results import results_file_issues, scan_results  # noqa: E402
+
+ROWS = [
+    {"x": 12.5, "y": -3.25e-7, "z": 1e20, "n": -40, "ok": True, "s": "a,b]"},
+    {"x": 0.125, "y": 1.5e+3, "z": -0.0, "n": 7, "ok": False, "s": None},
+] * 20
+
+
+def _write(path, rows, indent=None):
+    path.write_text(json.dumps({
+        "query": "SELECT 1",
+        "n_results": len(rows),
+        "results": rows,
+        "description": "",
+        "interpretation": "",
+        "figures": [],
+        "ratio": 12.5,
+    }, indent=indent))
+
+
+@pytest.mark.parametrize("indent", [None, 2])
+def test_numbers_cut_at_any_chunk_boundary(tmp_path, indent):
+    path = tmp_path / "results.json"
+    _write(path, ROWS, indent)
+    for chunk_size in range(1, 65):
+        header, n_rows = scan_results(path, chunk_size=chunk_size)
+        assert n_rows == len(ROWS), chunk_size
+        assert header["ratio"] == 12.5, chunk_size
+
+
+def test_bare_float_rows(tmp_path):
+    path = tmp_path / "results.json"
+    rows = [i / 7 for i in range(200)] + [1e-5, 2.5e10, -12.0]
+    _write(path, rows)
+    for chunk_size in range(1, 33):
+        assert scan_results(path, chunk_size=chunk_size)[1] == len(rows), chunk_size
+
+
+def test_truncated_number_is_still_an_error(tmp_path):
+    path = tmp_path / "results.json"
+    path.write_text('{"query": "", "n_results": 1, "results": [12.')
+    for chunk_size in (1, 3, 1 << 20):
+        with pytest.raises(ValueError):
+            scan_results(path, chunk_size=chunk_size)
+
+
+def test_valid_file_has_no_issues(tmp_path):
+    path = tmp_path / "results.json"
+    _write(path, ROWS)
+    assert results_file_issues(path) == []
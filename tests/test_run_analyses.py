@@ -0,0 +1,123 @@
+# tests/test_run_analyses.py
+# The warm-worker runner (3_analyses/run_analyses.py).
+
+import importlib.util
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+spec = importlib.util.spec_from_file_location(
+    "run_analyses", ROOT / "3_analyses" / "run_analyses.py"
+)
+run_analyses = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(run_analyses)
+
+RUN_PY = """
+import helper_mod
+from pathlib import Path
+Path("out.txt").write_text(helper_mod.VALUE)
+"""
+
+
+def test_local_modules_are_not_shared_between_analyses(tmp_path):
+    for name, value in (("a_kit", "A"), ("b_plain", "B")):
+        folder = tmp_path / name
+        folder.mkdir()
+        (folder / "helper_mod.py").write_text(f"VALUE = {value!r}\n")
+        (folder / "run.py").write_text(RUN_PY)
+
+    for name in ("a_kit", "b_plain"):
+        result = run_analyses.run_analysis(name, analyses_dir=tmp_path)
+        assert result["code"] == 0, result["stderr"]
+
+    assert (tmp_path / "a_kit" / "out.txt").read_text() == "A"
+    assert (tmp_path / "b_plain" / "out.txt").read_text() == "B"
+    assert "helper_mod" not in sys.modules
+
+
+def test_local_module_shadows_an_already_loaded_one(tmp_path):
+    folder = tmp_path / "shadow"
+    folder.mkdir()
+    (folder / "helper_mod.py").write_text("VALUE = 'local'\n")
+    (folder / "run.py").write_text(RUN_PY)
+    outer = type(sys)("helper_mod")
+    outer.VALUE = "outer"
+    sys.modules["helper_mod"] = outer
+    try:
+        result = run_analyses.run_analysis("shadow", analyses_dir=tmp_path)
+        assert result["code"] == 0, result["stderr"]
+        assert (folder / "out.txt").read_text() == "local"
+        assert sys.modules["helper_mod"] is outer
+    finally:
+        del sys.modules["helper_mod"]
+
+
+def test_sample_run_leaves_full_outputs_in_place(tmp_path, monkeypatch):
+    from pipeline import state
+
+    monkeypatch.setattr(state, "SAMPLE", "1%")
+    folder = tmp_path / "plain"
+    (folder / "figures").mkdir(parents=True)
+    (folder / "helper_mod.py").write_text("VALUE = 'sample'\n")
+    (folder / "results.json").write_text("full")
+    (folder / "figures" / "chart.txt").write_text("full")
+    (folder / "run.py").write_text(RUN_PY + """
+Path("results.json").write_text(helper_mod.VALUE)
+Path("figures").mkdir(exist_ok=True)
+Path("figures/chart.txt").write_text(helper_mod.VALUE)
+""")
+
+    result = run_analyses.run_analysis("plain", analyses_dir=tmp_path)
+    assert result["code"] == 0, result["stderr"]
+
+    sample = folder / state.SAMPLE_DIR
+    assert state.output_dir(folder) == sample
+    assert state.output_dir(sample) == sample
+    assert state.output_dir(str(folder)) == str(sample)
+    assert (sample / "results.json").read_text() == "sample"
+    assert (sample / "figures" / "chart.txt").read_text() == "sample"
+    assert (folder / "results.json").read_text() == "full"
+    assert (folder / "figures" / "chart.txt").read_text() == "full"
+
+
+def schedule(monkeypatch, analyses, current=(), failing=()):
+    """Run run_all() over fake analyses in threads; return {name: result}."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    def fake_run(name, isolated=False):
+        code = 1 if name in failing else 0
+        return {"name": name, "code": code, "seconds": 0.0, "stdout": "", "stderr": ""}
+
+    monkeypatch.setattr(run_analyses, "ProcessPoolExecutor", ThreadPoolExecutor)
+    monkeypatch.setattr(run_analyses, "_init_worker", lambda isolated: None)
+    monkeypatch.setattr(run_analyses, "run_analysis", fake_run)
+    monkeypatch.setattr(run_analyses, "db_fingerprints", lambda db: {})
+    monkeypatch.setattr(run_analyses, "read_state", lambda name, default: {})
+    monkeypatch.setattr(run_analyses, "write_state", lambda name, data: None)
+    monkeypatch.setattr(
+        run_analyses, "stale_reason",
+        lambda name, fingerprints, cache: None if name in current else "no results.json",
+    )
+    return {r["name"]: r for r in run_analyses.run_all(analyses, jobs=3)}
+
+
+def test_dependents_of_an_up_to_date_analysis_run(monkeypatch):
+    results = schedule(
+        monkeypatch, {"plain": ["region_totals"], "region_totals": []}, current={"region_totals"},
+    )
+    assert results["region_totals"].get("cached")
+    assert results["plain"]["code"] == 0 and not results["plain"].get("cached")
+
+
+def test_failures_skip_dependents_two_levels_down(monkeypatch):
+    results = schedule(
+        monkeypatch,
+        {"a_fail": [], "m_dep": ["z_dep", "b_ok"], "z_dep": ["a_fail"], "b_ok": []},
+        failing={"a_fail"},
+    )
+    assert results["a_fail"]["code"] == 1
+    assert results["z_dep"]["code"] is None
+    assert results["m_dep"]["code"] is None
+    assert results["m_dep"]["stderr"] == "skipped: dependency failed (z_dep)"
+    assert results["b_ok"]["code"] == 0